@@ -0,0 +1,418 @@
+"""Rule based alerts, evaluated on the jobs and servers that changed between polls
+
+Rules are compiled into predicates once. On every poll the engine only evaluates the rules against the jobs and servers a
+:meth:`JobCatalogue.refresh` or :meth:`ServerInventory.refresh_servers` reported as changed, and keeps one counter per farm
+rule that the same changes move up or down. Rules that need a condition to hold for a while, e.g. a job that made no
+progress for ten minutes, put a deadline on a heap instead of being re-evaluated until then, since a stalled job is exactly
+the one that stops showing up as changed.
+
+    >>> engine = AlertEngine([
+    ...     StallRule('stalled', seconds = 600),
+    ...     FarmRule('nodes offline', 'server', {'state': ('in', offline_states)}, ratio_above = 0.05),
+    ...     Rule('failing', 'job', {'job.info.user': 'alice', failed_servers: ('>=', 3)}),
+    ... ], [FileSink('alerts.jsonl'), CallbackSink(print)])
+    >>> engine.update_jobs(catalogue, catalogue.refresh())
+    >>> engine.update_servers(inventory, inventory.refresh_servers())
+
+Each alert is sent once when it fires and once when it resolves, conditions have to hold for `for_seconds` before they fire.
+"""
+import collections
+import heapq
+import logging
+import operator
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+
+import BackburnerDataClasses as BDC
+import Serialisers
+
+ALERT_FIRING = 'firing'
+ALERT_RESOLVED = 'resolved'
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, expected: value in expected,
+    'not in': lambda value, expected: value not in expected,
+}
+
+def failed_servers(record):
+    """Returns the number of servers a job failed on, for use in conditions"""
+    return sum(1 for server in record.job.servers if server.rt_failed)
+
+def _compile_test(expected):
+    if callable(expected):
+        return expected
+    if isinstance(expected, tuple):
+        compare, value = OPERATORS[expected[0]], expected[1]
+        return lambda actual: compare(actual, value)
+    return lambda actual: actual == expected
+
+def compile_condition(condition):
+    """Compile a condition into a predicate taking a :obj:`JobRecord` or :obj:`ServerRecord`
+
+    Args:
+        condition: A callable, which is returned as it is, `None` matching everything, or a :obj:`dict` whose items all have
+            to match. Keys are dotted attribute paths such as `'job.info.user'` or callables taking the record, values are
+            expected values, `(operator, value)` tuples with an operator from :obj:`OPERATORS`, or callables taking the
+            attribute value
+
+    Returns:
+        A callable returning a bool
+
+    """
+    if condition is None:
+        return lambda record: True
+    if callable(condition):
+        return condition
+
+    tests = [(key if callable(key) else operator.attrgetter(key), _compile_test(expected)) for key, expected in condition.items()]
+    if len(tests) == 1:
+        (get, test), = tests
+        return lambda record: bool(test(get(record)))
+
+    def predicate(record):
+        for get, test in tests:
+            if not test(get(record)):
+                return False
+        return True
+    return predicate
+
+@dataclass
+class Alert:
+    """Notification sent to the sinks
+
+    Attributes:
+        rule (str): Name of the rule
+        key: Handle of the job or server, `None` for farm rules
+        status (str): :obj:`ALERT_FIRING` or :obj:`ALERT_RESOLVED`
+        severity (str)
+        message (str)
+        since (float): Time the condition started to hold, as returned by `time.time()`
+        time (float): Time the alert was raised
+
+    """
+    rule: str
+    key: object
+    status: str
+    severity: str
+    message: str
+    since: float
+    time: float
+
+class Rule:
+    """Alert on every job or server matching a condition
+
+    Attributes:
+        name (str): Unique name of the rule
+        kind (str): `'job'` or `'server'`
+        predicate: The compiled condition, see :func:`compile_condition`
+        for_seconds (float): Seconds the condition has to hold before the alert fires
+        severity (str)
+        message: Format string with the fields `rule`, `kind`, `key` and `record`, or a callable taking the record
+        resolved_message: Like `message`, for the alert sent when the condition cleared
+
+    """
+
+    def __init__(self, name, kind, condition = None, for_seconds = 0.0, severity = 'warning', message = None, resolved_message = None):
+        if kind not in ('job', 'server'):
+            raise ValueError(f'Unknown rule kind {kind!r}')
+        self.name = name
+        self.kind = kind
+        self.predicate = compile_condition(condition)
+        self.for_seconds = for_seconds
+        self.severity = severity
+        self.message = message or '{rule}: {kind} {key}'
+        self.resolved_message = resolved_message or '{rule}: {kind} {key} cleared'
+
+    def progress(self, record):
+        """Returns a value that restarts `for_seconds` whenever it changes, `None` for rules that do not track progress"""
+        return None
+
+    def format(self, key, record, resolved = False):
+        message = self.resolved_message if resolved else self.message
+        if callable(message):
+            return message(record)
+        return message.format(rule = self.name, kind = self.kind, key = key, record = record)
+
+class StallRule(Rule):
+    """Alert on jobs that matched a condition but did not complete a task for `seconds`
+
+    By default active jobs are watched, the alert resolves as soon as the job progresses.
+    """
+
+    def __init__(self, name, seconds = 600.0, condition = None, severity = 'warning', message = None, resolved_message = None):
+        if condition is None:
+            condition = {'state': BDC.JOBSTATE_ACTIVE}
+        super().__init__(name, 'job', condition, seconds, severity, message or '{rule}: job {key} made no progress',
+                         resolved_message or '{rule}: job {key} is progressing again')
+
+    def progress(self, record):
+        return record.job.info.tasks_completed
+
+class FarmRule:
+    """Alert when too many jobs or servers match a condition
+
+    The matching objects are counted incrementally from the changes of each poll.
+
+    Attributes:
+        name (str): Unique name of the rule
+        kind (str): `'job'` or `'server'`
+        predicate: The compiled condition, see :func:`compile_condition`
+        above (int): Fire when more objects match, or `None`
+        ratio_above (float): Fire when a larger fraction of the objects matches, or `None`
+        for_seconds (float): Seconds the threshold has to be exceeded before the alert fires
+        severity (str)
+        message (str): Format string with the fields `rule`, `kind`, `count` and `total`
+        resolved_message (str): Like `message`, for the alert sent when the count dropped below the threshold
+
+    """
+
+    def __init__(self, name, kind, condition = None, above = None, ratio_above = None, for_seconds = 0.0, severity = 'warning', message = None,
+                 resolved_message = None):
+        if kind not in ('job', 'server'):
+            raise ValueError(f'Unknown rule kind {kind!r}')
+        if above is None and ratio_above is None:
+            raise ValueError('Farm rules need a threshold')
+        self.name = name
+        self.kind = kind
+        self.predicate = compile_condition(condition)
+        self.above = above
+        self.ratio_above = ratio_above
+        self.for_seconds = for_seconds
+        self.severity = severity
+        self.message = message or '{rule}: {count} of {total} {kind}s'
+        self.resolved_message = resolved_message or '{rule}: cleared, {count} of {total} {kind}s'
+
+    def exceeded(self, count, total):
+        if self.above is not None and count > self.above:
+            return True
+        return self.ratio_above is not None and total > 0 and count / total > self.ratio_above
+
+class _State:
+    """Evaluation state of one rule for one object, or for the farm"""
+
+    def __init__(self, since, progress, message):
+        self.since = since
+        self.progress = progress
+        self.message = message
+        self.fired = False
+
+class CallbackSink:
+    """Sends alerts to a callable"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def send(self, alert):
+        self.callback(alert)
+
+class FileSink:
+    """Appends alerts to a file as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock, open(self.path, 'a', encoding = 'utf-8') as stream:
+            stream.write(Serialisers.dumps(alert) + '\n')
+
+class WebhookSink:
+    """Posts alerts as JSON to a URL
+
+    Attributes:
+        url (str)
+        timeout (float): Seconds to wait for the response
+        headers (dict): Additional request headers
+
+    """
+
+    def __init__(self, url, timeout = 5.0, headers = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def send(self, alert):
+        request = urllib.request.Request(self.url, Serialisers.dumps(alert).encode('utf-8'),
+                                         {'Content-Type': 'application/json', **self.headers}, method = 'POST')
+        with urllib.request.urlopen(request, timeout = self.timeout) as response:
+            response.read()
+
+class AlertEngine:
+    """Evaluates alert rules incrementally and delivers their alerts to sinks
+
+    Alerts are deduplicated per rule and object: an alert is sent when it fires and when it resolves, not on every poll in
+    between, unless `repeat_interval` is set. A sink that raises does not keep the other sinks from receiving the alert.
+    Alerts are delivered in order after the rules were evaluated, so a slow sink such as a :obj:`WebhookSink` does not hold
+    up other threads evaluating the rules or calling :meth:`firing`.
+
+    Attributes:
+        rules (list): :obj:`Rule` and :obj:`FarmRule` objects
+        sinks (list): Objects with a `send(alert)` method, e.g. :obj:`FileSink`
+        repeat_interval (float): Seconds after which a firing alert is sent again, or `None`
+
+    """
+
+    def __init__(self, rules, sinks = (), repeat_interval = None):
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise ValueError('Rule names must be unique')
+        self.rules = list(rules)
+        self.sinks = list(sinks)
+        self.repeat_interval = repeat_interval
+        self._object_rules = {kind: [rule for rule in self.rules if isinstance(rule, Rule) and rule.kind == kind] for kind in ('job', 'server')}
+        self._farm_rules = {kind: [rule for rule in self.rules if isinstance(rule, FarmRule) and rule.kind == kind] for kind in ('job', 'server')}
+        self._states = {}
+        # Keys of the objects matching each farm rule
+        self._matching = {rule.name: set() for rule in self.rules if isinstance(rule, FarmRule)}
+        self._rules_by_name = {rule.name: rule for rule in self.rules}
+        self._timers = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # Alerts raised while the lock is held, delivered by _deliver once it is released
+        self._pending = collections.deque()
+        self._deliver_lock = threading.Lock()
+
+    def _send(self, alert):
+        self._pending.append(alert)
+
+    def _deliver(self):
+        """Send the pending alerts to the sinks, must be called without the engine lock held"""
+        with self._deliver_lock:
+            while self._pending:
+                alert = self._pending.popleft()
+                for sink in self.sinks:
+                    try:
+                        sink.send(alert)
+                    except Exception as error:
+                        logging.warning(f'Alert {alert.rule} for {alert.key} could not be sent to {type(sink).__name__}: {error}')
+
+    def _fire(self, rule, key, state, now):
+        state.fired = True
+        self._send(Alert(rule.name, key, ALERT_FIRING, rule.severity, state.message, state.since, now))
+        if self.repeat_interval:
+            self._schedule(now + self.repeat_interval, rule, key, state)
+
+    def _resolve(self, rule, key, state, message, now):
+        if state.fired:
+            self._send(Alert(rule.name, key, ALERT_RESOLVED, rule.severity, message, state.since, now))
+
+    def _schedule(self, deadline, rule, key, state):
+        self._sequence += 1
+        heapq.heappush(self._timers, (deadline, self._sequence, rule.name, key, state))
+
+    def _start(self, rule, key, state, now):
+        """The condition of `rule` started to hold for `key`, fire now or once it held for `for_seconds`"""
+        if rule.for_seconds <= 0:
+            self._fire(rule, key, state, now)
+        else:
+            self._schedule(state.since + rule.for_seconds, rule, key, state)
+
+    def _evaluate(self, rule, key, record, now):
+        state_key = (rule.name, key)
+        state = self._states.get(state_key)
+        if record is None or not rule.predicate(record):
+            if state is not None:
+                del self._states[state_key]
+                self._resolve(rule, key, state, rule.format(key, record, True) if record is not None else f'{rule.name}: {rule.kind} {key} removed', now)
+            return
+
+        progress = rule.progress(record)
+        if state is not None and progress != state.progress:
+            # The object progressed, so a stall it was alerted for is over and the clock starts again
+            del self._states[state_key]
+            self._resolve(rule, key, state, rule.format(key, record, True), now)
+            state = None
+        message = rule.format(key, record)
+        if state is None:
+            state = self._states[state_key] = _State(now, progress, message)
+            self._start(rule, key, state, now)
+        else:
+            state.message = message
+
+    def _count(self, rule, key, record):
+        if record is not None and rule.predicate(record):
+            self._matching[rule.name].add(key)
+        else:
+            self._matching[rule.name].discard(key)
+
+    def _evaluate_farm(self, rule, total, now):
+        count = len(self._matching[rule.name])
+        state_key = (rule.name, None)
+        state = self._states.get(state_key)
+        if not rule.exceeded(count, total):
+            if state is not None:
+                del self._states[state_key]
+                self._resolve(rule, None, state, rule.resolved_message.format(rule = rule.name, kind = rule.kind, count = count, total = total), now)
+            return
+        message = rule.message.format(rule = rule.name, kind = rule.kind, count = count, total = total)
+        if state is None:
+            state = self._states[state_key] = _State(now, None, message)
+            self._start(rule, None, state, now)
+        else:
+            state.message = message
+
+    def _update(self, kind, table, changes, now):
+        now = time.time() if now is None else now
+        with self._lock:
+            object_rules, farm_rules = self._object_rules[kind], self._farm_rules[kind]
+            keys = list(table.rows) if changes is None else changes.added + changes.updated + changes.removed
+            for key in keys:
+                record = table.get(key)
+                for rule in object_rules:
+                    self._evaluate(rule, key, record, now)
+                for rule in farm_rules:
+                    self._count(rule, key, record)
+            for rule in farm_rules:
+                self._evaluate_farm(rule, len(table), now)
+            self._tick(now)
+        self._deliver()
+
+    def update_jobs(self, catalogue, changes, now = None):
+        """Evaluate the job rules for the jobs a :meth:`JobCatalogue.refresh` reported as changed
+
+        Args:
+            catalogue (:obj:`JobCatalogue`)
+            changes (:obj:`TableChanges`): The changes returned by the refresh, or `None` to evaluate every job, e.g. when
+                the engine is created for a catalogue that was already refreshed
+            now (float): Time of the refresh, as returned by `time.time()`. Defaults to the current time
+
+        """
+        self._update('job', catalogue.jobs, changes, now)
+
+    def update_servers(self, inventory, changes, now = None):
+        """Evaluate the server rules for the servers a :meth:`ServerInventory.refresh_servers` reported as changed
+
+        Args:
+            inventory (:obj:`ServerInventory`)
+            changes (:obj:`TableChanges`): The changes returned by the refresh, or `None` to evaluate every server
+            now (float): Time of the refresh, as returned by `time.time()`. Defaults to the current time
+
+        """
+        self._update('server', inventory.servers, changes, now)
+
+    def _tick(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            _, _, name, key, state = heapq.heappop(self._timers)
+            # Timers of conditions that stopped holding or restarted since are skipped
+            if self._states.get((name, key)) is state and (not state.fired or self.repeat_interval):
+                self._fire(self._rules_by_name[name], key, state, now)
+
+    def tick(self, now = None):
+        """Fire the alerts whose conditions have held long enough, call it between polls for timely stall alerts"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._tick(now)
+        self._deliver()
+
+    def firing(self):
+        """Returns the `(rule name, key)` pairs of the alerts currently firing"""
+        with self._lock:
+            return [state_key for state_key, state in self._states.items() if state.fired]
@@ -1,6 +1,18 @@
 from dataclasses import dataclass
 import ipaddress
 
+# Job states as reported by 'get joblist', 'get jobhlist' and 'get jobstate'. Suspended has not been confirmed yet.
+JOBSTATE_COMPLETED = 0
+JOBSTATE_NOT_STARTED = 1
+JOBSTATE_ACTIVE = 2
+JOBSTATE_SUSPENDED = 3
+
+# Task states as reported by 'get tasklist'. These values have not been confirmed yet.
+TASKSTATE_WAITING = 0
+TASKSTATE_ACTIVE = 1
+TASKSTATE_COMPLETED = 2
+TASKSTATE_ERROR = 3
+
 @dataclass
 class NetworkStatus:
     """Backburner Manager network status
@@ -328,6 +340,26 @@ class Job:
     alerts: JobAlerts
     servers: list
 
+@dataclass
+class Task:
+    """Task of a job, usually one frame
+
+    Attributes:
+        task_id (int): Index of the task within the job, starting at 0
+        name (str)
+        state (int): One of the `TASKSTATE_*` values
+        server (str): Handle of the server the task is or was assigned to, empty if none
+        start_time (str)
+        end_time (str)
+
+    """
+    task_id: int
+    name: str
+    state: int
+    server: str
+    start_time: str
+    end_time: str
+
 @dataclass
 class ServerSchedule:
     """Server schedule
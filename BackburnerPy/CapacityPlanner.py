@@ -0,0 +1,322 @@
+"""Farm capacity per hour of the week, computed from the servers' schedules
+
+All servers of the farm are numbered, and every set of servers is a Python integer with one bit per server. The planner
+keeps one such integer per hour of the week with the servers whose :obj:`ServerSchedule` allows them to render, and stores
+numeric server properties bit-sliced: plane `b` of the cores holds the servers whose `num_cpus` has bit `b` set. Counting
+the cores available in an hour then takes one AND and one popcount per plane for the whole farm, instead of a loop over
+every server:
+
+    cores = sum(popcount(available & plane) << b for b, plane in enumerate(core_planes))
+
+Hours of the week count from Sunday 00:00, the first day of :obj:`ServerSchedule`.
+"""
+import datetime
+import logging
+from dataclasses import fields
+
+import BackburnerDataClasses as BDC
+
+HOURS_PER_WEEK = 168
+
+DAYS = tuple(field.name for field in fields(BDC.ServerSchedule))
+
+# Number of set bits of an int, int.bit_count was added in Python 3.10
+popcount = getattr(int, 'bit_count', None) or (lambda value: bin(value).count('1'))
+
+def _reverse_day(value):
+    """Reverse the 24 bits of a day, so that bit `h` is hour `h`"""
+    return int(f'{value & 0xFFFFFF:024b}'[::-1], 2)
+
+def week_mask(schedule):
+    """Convert a :obj:`ServerSchedule` to a 168 bit integer in which bit `h` is set if the server may render in hour `h` of the week
+
+    Within each day's 24 bit value the most significant bit is 00:00, see :obj:`ServerSchedule`.
+    """
+    mask = 0
+    for day, name in enumerate(DAYS):
+        mask |= _reverse_day(getattr(schedule, name)) << (day * 24)
+    return mask
+
+def schedule_from_mask(mask):
+    """Convert a 168 bit week mask back to a :obj:`ServerSchedule`"""
+    days = []
+    for day in range(7):
+        value = 0
+        for hour in range(24):
+            if mask >> (day * 24 + hour) & 1:
+                value |= 1 << (23 - hour)
+        days.append(value)
+    return BDC.ServerSchedule(*days)
+
+def hour_of_week(moment):
+    """Returns the hour of the week of a :obj:`datetime.datetime`, 0 being Sunday 00:00"""
+    return (moment.weekday() + 1) % 7 * 24 + moment.hour
+
+def reference_task_seconds(job, servers):
+    """Returns the observed seconds per task of a :obj:`Job`, scaled to a server with a `perf_index` of 1.0
+
+    The `task_time` of every server that rendered tasks of the job is weighted by its `task_total`.
+
+    Args:
+        job (:obj:`Job`)
+        servers (dict): Mapping of server handle to :obj:`Server`, for the `perf_index` of each server
+
+    Returns:
+        float, or `None` if no task has been rendered yet
+
+    """
+    weighted, tasks = 0.0, 0
+    for server in job.servers:
+        details = servers.get(server.handle)
+        if details is None or server.task_total <= 0 or server.task_time <= 0:
+            continue
+        weighted += server.task_time * details.perf_index * server.task_total
+        tasks += server.task_total
+    return weighted / tasks if tasks else None
+
+def _bit_planes(values):
+    """Slice non-negative integers per bit: plane `b` has bit `i` set if bit `b` of `values[i]` is set"""
+    planes = []
+    for index, value in enumerate(values):
+        bit = 0
+        while value:
+            if value & 1:
+                while len(planes) <= bit:
+                    planes.append(0)
+                planes[bit] |= 1 << index
+            value >>= 1
+            bit += 1
+    return planes
+
+def _weighted_count(servers, planes):
+    """Returns the sum of the bit-sliced values of the servers in `servers`"""
+    return sum(popcount(servers & plane) << bit for bit, plane in enumerate(planes))
+
+class CapacityPlanner:
+    """Capacity of a farm for every hour of the week, with "what if" schedule changes
+
+    Backburner renders one task per server at a time, so a server's throughput on a job is proportional to its
+    `perf_index`. Render capacity is therefore the sum of the available servers' `perf_index`, which is quantised to
+    1 / `perf_scale` to be bit-sliced. Core counts and memory are available as well, e.g. for multi-threaded renderers.
+
+    Server subsets are passed as bitsets built by :meth:`mask`, e.g. the servers assigned to a job.
+
+    Example:
+
+        >>> planner = CapacityPlanner.from_inventory(inventory)
+        >>> planner.cores()[hour_of_week(datetime.datetime.now())]
+        >>> nights_only = planner.with_schedules({'00e04c68000a': BDC.ServerSchedule(*[0xFE003F] * 7)})
+        >>> nights_only.finish_time(remaining_tasks = 2000, task_seconds = 180)
+
+    Attributes:
+        handles (:obj:`list` of str): Server handles in bit order
+        availability (:obj:`list` of int): For every hour of the week the bitset of servers allowed to render
+        perf_scale (int): Units per 1.0 of `perf_index` used for quantisation
+
+    """
+
+    def __init__(self, servers, perf_scale = 100):
+        """Build the planner from a :obj:`dict` mapping server handles to :obj:`Server` data class objects"""
+        self.handles = list(servers)
+        self.index = {handle: index for index, handle in enumerate(self.handles)}
+        self.perf_scale = perf_scale
+        self.week_masks = [week_mask(server.server_schedule) for server in servers.values()]
+        self.all = (1 << len(self.handles)) - 1
+
+        self._core_planes = _bit_planes([max(0, server.hw_info.num_cpus) for server in servers.values()])
+        self._memory_planes = _bit_planes([max(0, server.hw_info.total_memory) for server in servers.values()])
+        self._perf_planes = _bit_planes([max(0, round(server.perf_index * perf_scale)) for server in servers.values()])
+        self._servers = servers
+        self.availability = self._transpose(self.week_masks)
+        self._cache = {}
+        logging.debug(f'Capacity planner built for {len(self.handles)} servers')
+
+    @classmethod
+    def from_inventory(cls, inventory, perf_scale = 100):
+        """Build the planner from the servers of a :obj:`ServerInventory`"""
+        return cls({handle: record.server for handle, record in inventory.servers.rows.items()}, perf_scale)
+
+    @staticmethod
+    def _transpose(week_masks):
+        """Turn one week mask per server into one server bitset per hour"""
+        # Servers are grouped by the schedule of each day first, farms only use a handful of them
+        availability = [0] * HOURS_PER_WEEK
+        for day in range(7):
+            groups = {}
+            shift = day * 24
+            for index, mask in enumerate(week_masks):
+                hours = mask >> shift & 0xFFFFFF
+                if hours:
+                    groups[hours] = groups.get(hours, 0) | 1 << index
+            for hours, servers in groups.items():
+                hour = shift
+                while hours:
+                    if hours & 1:
+                        availability[hour] |= servers
+                    hours >>= 1
+                    hour += 1
+        return availability
+
+    def mask(self, handles = None, predicate = None):
+        """Returns the bitset of the servers in `handles` and/or for whose :obj:`Server` `predicate` returns `True`
+
+        Unknown handles are ignored. Without arguments all servers are included.
+        """
+        if handles is None:
+            selected = self.all
+        else:
+            selected = 0
+            for handle in handles:
+                index = self.index.get(handle)
+                if index is not None:
+                    selected |= 1 << index
+        if predicate is not None:
+            for handle, server in self._servers.items():
+                index = self.index[handle]
+                if selected >> index & 1 and not predicate(server):
+                    selected &= ~(1 << index)
+        return selected
+
+    def job_mask(self, job):
+        """Returns the bitset of the servers assigned to a :obj:`Job`, or of all servers if none are listed"""
+        if not job.servers:
+            return self.all
+        return self.mask(server.handle for server in job.servers)
+
+    def servers(self, selected):
+        """Returns the handles of the servers in a bitset"""
+        return [handle for index, handle in enumerate(self.handles) if selected >> index & 1]
+
+    def available(self, hour, selected = None):
+        """Returns the bitset of servers allowed to render in `hour` of the week"""
+        available = self.availability[hour % HOURS_PER_WEEK]
+        return available if selected is None else available & selected
+
+    def _per_hour(self, kind, planes, selected):
+        key = (kind, self.all if selected is None else selected)
+        result = self._cache.get(key)
+        if result is None:
+            selected = key[1]
+            result = self._cache[key] = [_weighted_count(available & selected, planes) for available in self.availability]
+        return result
+
+    def server_counts(self, selected = None):
+        """Returns the number of available servers for every hour of the week"""
+        key = ('servers', self.all if selected is None else selected)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._cache[key] = [popcount(available & key[1]) for available in self.availability]
+        return result
+
+    def cores(self, selected = None):
+        """Returns the number of available cores for every hour of the week"""
+        return self._per_hour('cores', self._core_planes, selected)
+
+    def memory(self, selected = None):
+        """Returns the total memory of the available servers for every hour of the week"""
+        return self._per_hour('memory', self._memory_planes, selected)
+
+    def capacity(self, selected = None):
+        """Returns the render capacity, the sum of the available servers' `perf_index`, for every hour of the week"""
+        return [units / self.perf_scale for units in self._per_hour('perf', self._perf_planes, selected)]
+
+    def with_schedules(self, schedules):
+        """What if: returns a new planner in which some servers follow other schedules
+
+        Only the changed servers' bits are updated, the other data is shared with this planner.
+
+        Args:
+            schedules (dict): Mapping of server handle to a :obj:`ServerSchedule` or a week mask (int). A mask of 0 takes
+                the server out of the farm
+
+        """
+        planner = object.__new__(CapacityPlanner)
+        planner.__dict__.update(self.__dict__)
+        planner.week_masks = list(self.week_masks)
+        planner.availability = list(self.availability)
+        planner._cache = {}
+
+        for handle, schedule in schedules.items():
+            index = self.index[handle]
+            new_mask = schedule if isinstance(schedule, int) else week_mask(schedule)
+            changed = planner.week_masks[index] ^ new_mask
+            bit = 1 << index
+            hour = 0
+            while changed:
+                if changed & 1:
+                    planner.availability[hour] ^= bit
+                changed >>= 1
+                hour += 1
+            planner.week_masks[index] = new_mask
+        return planner
+
+    def hours_to_finish(self, remaining_tasks, task_seconds, start = None, selected = None, share = 1.0, max_weeks = 52):
+        """Estimate how many hours a job needs to render its remaining tasks
+
+        Args:
+            remaining_tasks (int)
+            task_seconds (float): Average seconds per task on a server with a `perf_index` of 1.0
+            start (:obj:`datetime.datetime`): When the job continues, defaults to now
+            selected (int): Bitset of the servers the job may use, see :meth:`job_mask`
+            share (float): Fraction of the available servers the job gets, e.g. 0.5 when it shares the farm with another job
+            max_weeks (int): Give up beyond this many weeks
+
+        Returns:
+            Hours from `start` (float), or `None` if the job cannot finish within `max_weeks`
+
+        """
+        if remaining_tasks <= 0:
+            return 0.0
+        start = start or datetime.datetime.now()
+        tasks_per_hour = [capacity * share * 3600.0 / task_seconds for capacity in self.capacity(selected)]
+        weekly = sum(tasks_per_hour)
+        if weekly <= 0:
+            return None
+
+        hour = hour_of_week(start)
+        fraction = 1.0 - (start.minute * 60 + start.second) / 3600.0
+        remaining = float(remaining_tasks)
+        elapsed = 0.0
+
+        # Partial first hour
+        done = tasks_per_hour[hour] * fraction
+        if done >= remaining:
+            return remaining / tasks_per_hour[hour]
+        remaining -= done
+        elapsed += fraction
+        hour = (hour + 1) % HOURS_PER_WEEK
+
+        # Whole weeks at once, then hour by hour
+        weeks = int(remaining // weekly)
+        if remaining == weeks * weekly:
+            weeks -= 1
+        if weeks >= max_weeks:
+            return None
+        remaining -= weeks * weekly
+        elapsed += weeks * HOURS_PER_WEEK
+        while True:
+            rate = tasks_per_hour[hour]
+            if rate >= remaining:
+                return elapsed + remaining / rate
+            remaining -= rate
+            elapsed += 1.0
+            hour = (hour + 1) % HOURS_PER_WEEK
+
+    def finish_time(self, remaining_tasks, task_seconds, start = None, selected = None, share = 1.0, max_weeks = 52):
+        """Like :meth:`hours_to_finish`, but returns the estimated completion as :obj:`datetime.datetime`, or `None`"""
+        start = start or datetime.datetime.now()
+        hours = self.hours_to_finish(remaining_tasks, task_seconds, start, selected, share, max_weeks)
+        return None if hours is None else start + datetime.timedelta(hours = hours)
+
+    def job_finish_time(self, job, start = None, share = 1.0):
+        """Estimate when a :obj:`Job` finishes on its assigned servers, using :func:`reference_task_seconds`
+
+        Returns:
+            A :obj:`datetime.datetime`, or `None` if no task time is known yet or the job cannot finish within a year
+
+        """
+        task_seconds = reference_task_seconds(job, self._servers)
+        if task_seconds is None:
+            return None
+        remaining = job.info.number_tasks - job.info.tasks_completed
+        return self.finish_time(remaining, task_seconds, start, self.job_mask(job), share)
@@ -0,0 +1,222 @@
+"""Command line interface for BackburnerPy
+
+Run it with `python -m BackburnerPy` or `python BackburnerPy/Cli.py`, e.g.:
+
+    python -m BackburnerPy --manager 10.0.0.2 jobs --format jsonl
+    python -m BackburnerPy --manager 10.0.0.2:3234 set-state 1256275308 3
+    python -m BackburnerPy top
+
+The Manager address can also be set with the BACKBURNER_MANAGER environment variable. Only the modules a subcommand needs are
+imported, so one-shot queries start quickly.
+"""
+import os
+import sys
+
+DEFAULT_PORT = 3234
+
+FORMATS = ('text', 'tsv', 'jsonl', 'json')
+
+def _flatten(value, prefix = '', out = None):
+    """Flatten nested dicts into a single dict with dotted keys, lists are kept as JSON"""
+    if out is None:
+        out = {}
+    for key, item in value.items():
+        name = f'{prefix}{key}'
+        if isinstance(item, dict):
+            _flatten(item, name + '.', out)
+        else:
+            out[name] = item
+    return out
+
+def _rows(items):
+    from dataclasses import is_dataclass
+    from Serialisers import to_dict
+    for item in items:
+        yield to_dict(item) if is_dataclass(item) else item
+
+def _cell(value):
+    if isinstance(value, list):
+        import json
+        return json.dumps(value, separators = (',', ':'))
+    return str(value).replace('\t', ' ').replace('\n', ' ')
+
+def write_rows(items, output_format, stream = None):
+    """Write data class objects or dicts to `stream` in one of the `FORMATS`"""
+    stream = stream or sys.stdout
+    if output_format == 'json':
+        import json
+        json.dump(list(_rows(items)), stream, indent = 2)
+        stream.write('\n')
+        return
+    if output_format == 'jsonl':
+        from Serialisers import write_json_lines
+        write_json_lines(items, stream)
+        return
+
+    rows = [_flatten(row) for row in _rows(items)]
+    if not rows:
+        return
+    columns = list(rows[0])
+    table = [[_cell(row.get(column, '')) for column in columns] for row in rows]
+    if output_format == 'tsv':
+        stream.write('\t'.join(columns) + '\n')
+        for cells in table:
+            stream.write('\t'.join(cells) + '\n')
+        return
+
+    widths = [max(len(column), *(len(cells[index]) for cells in table)) for index, column in enumerate(columns)]
+    stream.write('  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip() + '\n')
+    for cells in table:
+        stream.write('  '.join(cell.ljust(width) for cell, width in zip(cells, widths)).rstrip() + '\n')
+
+def _connect(args):
+    import logging
+    from Monitor import Monitor
+
+    host, _, port = args.manager.partition(':')
+    monitor = Monitor(host, int(port) if port else args.port, logging.WARNING, args.timeout)
+    monitor.open_connection()
+    return monitor
+
+def command_info(monitor, args):
+    write_rows([monitor.get_manager_info()], args.format)
+
+def command_servers(monitor, args):
+    servers = monitor.get_server_list()
+    if args.details:
+        servers = [{'handle': item.handle, 'state': item.state, **_asdict(monitor.get_server(item.handle))} for item in servers]
+    write_rows(servers, args.format)
+
+def command_jobs(monitor, args):
+    jobs = monitor.get_job_list()
+    if args.details:
+        jobs = [{'handle': item.handle, 'state': item.state, **_asdict(monitor.get_job(str(item.handle)))} for item in jobs]
+    write_rows(jobs, args.format)
+
+def command_job(monitor, args):
+    write_rows([monitor.get_job(args.handle)], args.format)
+
+def command_archive(monitor, args):
+    write_rows(monitor.get_jobarchive(), args.format)
+
+def command_set_state(monitor, args):
+    from Monitor import ControllerError
+
+    try:
+        results = monitor.set_jobstates({args.handle: args.state}, skip_unchanged = False)
+    except ControllerError as error:
+        sys.stderr.write(f'backburnerpy: {error}\n')
+        return 1
+    failed = False
+    for handle, (code, message) in results.items():
+        failed = failed or code != 200
+        write_rows([{'handle': handle, 'code': code, 'message': message}], args.format)
+    return 1 if failed or not results else 0
+
+def command_top(monitor, args):
+    import time
+    import BackburnerDataClasses as BDC
+    from JobCatalogue import JobCatalogue
+    from Inventory import ServerInventory
+
+    catalogue = JobCatalogue(monitor)
+    inventory = ServerInventory(monitor)
+    previous = []
+    stream = sys.stdout
+    stream.write('\x1b[2J')
+    try:
+        while True:
+            catalogue.refresh(refetch_states = (BDC.JOBSTATE_ACTIVE,))
+            inventory.refresh_servers()
+            lines = _top_lines(catalogue, inventory, args.limit)
+
+            # Only rewrite the lines that changed since the previous frame
+            for number, line in enumerate(lines):
+                if number >= len(previous) or previous[number] != line:
+                    stream.write(f'\x1b[{number + 1};1H{line}\x1b[K')
+            for number in range(len(lines), len(previous)):
+                stream.write(f'\x1b[{number + 1};1H\x1b[K')
+            stream.write(f'\x1b[{len(lines) + 1};1H')
+            stream.flush()
+            previous = lines
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+def _top_lines(catalogue, inventory, limit):
+    import time
+    servers = inventory.servers.rows.values()
+    busy = sum(1 for record in servers if record.server.current_job)
+    lines = [f'backburner  {time.strftime("%H:%M:%S")}  jobs: {len(catalogue)}  active: {catalogue.count(active = True)}  '
+             f'servers: {len(inventory.servers)}  rendering: {busy}', '',
+             f'{"HANDLE":>12}  {"ST":>2}  {"PRI":>3}  {"USER":<12}  {"PROGRESS":>11}  NAME']
+    for record in catalogue.query(where = {'complete': False}, order_by = 'priority', limit = limit):
+        info = record.job.info
+        percent = 100.0 * info.tasks_completed / info.number_tasks if info.number_tasks else 0.0
+        lines.append(f'{record.handle:>12}  {record.state:>2}  {info.priority:>3}  {info.user[:12]:<12}  '
+                     f'{info.tasks_completed:>5}/{info.number_tasks:<5}  {info.name} ({percent:.0f}%)')
+    return lines
+
+def _asdict(item):
+    from Serialisers import to_dict
+    return to_dict(item)
+
+COMMANDS = {
+    'info': command_info,
+    'servers': command_servers,
+    'jobs': command_jobs,
+    'job': command_job,
+    'archive': command_archive,
+    'set-state': command_set_state,
+    'top': command_top,
+}
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog = 'backburnerpy', description = 'Query and control a Backburner Manager')
+    parser.add_argument('--manager', default = os.environ.get('BACKBURNER_MANAGER', '127.0.0.1'), help = 'Manager address as HOST or HOST:PORT (default: $BACKBURNER_MANAGER)')
+    parser.add_argument('--port', type = int, default = DEFAULT_PORT, help = f'Manager TCP port (default: {DEFAULT_PORT})')
+    parser.add_argument('--timeout', type = float, default = 30.0, help = 'Socket timeout in seconds')
+    parser.add_argument('--format', choices = FORMATS, default = 'text', help = 'Output format')
+    # --format is accepted after the subcommand as well, without overriding a value given before it
+    output = argparse.ArgumentParser(add_help = False)
+    output.add_argument('--format', choices = FORMATS, default = argparse.SUPPRESS, help = 'Output format')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    commands.add_parser('info', parents = [output], help = 'Show Manager information')
+    servers = commands.add_parser('servers', parents = [output], help = 'List servers')
+    servers.add_argument('--details', action = 'store_true', help = 'Fetch full information for every server')
+    jobs = commands.add_parser('jobs', parents = [output], help = 'List jobs')
+    jobs.add_argument('--details', action = 'store_true', help = 'Fetch full information for every job')
+    job = commands.add_parser('job', parents = [output], help = 'Show one job')
+    job.add_argument('handle', help = 'Job handle as decimal value')
+    commands.add_parser('archive', parents = [output], help = 'List archived jobs')
+    set_state = commands.add_parser('set-state', parents = [output], help = 'Set the state of a job')
+    set_state.add_argument('handle', type = int, help = 'Job handle as decimal value')
+    set_state.add_argument('state', type = int, help = 'Job state: 0 completed, 1 not started, 2 active, 3 suspended')
+    top = commands.add_parser('top', help = 'Live view of the queue')
+    top.add_argument('--interval', type = float, default = 2.0, help = 'Seconds between refreshes')
+    top.add_argument('--limit', type = int, default = 40, help = 'Number of jobs shown')
+    return parser
+
+def main(argv = None):
+    args = build_parser().parse_args(argv)
+    try:
+        monitor = _connect(args)
+    except OSError as error:
+        sys.stderr.write(f'backburnerpy: cannot connect to {args.manager}: {error}\n')
+        return 2
+
+    try:
+        return COMMANDS[args.command](monitor, args) or 0
+    except BrokenPipeError:
+        return 0
+    finally:
+        try:
+            monitor.close_connection()
+        except OSError:
+            pass
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+class CoalescingMonitor:
+    """Request coalescing layer over a :obj:`Monitor`
+
+    Concurrent calls of the same `get_*` method with the same arguments share a single request to the Manager and its decoded
+    result: the first caller performs the request and every caller that arrives while it is in flight waits for that result.
+    With a `freshness` window, callers arriving shortly after the request completed reuse the result as well.
+
+    Other attributes are passed through to the monitor; calling a `set_*`/`del_*` method clears the freshness cache. All
+    requests are serialised on the monitor's single session, so the monitor must not be used directly from other threads.
+    `iter_*` methods hold the session until their iteration ends and are never shared.
+
+    Results are shared between callers and must be treated as read-only.
+
+    Example:
+
+        >>> monitor = CoalescingMonitor(Monitor(ip, port), freshness = 1.0)
+        >>> monitor.open_connection()
+        >>> job = monitor.get_job('1256275308')                             # threads
+        >>> job = await monitor.call_async('get_job', '1256275308')         # asyncio
+
+    Attributes:
+        monitor (:obj:`Monitor`): The wrapped monitor
+        freshness (float): Seconds a completed result may be reused. 0 only shares in-flight requests
+        requests (int): Number of requests actually sent
+        coalesced (int): Number of calls that joined an in-flight request
+        reused (int): Number of calls answered from the freshness window
+
+    """
+
+    def __init__(self, monitor, freshness = 0.0):
+        self.monitor = monitor
+        self.freshness = freshness
+        self.requests = 0
+        self.coalesced = 0
+        self.reused = 0
+
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._in_flight = {}
+        self._fresh = {}
+
+    def _join(self, key):
+        """Returns a `(future, leader)` tuple for `key`. The leader has to perform the request and resolve the future"""
+        with self._lock:
+            fresh = self._fresh.get(key)
+            if fresh is not None:
+                expiry, future = fresh
+                if time.monotonic() < expiry:
+                    self.reused += 1
+                    return future, False
+                del self._fresh[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+
+            future = Future()
+            self._in_flight[key] = future
+            self.requests += 1
+            return future, True
+
+    def _lead(self, key, future):
+        name, args = key
+        try:
+            with self._io_lock:
+                result = getattr(self.monitor, name)(*args)
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(error)
+            return
+
+        with self._lock:
+            del self._in_flight[key]
+            if self.freshness > 0:
+                self._keep(key, future)
+        future.set_result(result)
+
+    def _keep(self, key, future):
+        """Keep a result for the freshness window and drop expired ones. Must be called with the lock held"""
+        now = time.monotonic()
+        # Entries are kept in the order they expire, so the expired ones are at the front
+        while self._fresh:
+            oldest = next(iter(self._fresh))
+            if self._fresh[oldest][0] > now:
+                break
+            del self._fresh[oldest]
+        self._fresh.pop(key, None)
+        self._fresh[key] = (now + self.freshness, future)
+
+    def call(self, name, *args):
+        """Call the monitor's `name` method, sharing the request with identical concurrent calls"""
+        key = (name, args)
+        future, leader = self._join(key)
+        if leader:
+            self._lead(key, future)
+        return future.result()
+
+    async def call_async(self, name, *args):
+        """Asyncio variant of :meth:`call`. The request itself runs in the loop's default executor"""
+        key = (name, args)
+        future, leader = self._join(key)
+        if leader:
+            await asyncio.get_running_loop().run_in_executor(None, self._lead, key, future)
+        return await asyncio.wrap_future(future)
+
+    def invalidate(self):
+        """Forget all results kept for the freshness window"""
+        with self._lock:
+            self._fresh.clear()
+
+    def _passthrough(self, name):
+        method = getattr(self.monitor, name)
+
+        def call(*args, **kwargs):
+            with self._io_lock:
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    if not name.startswith('get_'):
+                        self.invalidate()
+        return call
+
+    def _stream(self, name):
+        method = getattr(self.monitor, name)
+
+        def call(*args, **kwargs):
+            with self._io_lock:
+                yield from method(*args, **kwargs)
+        return call
+
+    def __getattr__(self, name):
+        attribute = getattr(self.monitor, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+        if name.startswith('iter_'):
+            return self._stream(name)
+        if name.startswith('get_'):
+            return lambda *args: self.call(name, *args)
+        return self._passthrough(name)
@@ -0,0 +1,412 @@
+import gzip
+import hashlib
+import html
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+
+import BackburnerDataClasses as BDC
+import Serialisers
+from Inventory import ServerInventory
+from JobCatalogue import JobCatalogue
+from WarmStart import WarmStart
+
+HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <style>
+        body { font-family: sans-serif; }
+        h1 { font-size: 2em; margin: 0.67em 0; }
+        h2 { font-size: 1.5em; margin: 0.83em 0; }
+        td, th { padding: 0.2em 0.8em; text-align: left; }
+    </style>
+</head>
+"""
+
+SCRIPT = """<script>
+const source = new EventSource('events');
+source.addEventListener('changes', (event) => {
+    const changes = JSON.parse(event.data);
+    for (const job of changes.jobs) {
+        let row = document.getElementById('job-' + job.handle);
+        if (!row) {
+            row = document.createElement('tr');
+            row.id = 'job-' + job.handle;
+            document.getElementById('jobs').appendChild(row);
+        }
+        row.innerHTML = '<td></td><td></td><td></td><td></td>';
+        row.cells[0].textContent = job.info.name;
+        row.cells[1].textContent = job.info.user;
+        row.cells[2].textContent = job.state;
+        row.cells[3].textContent = job.info.tasks_completed + '/' + job.info.number_tasks;
+    }
+    for (const handle of changes.removed_jobs) {
+        const row = document.getElementById('job-' + handle);
+        if (row) row.remove();
+    }
+    for (const server of changes.servers) {
+        let row = document.getElementById('server-' + server.handle);
+        if (!row) {
+            row = document.createElement('tr');
+            row.id = 'server-' + server.handle;
+            document.getElementById('servers').appendChild(row);
+        }
+        row.innerHTML = '<td></td><td></td><td></td>';
+        row.cells[0].textContent = server.server.name;
+        row.cells[1].textContent = server.server.ip_address;
+        row.cells[2].textContent = server.state;
+    }
+    for (const handle of changes.removed_servers) {
+        const row = document.getElementById('server-' + handle);
+        if (row) row.remove();
+    }
+});
+source.addEventListener('reload', () => window.location.reload());
+</script>
+"""
+
+def job_to_dict(record):
+    """Returns the JSON-ready representation of a :obj:`JobRecord`"""
+    return {'handle': record.handle, 'state': record.state, **Serialisers.to_dict(record.job)}
+
+def server_to_dict(record):
+    """Returns the JSON-ready representation of a :obj:`ServerRecord`"""
+    return {'handle': record.handle, 'state': record.state, 'server': Serialisers.to_dict(record.server)}
+
+def job_to_json(record):
+    """Returns :func:`job_to_dict` of a :obj:`JobRecord` encoded as JSON"""
+    return f'{{"handle":{record.handle},"state":{record.state},{Serialisers.dumps(record.job)[1:]}'
+
+def server_to_json(record):
+    """Returns :func:`server_to_dict` of a :obj:`ServerRecord` encoded as JSON"""
+    return f'{{"handle":{Serialisers.dumps(record.handle)},"state":{record.state},"server":{Serialisers.dumps(record.server)}}}'
+
+class _Rendered:
+    """Encoded representations of one snapshot version, built lazily and shared by all requests"""
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        tag = '{}-{}'.format(version, hashlib.blake2b(body, digest_size = 8).hexdigest())
+        # The gzip body is a different representation, so it gets its own validator
+        self.etag = f'"{tag}"'
+        self.gzip_etag = f'"{tag}-gzip"'
+        self._gzipped = None
+        self._lock = threading.Lock()
+
+    def gzipped(self):
+        with self._lock:
+            if self._gzipped is None:
+                self._gzipped = gzip.compress(self.body, 6)
+            return self._gzipped
+
+class DashboardState:
+    """Background-refreshed farm snapshot for dashboards and REST clients
+
+    One poller thread keeps a :obj:`JobCatalogue` and a :obj:`ServerInventory` up to date. Requests are answered from the
+    latest snapshot, so the Manager sees the same load whether one or a hundred dashboards are open. Each snapshot version is
+    encoded once: per-row JSON fragments are cached and only rebuilt for rows that changed, and the JSON, HTML and gzip
+    bodies are shared by all requests for that version. Changes between versions are kept for server-sent events.
+
+    Requests only read :attr:`jobs`, :attr:`servers` and the cached fragments, which are replaced as a whole when a version is
+    published, so they never see the catalogue halfway through a refresh.
+
+    With a `state_path`, the snapshot is saved every `save_interval` seconds and on :meth:`stop`, and loaded again on
+    startup, see :obj:`WarmStart`. A loaded snapshot is served right away with `"stale": true` until the first refresh has
+    revalidated it.
+
+    This class does not depend on a web framework, see :func:`create_app` for a Flask front-end.
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor with an open connection to the Manager
+        interval (float): Seconds between polls
+        catalogue (:obj:`JobCatalogue`)
+        inventory (:obj:`ServerInventory`)
+        version (int): Snapshot version, incremented whenever something changed
+        jobs (dict): :obj:`JobRecord` objects of the current version by handle
+        servers (dict): :obj:`ServerRecord` objects of the current version by handle
+        warm_start (:obj:`WarmStart`): Persistence of the snapshot, or `None`
+
+    """
+
+    def __init__(self, monitor, interval = 5.0, history = 256, state_path = None, save_interval = 60.0):
+        self.monitor = monitor
+        self.interval = interval
+        self.catalogue = JobCatalogue(monitor)
+        self.inventory = ServerInventory(monitor)
+        self.manager_info = None
+        self.version = 0
+
+        self.jobs = {}
+        self.servers = {}
+        self._job_fragments = {}
+        self._server_fragments = {}
+        self._changes = deque(maxlen = history)
+        self._rendered = {}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.warm_start = None
+        self.save_interval = save_interval
+        self._saved = time.monotonic()
+        if state_path is not None:
+            self.warm_start = WarmStart(self.catalogue, self.inventory, state_path)
+            if self.warm_start.load():
+                self.manager_info = self.warm_start.manager_info
+                self.jobs = dict(self.catalogue.jobs.rows)
+                self.servers = dict(self.inventory.servers.rows)
+                self._job_fragments = {handle: job_to_json(record) for handle, record in self.jobs.items()}
+                self._server_fragments = {handle: server_to_json(record) for handle, record in self.servers.items()}
+                self.version = 1
+
+    @property
+    def stale(self):
+        """`True` while the snapshot is a loaded one that has not been revalidated yet"""
+        return self.warm_start is not None and self.warm_start.stale
+
+    def refresh(self):
+        """Poll the Manager once and publish a new version if anything changed
+
+        Returns:
+            `True` if a new version was published
+
+        """
+        manager_info = self.monitor.get_manager_info()
+        stale = self.stale
+        if stale:
+            job_changes, server_changes = self.warm_start.revalidate(refetch_states = (BDC.JOBSTATE_ACTIVE,))
+        else:
+            job_changes = self.catalogue.refresh(refetch_states = (BDC.JOBSTATE_ACTIVE,))
+            server_changes = self.inventory.refresh_servers()
+        self._save(manager_info)
+        # Network counters change with every request, so they alone do not make a new version
+        manager_changed = self.manager_info is None or replace(manager_info, network_status = self.manager_info.network_status) != self.manager_info
+        if not job_changes and not server_changes and not manager_changed and not stale:
+            self.manager_info = manager_info
+            return False
+
+        changed_jobs, changed_servers = [], []
+        job_fragments = dict(self._job_fragments)
+        for handle in job_changes.added + job_changes.updated:
+            job_fragments[handle] = job_to_json(self.catalogue.get_job(handle))
+            changed_jobs.append(job_fragments[handle])
+        for handle in job_changes.removed:
+            job_fragments.pop(handle, None)
+        server_fragments = dict(self._server_fragments)
+        for handle in server_changes.added + server_changes.updated:
+            server_fragments[handle] = server_to_json(self.inventory.get_server(handle))
+            changed_servers.append(server_fragments[handle])
+        for handle in server_changes.removed:
+            server_fragments.pop(handle, None)
+
+        with self._condition:
+            self.manager_info = manager_info
+            self.jobs = dict(self.catalogue.jobs.rows)
+            self.servers = dict(self.inventory.servers.rows)
+            self._job_fragments = job_fragments
+            self._server_fragments = server_fragments
+            self.version += 1
+            changes = '{"jobs":[%s],"servers":[%s],"removed_jobs":%s,"removed_servers":%s,"version":%d}' % (
+                ','.join(changed_jobs), ','.join(changed_servers), json.dumps(job_changes.removed), json.dumps(server_changes.removed), self.version)
+            self._changes.append((self.version, changes))
+            self._rendered = {}
+            self._condition.notify_all()
+        logging.debug(f'Dashboard snapshot version {self.version}')
+        return True
+
+    def _save(self, manager_info):
+        if self.warm_start is None or time.monotonic() - self._saved < self.save_interval:
+            return
+        self._saved = time.monotonic()
+        try:
+            self.warm_start.save(manager_info)
+        except OSError as error:
+            logging.info(f'Saving the dashboard snapshot failed: {error!r}')
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as error:
+                logging.info(f'Dashboard refresh failed: {error!r}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start polling in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, daemon = True, name = 'DashboardState')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, wake up all event streams and save the snapshot"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.warm_start is not None and not self.warm_start.stale:
+            self.warm_start.save(self.manager_info)
+
+    def _render_json(self):
+        manager = Serialisers.dumps(self.manager_info) if self.manager_info is not None else 'null'
+        return ('{"version":%d,"stale":%s,"manager":%s,"jobs":[%s],"servers":[%s]}' % (
+            self.version, 'true' if self.stale else 'false', manager, ','.join(self._job_fragments.values()), ','.join(self._server_fragments.values()))).encode('utf-8')
+
+    def _render_html(self):
+        escape = html.escape
+        title = 'Backburner'
+        parts = [HEAD.replace('{title}', title), '<body>\n']
+        if self.manager_info is not None:
+            system_info = self.manager_info.system_info
+            parts.append(f'<h1>Manager: {escape(system_info.computer_name)}</h1>\n')
+            parts.append(f'<h2>User: {escape(system_info.user)}</h2>\n<h2>Platform: {escape(system_info.platform)}</h2>\n')
+
+        parts.append('<h2>Servers:</h2>\n<table>\n<thead><tr><th>Name</th><th>IP address</th><th>State</th></tr></thead>\n<tbody id="servers">\n')
+        for record in sorted(self.servers.values(), key = lambda record: record.server.name):
+            parts.append(f'<tr id="server-{escape(record.handle)}"><td>{escape(record.server.name)}</td>'
+                         f'<td>{escape(record.server.ip_address)}</td><td>{record.state}</td></tr>\n')
+        parts.append('</tbody>\n</table>\n')
+
+        parts.append('<h2>Jobs:</h2>\n<table>\n<thead><tr><th>Name</th><th>User</th><th>State</th><th>Progress</th></tr></thead>\n<tbody id="jobs">\n')
+        for record in sorted(self.jobs.values(), key = lambda record: (record.job.info.priority, record.handle)):
+            info = record.job.info
+            parts.append(f'<tr id="job-{record.handle}"><td>{escape(info.name)}</td><td>{escape(info.user)}</td>'
+                         f'<td>{record.state}</td><td>{info.tasks_completed}/{info.number_tasks}</td></tr>\n')
+        parts.append('</tbody>\n</table>\n')
+        parts.append(SCRIPT)
+        parts.append('</body>\n</html>\n')
+        return ''.join(parts).encode('utf-8')
+
+    def _get_rendered(self, kind):
+        with self._condition:
+            rendered = self._rendered.get(kind)
+            if rendered is None:
+                body = self._render_json() if kind == 'json' else self._render_html()
+                rendered = _Rendered(self.version, body)
+                self._rendered[kind] = rendered
+            return rendered
+
+    def response(self, kind, if_none_match = None, accept_encoding = ''):
+        """Build the response to a snapshot request
+
+        Args:
+            kind (str): 'json' or 'html'
+            if_none_match (str): Value of the request's If-None-Match header
+            accept_encoding (str): Value of the request's Accept-Encoding header
+
+        Returns:
+            A three element tuple containing the status code (int), the headers (dict) and the body (bytes)
+
+        """
+        rendered = self._get_rendered(kind)
+        compress = 'gzip' in (accept_encoding or '') and len(rendered.body) > 1024
+        headers = {
+            'ETag': rendered.gzip_etag if compress else rendered.etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            'Content-Type': 'application/json' if kind == 'json' else 'text/html; charset=utf-8',
+        }
+        if if_none_match is not None and headers['ETag'] in [tag.strip() for tag in if_none_match.split(',')]:
+            return 304, headers, b''
+
+        body = rendered.body
+        if compress:
+            body = rendered.gzipped()
+            headers['Content-Encoding'] = 'gzip'
+        headers['Content-Length'] = str(len(body))
+        return 200, headers, body
+
+    def events(self, last_event_id = None, heartbeat = 15.0):
+        """Generate server-sent events with the changes of every new version
+
+        A client that reconnects with a Last-Event-ID gets the changes it missed, or a 'reload' event if they are no longer
+        available. Comment lines are sent as heartbeat while nothing changes.
+
+        Yields:
+            Encoded event stream chunks (bytes)
+
+        """
+        with self._condition:
+            version = self.version
+        if last_event_id is not None:
+            try:
+                version = int(last_event_id)
+            except ValueError:
+                pass
+
+        yield b'retry: 5000\n\n'
+        while not self._stop.is_set():
+            with self._condition:
+                if self.version == version:
+                    self._condition.wait(heartbeat)
+                if self.version == version:
+                    pending = None
+                else:
+                    pending = [(number, data) for number, data in self._changes if number > version]
+                    complete = bool(pending) and pending[0][0] == version + 1
+                    version = self.version
+
+            if pending is None:
+                yield b': heartbeat\n\n'
+            elif not complete:
+                yield f'id: {version}\nevent: reload\ndata: {{}}\n\n'.encode('utf-8')
+            else:
+                for number, data in pending:
+                    yield f'id: {number}\nevent: changes\ndata: {data}\n\n'.encode('utf-8')
+
+def create_app(state, name = __name__):
+    """Create a Flask application serving a :obj:`DashboardState`
+
+    Routes:
+        / : HTML dashboard, updated live through server-sent events
+        /api/snapshot : JSON snapshot of the Manager, servers and jobs
+        /api/jobs/<handle> : JSON representation of one job
+        /api/servers/<handle> : JSON representation of one server
+        /events : Server-sent event stream of changes
+
+    Flask is only imported here, so the rest of BackburnerPy does not depend on it.
+
+    """
+    from flask import Flask, Response, abort, request
+
+    app = Flask(name)
+
+    def snapshot_response(kind):
+        status, headers, body = state.response(kind, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding', ''))
+        return Response(body, status = status, headers = headers)
+
+    @app.route('/')
+    def index():
+        return snapshot_response('html')
+
+    @app.route('/api/snapshot')
+    def snapshot():
+        return snapshot_response('json')
+
+    @app.route('/api/jobs/<int:handle>')
+    def job(handle):
+        record = state.jobs.get(handle)
+        if record is None:
+            abort(404)
+        return Response(job_to_json(record), content_type = 'application/json')
+
+    @app.route('/api/servers/<handle>')
+    def server(handle):
+        record = state.servers.get(handle)
+        if record is None:
+            abort(404)
+        return Response(server_to_json(record), content_type = 'application/json')
+
+    @app.route('/events')
+    def events():
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(state.events(request.headers.get('Last-Event-ID')), content_type = 'text/event-stream', headers = headers)
+
+    return app
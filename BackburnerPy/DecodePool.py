@@ -0,0 +1,151 @@
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import Monitor as M
+
+# Payloads of at least this many bytes are decoded in the pool, smaller ones on the calling thread
+INLINE_LIMIT = 64 * 1024
+
+def decode_payload(decoder_name, raw_requested_data):
+    """Parse and decode a raw payload with one of the `decode_*` functions of :mod:`Monitor`
+
+    Runs in the worker processes, so it takes the decoder by name and only returns picklable data class objects.
+    """
+    return getattr(M, decoder_name)(M.parse_payload(raw_requested_data))
+
+class DecodePool:
+    """Decodes raw Manager replies off the I/O thread
+
+    Parsing the XML of a large job archive or job list takes far longer than receiving it, and because of the GIL a thread
+    that does so also delays every other thread of the process. Payloads of at least `inline_limit` bytes are therefore
+    decoded in worker processes, while small payloads are decoded right away on the calling thread, where the round trip
+    to a worker would cost more than the decoding itself. Either way the result is returned as a :obj:`Future`.
+
+    Attributes:
+        inline_limit (int): Payloads smaller than this many bytes are decoded inline
+        workers (int): Number of worker processes, or threads if `use_threads` is set
+
+    """
+
+    def __init__(self, inline_limit = INLINE_LIMIT, workers = None, use_threads = False):
+        self.inline_limit = inline_limit
+        self.workers = workers
+        self.use_threads = use_threads
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self.use_threads:
+                    self._executor = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = 'DecodePool')
+                else:
+                    self._executor = ProcessPoolExecutor(max_workers = self.workers)
+                logging.debug(f'Started decode pool with {self._executor._max_workers} workers')
+            return self._executor
+
+    def submit(self, decoder_name, raw_requested_data):
+        """Decode a raw payload as returned by :meth:`Monitor._send_raw`
+
+        Args:
+            decoder_name (str): Name of a `decode_*` function of :mod:`Monitor`, e.g. 'decode_job'
+            raw_requested_data (bytes): The raw payload including its terminator byte
+
+        Returns:
+            A :obj:`Future` resolving to the decoded data class object(s)
+
+        """
+        if len(raw_requested_data) >= self.inline_limit:
+            return self._pool().submit(decode_payload, decoder_name, raw_requested_data)
+
+        future = Future()
+        try:
+            future.set_result(decode_payload(decoder_name, raw_requested_data))
+        except Exception as exception:
+            future.set_exception(exception)
+        return future
+
+    def shutdown(self, wait = True):
+        """Stop the workers, if they were started"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait = wait)
+                self._executor = None
+
+class PooledMonitor:
+    """Monitor front-end whose `get_*` methods return futures decoded by a :obj:`DecodePool`
+
+    Requests are still sent and answered on the calling thread, one at a time, but only the raw reply is read there. The
+    session is free for the next request as soon as the reply has arrived, while a large payload is still being decoded.
+
+    Example:
+
+        >>> monitor = PooledMonitor(Monitor(manager_ip, 3234), DecodePool())
+        >>> monitor.open_connection()
+        >>> archive = monitor.get_jobarchive()
+        >>> info = monitor.get_manager_info().result()
+        >>> jobs = archive.result()
+
+    Attributes:
+        monitor (:obj:`Monitor`): The session requests are sent on
+        pool (:obj:`DecodePool`): Pool the replies are decoded in
+
+    """
+
+    def __init__(self, monitor, pool = None):
+        self.monitor = monitor
+        self.pool = pool or DecodePool()
+
+    def open_connection(self):
+        self.monitor.open_connection()
+
+    def close_connection(self):
+        self.monitor.close_connection()
+
+    def _request(self, message, decoder_name):
+        response_code, response_message, raw_requested_data = self.monitor._send_raw(message)
+        if raw_requested_data is None:
+            future = Future()
+            future.set_exception(ValueError(f'Manager answered {response_code} {response_message}'))
+            return future
+        return self.pool.submit(decoder_name, raw_requested_data)
+
+    def get_manager_info(self):
+        """Future of :meth:`Monitor.get_manager_info`"""
+        return self._request(b'get mgrinfo\r\n', 'decode_manager_info')
+
+    def get_client_list(self):
+        """Future of :meth:`Monitor.get_client_list`"""
+        return self._request(b'get clientlist\r\n', 'decode_client_list')
+
+    def get_plugin_list(self):
+        """Future of :meth:`Monitor.get_plugin_list`"""
+        return self._request(b'get pluglist\r\n', 'decode_plugin_list')
+
+    def get_server_list(self):
+        """Future of :meth:`Monitor.get_server_list`"""
+        return self._request(b'get srvlist\r\n', 'decode_server_list')
+
+    def get_server(self, server_handle):
+        """Future of :meth:`Monitor.get_server`"""
+        return self._request(f'get jobinfo {server_handle}\r\n'.encode('utf-8'), 'decode_server')
+
+    def get_job_handle_list(self):
+        """Future of :meth:`Monitor.get_job_handle_list`"""
+        return self._request(b'get jobhlist\r\n', 'decode_job_handle_list')
+
+    def get_job_list(self):
+        """Future of :meth:`Monitor.get_job_list`"""
+        return self._request(b'get joblist\r\n', 'decode_job_list')
+
+    def get_job(self, job_handle):
+        """Future of :meth:`Monitor.get_job`"""
+        return self._request(f'get jobinfo {job_handle}\r\n'.encode('utf-8'), 'decode_job')
+
+    def get_jobarchive(self):
+        """Future of :meth:`Monitor.get_jobarchive`"""
+        return self._request(b'get jobarchive\r\n', 'decode_jobarchive')
+
+    def __getattr__(self, name):
+        return getattr(self.monitor, name)
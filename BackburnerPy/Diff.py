@@ -0,0 +1,275 @@
+"""Field-level differences between snapshots of data class objects
+
+Objects are compared by equality and, where they differ, by content digests, see :func:`fingerprint`. Digests are 128 bit
+BLAKE2 hashes, so two objects with the same digest have the same content. :func:`diff` computes the digest of every nested object once and only compares the
+parts whose digests differ field by field, so unchanged parts cost one comparison no matter how deep they are.
+
+    >>> changes = diff(old_job, new_job)
+    >>> changes
+    Changeset([Change(path=('info', 'tasks_completed'), old=10, new=11), Change(path=('servers', 'node7', 'task_total'), old=1, new=2)])
+    >>> apply(old_job, changes) == new_job
+    True
+
+Paths name the fields from the outer object inwards. Items of list fields are identified by a key field (the handle of a
+:obj:`JobServer`, the name of a :obj:`Plugin`) or otherwise by their position. An item that was added has `old` set to
+`None`, an item that was removed has `new` set to `None`.
+
+Digests are not kept on the objects, which are mutable, so a modified object or a modified copy is never mistaken for
+the original. :func:`apply` returns a new object that shares all unchanged parts with the original, rather than modifying it.
+"""
+import dataclasses
+import hashlib
+import operator
+
+import BackburnerDataClasses as BDC
+
+# Field identifying the items of list fields, items of other types are identified by their position
+_LIST_ITEM_KEYS = {
+    BDC.JobServer: 'handle',
+    BDC.Plugin: 'name',
+}
+
+_PLANS = {}
+
+_DIGEST_PLANS = {}
+
+_VALUE, _RECORD, _LIST = range(3)
+
+@dataclasses.dataclass
+class Change:
+    """One changed field
+
+    Attributes:
+        path (tuple): Field names, and keys of list items, leading to the changed value
+        old: The previous value, or `None` for an added list item
+        new: The new value, or `None` for a removed list item
+
+    """
+    path: tuple
+    old: object
+    new: object
+
+class Changeset(list):
+    """A :obj:`list` of :obj:`Change` objects, empty if nothing changed"""
+
+    def paths(self):
+        """Returns the set of changed top-level fields"""
+        return {change.path[0] for change in self if change.path}
+
+    def __repr__(self):
+        return f'Changeset({list.__repr__(self)})'
+
+def _plan(cls):
+    plan = _PLANS.get(cls)
+    if plan is None:
+        plan = []
+        for field in dataclasses.fields(cls):
+            if dataclasses.is_dataclass(field.type):
+                plan.append((field.name, _RECORD))
+            elif field.type is list:
+                plan.append((field.name, _LIST))
+            else:
+                plan.append((field.name, _VALUE))
+        _PLANS[cls] = plan
+    return plan
+
+def _content(value, memo):
+    """Returns a value with nested data class objects replaced by their digests"""
+    if dataclasses.is_dataclass(value):
+        return _digest(value, memo)
+    if isinstance(value, list):
+        return tuple(_content(item, memo) for item in value)
+    return value
+
+def _tuple_getter(names):
+    """Returns a function reading the attributes `names` of an object as a tuple"""
+    if not names:
+        return lambda record: ()
+    if len(names) == 1:
+        getter = operator.attrgetter(names[0])
+        return lambda record: (getter(record),)
+    return operator.attrgetter(*names)
+
+def _digest_plan(cls):
+    """Returns the class name and getters for the plain, nested and list fields of `cls`"""
+    plan = _DIGEST_PLANS.get(cls)
+    if plan is None:
+        fields = _plan(cls)
+        plan = _DIGEST_PLANS[cls] = (cls.__name__, *(_tuple_getter([name for name, field_kind in fields if field_kind == kind])
+                                                     for kind in (_VALUE, _RECORD, _LIST)))
+    return plan
+
+def _digest(record, memo):
+    """Returns the digest of `record`, reusing the digests in `memo` that were computed during the same comparison"""
+    result = memo.get(id(record))
+    if result is not None:
+        return result
+
+    name, values, records, lists = _digest_plan(type(record))
+    parts = (name, values(record),
+             tuple(None if value is None else _digest(value, memo) for value in records(record)),
+             tuple(tuple(_content(item, memo) for item in value) if isinstance(value, list) else _content(value, memo) for value in lists(record)))
+    result = hashlib.blake2b(repr(parts).encode('utf-8', 'surrogatepass'), digest_size = 16).digest()
+    # Keyed by id, the compared objects stay alive during the comparison
+    memo[id(record)] = result
+    return result
+
+def fingerprint(record):
+    """Returns the content digest of a data class object
+
+    The digest is the BLAKE2 hash of the `repr` of the field values, with nested objects replaced by their own digests, so
+    it is the same in every process. It is computed from the current content on every call.
+
+    Returns:
+        bytes
+
+    """
+    return _digest(record, {})
+
+def _same(old, new, memo):
+    if old is new:
+        return True
+    if old is None or new is None or type(old) is not type(new):
+        return False
+    # Equality settles most pairs without hashing, digests also match fields that are NaN on both sides
+    return old == new or _digest(old, memo) == _digest(new, memo)
+
+def same(old, new):
+    """Returns `True` if both objects have the same content"""
+    return _same(old, new, {})
+
+def _item_key(item, index):
+    key_field = _LIST_ITEM_KEYS.get(type(item))
+    return getattr(item, key_field) if key_field is not None else index
+
+def _diff_list(path, old, new, changes, memo):
+    old_items = {_item_key(item, index): item for index, item in enumerate(old)}
+    new_items = {_item_key(item, index): item for index, item in enumerate(new)}
+    if len(old_items) != len(old) or len(new_items) != len(new):
+        # Duplicate keys cannot be told apart, so report the whole list
+        changes.append(Change(path, old, new))
+        return
+
+    for key, item in old_items.items():
+        if key not in new_items:
+            changes.append(Change(path + (key,), item, None))
+    for key, item in new_items.items():
+        previous = old_items.get(key)
+        if previous is None:
+            changes.append(Change(path + (key,), None, item))
+        elif dataclasses.is_dataclass(item) and type(previous) is type(item):
+            _diff_record(path + (key,), previous, item, changes, memo)
+        elif previous != item:
+            changes.append(Change(path + (key,), previous, item))
+
+    # Item changes keep the remaining items in place and append added ones, any other order is reported as a whole list
+    if list(new_items) != [key for key in old_items if key in new_items] + [key for key in new_items if key not in old_items]:
+        changes.append(Change(path, old, new))
+
+def _diff_record(path, old, new, changes, memo):
+    if _same(old, new, memo):
+        return
+    for name, kind in _plan(type(old)):
+        old_value = getattr(old, name)
+        new_value = getattr(new, name)
+        if kind == _RECORD and old_value is not None and new_value is not None:
+            _diff_record(path + (name,), old_value, new_value, changes, memo)
+        elif kind == _LIST and isinstance(old_value, list) and isinstance(new_value, list):
+            if _content(old_value, memo) != _content(new_value, memo):
+                _diff_list(path + (name,), old_value, new_value, changes, memo)
+        elif old_value != new_value:
+            changes.append(Change(path + (name,), old_value, new_value))
+
+def diff(old, new):
+    """Compute the field-level differences between two snapshots of the same object
+
+    Args:
+        old: Previous data class object
+        new: Current data class object of the same type
+
+    Returns:
+        A :obj:`Changeset`, empty if both have the same content
+
+    """
+    if type(old) is not type(new):
+        raise TypeError(f'Cannot compare {type(old).__name__} with {type(new).__name__}')
+    changes = Changeset()
+    _diff_record((), old, new, changes, {})
+    return changes
+
+def diff_snapshots(old, new):
+    """Compare two mappings of handle to data class object, e.g. the rows of a :obj:`Table`
+
+    Returns:
+        A :obj:`dict` mapping the handles of added, removed and changed objects to their :obj:`Changeset`. Added and
+        removed objects have a single change with an empty path.
+
+    """
+    result = {}
+    for handle, record in old.items():
+        current = new.get(handle)
+        if current is None:
+            result[handle] = Changeset([Change((), record, None)])
+        elif current is not record:
+            changes = diff(record, current)
+            if changes:
+                result[handle] = changes
+    for handle, record in new.items():
+        if handle not in old:
+            result[handle] = Changeset([Change((), None, record)])
+    return result
+
+def _apply_list(items, changes):
+    replaced = [change for change in changes if len(change.path) == 0]
+    if replaced:
+        return replaced[-1].new
+
+    keyed = {_item_key(item, index): item for index, item in enumerate(items)}
+    by_key = {}
+    for change in changes:
+        by_key.setdefault(change.path[0], []).append(change)
+
+    for key, item_changes in by_key.items():
+        for change in item_changes:
+            if len(change.path) == 1:
+                if change.new is None:
+                    keyed.pop(key, None)
+                else:
+                    keyed[key] = change.new
+        nested = [Change(change.path[1:], change.old, change.new) for change in item_changes if len(change.path) > 1]
+        if nested and key in keyed:
+            keyed[key] = _apply_record(keyed[key], nested)
+    return list(keyed.values())
+
+def _apply_record(record, changes):
+    if any(len(change.path) == 0 for change in changes):
+        return [change for change in changes if len(change.path) == 0][-1].new
+
+    grouped = {}
+    for change in changes:
+        grouped.setdefault(change.path[0], []).append(Change(change.path[1:], change.old, change.new))
+
+    kinds = dict(_plan(type(record)))
+    updates = {}
+    for name, field_changes in grouped.items():
+        kind = kinds.get(name)
+        if kind is None:
+            raise KeyError(f'{type(record).__name__} has no field {name}')
+        if kind == _LIST:
+            updates[name] = _apply_list(getattr(record, name), field_changes)
+        elif kind == _RECORD and getattr(record, name) is not None:
+            updates[name] = _apply_record(getattr(record, name), field_changes)
+        else:
+            updates[name] = field_changes[-1].new
+    return dataclasses.replace(record, **updates)
+
+def apply(record, changes):
+    """Apply a :obj:`Changeset` computed by :func:`diff` to a snapshot
+
+    Returns:
+        A new data class object, sharing unchanged nested objects with `record`
+
+    """
+    if not changes:
+        return record
+    return _apply_record(record, list(changes))
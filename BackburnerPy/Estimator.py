@@ -0,0 +1,222 @@
+import math
+import time
+from dataclasses import dataclass
+
+class Welford:
+    """Running mean and variance in constant memory, using Welford's algorithm
+
+    Attributes:
+        count (int): Number of samples
+        mean (float)
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Sample variance, 0.0 for fewer than two samples"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+class Ewma:
+    """Exponentially weighted moving average of samples taken at irregular intervals
+
+    A sample covering `elapsed` seconds gets the weight `1 - exp(-elapsed / time_constant)`, so the average forgets at the
+    same speed no matter how often it is updated. The first sample is taken as it is.
+
+    Attributes:
+        time_constant (float): Seconds after which the weight of a sample has dropped to 1/e
+        value (float): The current average, or `None` before the first sample
+
+    """
+
+    def __init__(self, time_constant):
+        self.time_constant = time_constant
+        self.value = None
+
+    def update(self, value, elapsed):
+        if self.value is None:
+            self.value = value
+        else:
+            weight = 1.0 - math.exp(-elapsed / self.time_constant)
+            self.value += weight * (value - self.value)
+        return self.value
+
+@dataclass
+class JobEstimate:
+    """Progress estimate of a job
+
+    Attributes:
+        handle (int)
+        remaining_tasks (int)
+        frames_per_hour (float): Estimated throughput, 0.0 while unknown
+        eta_seconds (float): Estimated seconds until the job completes, or `None` while unknown
+        eta (float): Estimated completion time as returned by `time.time()`, or `None`
+        confidence (float): Between 0.0 (guess) and 1.0, grows with the number of polls and shrinks with erratic progress
+        active_servers (int): Servers currently working on the job
+
+    """
+    handle: int
+    remaining_tasks: int
+    frames_per_hour: float
+    eta_seconds: float
+    eta: float
+    confidence: float
+    active_servers: int
+
+class _JobState:
+    """Online statistics of one job, updated on every poll"""
+
+    def __init__(self, time_constant):
+        self.time = None
+        self.completed = None
+        self.rate = Ewma(time_constant)
+        self.rates = Welford()
+        self.task_times = Welford()
+        self.servers = {}
+        self.estimate = None
+
+class JobEstimator:
+    """Streaming ETA and throughput estimator fed by successive :meth:`Monitor.get_job` results
+
+    Each update only looks at the new job object and the few numbers kept from the previous one, so the cost per poll is
+    independent of the job's history:
+
+    - the rate at which `tasks_completed` rises is averaged with an :obj:`Ewma`, and its variability tracked with
+      :obj:`Welford` to derive the confidence
+    - each server's `task_total` and `task_time` give a second estimate: the sum of `1 / task_time` over the active servers.
+      It is used until enough progress has been observed, and for jobs that have not progressed since they started
+    - task times of all servers are tracked with :obj:`Welford` to widen the confidence when frames vary a lot
+
+    Example:
+
+        >>> estimator = JobEstimator()
+        >>> estimate = estimator.update(handle, monitor.get_job(str(handle)))
+        >>> estimate.eta_seconds, estimate.frames_per_hour, estimate.confidence
+
+    Attributes:
+        time_constant (float): Seconds over which the observed rate is averaged
+        min_samples (int): Observed rates needed before they are preferred over the server based estimate
+
+    """
+
+    def __init__(self, time_constant = 600.0, min_samples = 3):
+        self.time_constant = time_constant
+        self.min_samples = min_samples
+        self._jobs = {}
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def update(self, handle, job, now = None):
+        """Feed the latest job details and return the new estimate
+
+        Args:
+            handle (int): The job handle
+            job (:obj:`Job`): Job details as returned by :meth:`Monitor.get_job`
+            now (float): Time the job was fetched, as returned by `time.time()`. Defaults to the current time
+
+        Returns:
+            A :obj:`JobEstimate` object
+
+        """
+        now = time.time() if now is None else now
+        info = job.info
+        state = self._jobs.get(handle)
+        if state is None or (state.completed is not None and info.tasks_completed < state.completed):
+            # New job, or a restarted one whose history no longer applies
+            state = self._jobs[handle] = _JobState(self.time_constant)
+
+        if state.time is not None and now > state.time:
+            elapsed = now - state.time
+            rate = (info.tasks_completed - state.completed) / elapsed
+            state.rate.update(rate, elapsed)
+            state.rates.add(rate)
+        state.time = now
+        state.completed = info.tasks_completed
+
+        capacity = 0.0
+        active_servers = 0
+        for server in job.servers:
+            previous_total = state.servers.get(server.handle)
+            if previous_total is not None and server.task_total > previous_total and server.task_time > 0:
+                state.task_times.add(server.task_time)
+            state.servers[server.handle] = server.task_total
+            if server.active:
+                active_servers += 1
+                if server.task_time > 0:
+                    capacity += 1.0 / server.task_time
+
+        state.estimate = self._estimate(handle, job, state, capacity, active_servers, now)
+        return state.estimate
+
+    def _estimate(self, handle, job, state, capacity, active_servers, now):
+        remaining = max(0, job.info.number_tasks - job.info.tasks_completed)
+        if remaining == 0 or job.flags.complete:
+            return JobEstimate(handle, 0, (state.rate.value or 0.0) * 3600.0, 0.0, now, 1.0, active_servers)
+
+        observed = state.rates.count >= self.min_samples and state.rate.value > 0
+        if observed:
+            rate = state.rate.value
+            # Confidence grows with the number of observed rates and shrinks with their coefficient of variation
+            variation = state.rates.stddev / state.rates.mean if state.rates.mean > 0 else 1.0
+            confidence = state.rates.count / (state.rates.count + self.min_samples) / (1.0 + variation)
+        elif capacity > 0:
+            rate = capacity
+            variation = state.task_times.stddev / state.task_times.mean if state.task_times.count > 1 else 1.0
+            confidence = 0.25 / (1.0 + variation)
+        else:
+            return JobEstimate(handle, remaining, 0.0, None, None, 0.0, active_servers)
+
+        if not job.flags.active or active_servers == 0:
+            # Not running at the moment, so the throughput is known but not when the job will finish
+            return JobEstimate(handle, remaining, rate * 3600.0, None, None, confidence, active_servers)
+
+        eta_seconds = remaining / rate
+        return JobEstimate(handle, remaining, rate * 3600.0, eta_seconds, now + eta_seconds, min(1.0, confidence), active_servers)
+
+    def estimate(self, handle):
+        """Returns the latest :obj:`JobEstimate` of a job, or `None` if it was never updated"""
+        state = self._jobs.get(handle)
+        return state.estimate if state is not None else None
+
+    def estimates(self):
+        """Returns a :obj:`dict` mapping job handles to their latest :obj:`JobEstimate`"""
+        return {handle: state.estimate for handle, state in self._jobs.items()}
+
+    def forget(self, handle):
+        """Drop the statistics of a job, e.g. once it left the queue"""
+        self._jobs.pop(handle, None)
+
+    def update_from_catalogue(self, catalogue, changes, now = None):
+        """Feed the jobs a :meth:`JobCatalogue.refresh` reported as added or updated, and forget removed ones
+
+        Jobs whose details were not re-fetched keep their previous estimate, so refresh active jobs with
+        `refetch_states = (BDC.JOBSTATE_ACTIVE,)` to keep their estimates current.
+
+        Returns:
+            A :obj:`dict` mapping the updated job handles to their new :obj:`JobEstimate`
+
+        """
+        now = time.time() if now is None else now
+        result = {}
+        for handle in changes.added + changes.updated:
+            record = catalogue.get_job(handle)
+            if record is not None:
+                result[handle] = self.update(handle, record.job, now)
+        for handle in changes.removed:
+            self.forget(handle)
+        return result
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Requests that only read state, so that sending them again to the other Manager is harmless
+READ_PREFIXES = ('get_',)
+
+class _Endpoint:
+    """One Manager of a redundant pair together with its session state and latency history"""
+
+    def __init__(self, monitor, window):
+        self.monitor = monitor
+        self.lock = threading.Lock()
+        self.connected = False
+        self.failed_at = None
+        self.latencies = {}
+        self.window = window
+
+    def call(self, name, args, kwargs, deadline):
+        """Call a monitor method before the `time.monotonic` based `deadline`, opening the session first if needed"""
+        if deadline <= time.monotonic():
+            raise TimeoutError('Deadline exceeded')
+        if not self.lock.acquire(timeout = deadline - time.monotonic()):
+            raise TimeoutError('Session is busy')
+        try:
+            with self.monitor.deadline(deadline - time.monotonic()):
+                if not self.connected:
+                    self.monitor.open_connection()
+                    self.connected = True
+                start = time.monotonic()
+                result = getattr(self.monitor, name)(*args, **kwargs)
+                self.latencies.setdefault(name, deque(maxlen = self.window)).append(time.monotonic() - start)
+                self.failed_at = None
+                return result
+        except (OSError, TimeoutError):
+            # Timeouts already closed the session, other errors leave it in an unknown state
+            self._discard()
+            raise
+        finally:
+            self.lock.release()
+
+    def _discard(self):
+        """Mark the Manager as failed and close a session that may still be open. Must be called with the lock held"""
+        self.connected = False
+        self.failed_at = time.monotonic()
+        session = getattr(self.monitor, 'session', None)
+        if session is not None:
+            session.close()
+
+    def stream(self, name, args, kwargs, deadline):
+        """Iterate a monitor generator method, holding the session until the iteration ends
+
+        Only acquiring the session and opening it have to happen before `deadline`, the stream itself is bounded by the
+        monitor's socket timeout.
+        """
+        if deadline <= time.monotonic() or not self.lock.acquire(timeout = deadline - time.monotonic()):
+            raise TimeoutError('Session is busy')
+        try:
+            if not self.connected:
+                with self.monitor.deadline(deadline - time.monotonic()):
+                    self.monitor.open_connection()
+                self.connected = True
+            yield from getattr(self.monitor, name)(*args, **kwargs)
+            self.failed_at = None
+        except (OSError, TimeoutError):
+            self._discard()
+            raise
+        finally:
+            self.lock.release()
+
+    def percentile(self, name, fraction, default):
+        samples = self.latencies.get(name)
+        if not samples or len(samples) < 20:
+            return default
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def close(self):
+        with self.lock:
+            if self.connected:
+                self.connected = False
+                self.monitor.close_connection()
+
+class RedundantMonitor:
+    """Monitor front-end for a primary Manager with an optional standby
+
+    Every request gets a deadline of `timeout` seconds. `get_*` requests are hedged: if the primary has not answered within its
+    recent 95th percentile latency for that request, the same request is sent to the secondary and whichever answers first wins.
+    The slower request is left to finish in the background so that its session stays usable. Other requests only go to the
+    primary. When the primary fails or times out, the roles are swapped, so the session fails over to the secondary; a failed
+    Manager is only tried again after `retry_interval` seconds. Reads, i.e. requests starting with one of `READ_PREFIXES`, are
+    then retried on the secondary. Other requests, e.g. `set_jobstate`, may already have taken effect on the failed Manager,
+    so their error is raised instead and only the following requests go to the secondary. `iter_*` requests are neither
+    hedged nor retried, they hold the session of the first available Manager until their iteration ends.
+
+    Example:
+
+        >>> monitor = RedundantMonitor(Monitor(primary_ip, 3234), Monitor(standby_ip, 3234), timeout = 5.0)
+        >>> monitor.open_connection()
+        >>> job = monitor.get_job('1256275308')
+
+    Attributes:
+        timeout (float): Deadline of each request in seconds
+        hedge (bool): Send hedged reads to the secondary
+        hedge_delay (float): Hedging delay in seconds used until enough latencies have been observed
+        retry_interval (float): Seconds before a failed Manager is used again
+
+    """
+
+    def __init__(self, primary, secondary = None, timeout = 10.0, hedge = True, hedge_delay = 0.25, retry_interval = 30.0, window = 200):
+        self._endpoints = [_Endpoint(primary, window)] + ([_Endpoint(secondary, window)] if secondary is not None else [])
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = 4, thread_name_prefix = 'RedundantMonitor')
+
+    @property
+    def primary(self):
+        """The :obj:`Monitor` currently acting as primary"""
+        return self._roles()[0].monitor
+
+    def _roles(self):
+        """Returns the endpoints in their current order, the primary first"""
+        with self._lock:
+            return list(self._endpoints)
+
+    def open_connection(self):
+        """Open the session with the primary, failing over to the secondary if the primary cannot be reached"""
+        self._call_with_failover('get_manager_info', (), {})
+
+    def close_connection(self):
+        """Close the sessions with both Managers"""
+        for endpoint in self._roles():
+            endpoint.close()
+        self._executor.shutdown(wait = False)
+
+    def _available(self, endpoint):
+        return endpoint.failed_at is None or time.monotonic() - endpoint.failed_at >= self.retry_interval
+
+    def _fail_over(self, failed):
+        # Checked and swapped under the lock, so concurrent failures of the same Manager swap the roles only once
+        with self._lock:
+            if len(self._endpoints) > 1 and self._endpoints[0] is failed:
+                logging.info(f'Failing over from Manager {failed.monitor.MANAGER_IP} to {self._endpoints[1].monitor.MANAGER_IP}')
+                self._endpoints.reverse()
+
+    def _call_with_failover(self, name, args, kwargs):
+        deadline = time.monotonic() + self.timeout
+        error = None
+        endpoints = self._roles()
+        for endpoint in endpoints:
+            if not self._available(endpoint) and endpoint is not endpoints[-1]:
+                continue
+            try:
+                return endpoint.call(name, args, kwargs, deadline)
+            except (OSError, TimeoutError) as exception:
+                logging.info(f'{name} on Manager {endpoint.monitor.MANAGER_IP} failed: {exception!r}')
+                error = exception
+                self._fail_over(endpoint)
+                if not name.startswith(READ_PREFIXES):
+                    raise
+            if time.monotonic() >= deadline:
+                break
+        raise error
+
+    def _hedged_read(self, name, args, kwargs):
+        primary, secondary = self._roles()
+        if not self._available(primary) or not self._available(secondary):
+            return self._call_with_failover(name, args, kwargs)
+
+        deadline = time.monotonic() + self.timeout
+        first = self._executor.submit(primary.call, name, args, kwargs, deadline)
+        done, _ = wait([first], timeout = primary.percentile(name, 0.95, self.hedge_delay))
+        if first in done and first.exception() is None:
+            return first.result()
+
+        if first in done:
+            self._fail_over(primary)
+        else:
+            logging.debug(f'Hedging {name} to Manager {secondary.monitor.MANAGER_IP}')
+        second = self._executor.submit(secondary.call, name, args, kwargs, deadline)
+
+        pending = {first, second} - ({first} if first in done else set())
+        error = first.exception() if first in done else None
+        while pending:
+            done, pending = wait(pending, timeout = max(0, deadline - time.monotonic()), return_when = FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f'{name} was not answered by any Manager in time')
+            for future in done:
+                if future.exception() is None:
+                    if future is second and first.done() and first.exception() is not None:
+                        self._fail_over(primary)
+                    return future.result()
+                error = future.exception()
+                if future is first:
+                    self._fail_over(primary)
+        raise error
+
+    def _stream(self, name, args, kwargs):
+        deadline = time.monotonic() + self.timeout
+        endpoints = self._roles()
+        endpoint = next((endpoint for endpoint in endpoints if self._available(endpoint)), endpoints[-1])
+        try:
+            yield from endpoint.stream(name, args, kwargs, deadline)
+        except (OSError, TimeoutError) as exception:
+            logging.info(f'{name} on Manager {endpoint.monitor.MANAGER_IP} failed: {exception!r}')
+            self._fail_over(endpoint)
+            raise
+
+    def __getattr__(self, name):
+        attribute = getattr(self.primary, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+        if name.startswith('iter_'):
+            return lambda *args, **kwargs: self._stream(name, args, kwargs)
+        if name.startswith('get_') and self.hedge and len(self._endpoints) > 1:
+            return lambda *args, **kwargs: self._hedged_read(name, args, kwargs)
+        return lambda *args, **kwargs: self._call_with_failover(name, args, kwargs)
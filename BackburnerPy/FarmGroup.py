@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from Monitor import Monitor
+
+def qualify(manager, handle):
+    """Returns the Manager-qualified form 'manager:handle' of a handle"""
+    return f'{manager}:{handle}'
+
+def unqualify(qualified_handle):
+    """Splits a Manager-qualified handle into a `(manager, handle)` tuple of strings"""
+    manager, separator, handle = qualified_handle.partition(':')
+    if not separator:
+        raise ValueError(f'Handle {qualified_handle} is not qualified with a Manager name')
+    return manager, handle
+
+@dataclass
+class FarmItem:
+    """Item of a merged result
+
+    Attributes:
+        manager (str): Name of the Manager the item came from
+        handle (str): Manager-qualified handle, see :func:`qualify`
+        item: The data class object returned by the Manager
+
+    """
+    manager: str
+    handle: str
+    item: object
+
+@dataclass
+class FarmView:
+    """Merged result of a request sent to every Manager of a :obj:`FarmGroup`
+
+    Attributes:
+        items (:obj:`list` of :obj:`FarmItem`)
+        errors (dict): Mapping of Manager name to a description of why it did not answer in time
+        elapsed (float): Seconds the whole request took
+
+    """
+    items: list = field(default_factory = list)
+    errors: dict = field(default_factory = dict)
+    elapsed: float = 0.0
+
+class _Member:
+    """A Manager of the group together with its session state"""
+
+    def __init__(self, name, manager_ip, manager_port, logging_level):
+        self.name = name
+        self.monitor = Monitor(manager_ip, manager_port, logging_level)
+        self.lock = threading.Lock()
+        self.connected = False
+
+class FarmGroup:
+    """Client for several independent Managers, queried concurrently
+
+    Every request is sent to all Managers at the same time and the answers are merged into one :obj:`FarmView` whose items
+    carry Manager-qualified handles such as 'paris:1256275308'. A Manager that does not answer within `timeout` is reported in
+    :attr:`FarmView.errors` instead of delaying the view, and its session is re-opened on the next request.
+
+    Example:
+
+        >>> farms = FarmGroup({'paris': ('10.0.0.2', 3234), 'tokyo': ('10.1.0.2', 3234)}, timeout = 2.0)
+        >>> view = farms.get_job_list()
+        >>> job = farms.get_job(view.items[0].handle)
+
+    Attributes:
+        members (dict): Mapping of Manager name to its session state
+        timeout (float): Seconds each Manager is given to answer a request
+
+    """
+
+    def __init__(self, managers, timeout = 5.0, logging_level = logging.INFO):
+        for name in managers:
+            if ':' in name:
+                raise ValueError(f'Manager name {name} may not contain ":"')
+        self.members = {name: _Member(name, ip, port, logging_level) for name, (ip, port) in managers.items()}
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers = max(1, 2 * len(self.members)), thread_name_prefix = 'FarmGroup')
+
+    def open_connection(self):
+        """Open a connection with every Manager. Managers that cannot be reached are retried on the next request
+
+        Returns:
+            A :obj:`dict` mapping the names of unreachable Managers to the error
+
+        """
+        return self._fan_out({name: lambda monitor: [] for name in self.members}).errors
+
+    def close_connection(self):
+        """Close the connection with every Manager"""
+        for member in self.members.values():
+            with member.lock:
+                self._disconnect(member)
+        self._executor.shutdown(wait = False)
+
+    def _disconnect(self, member):
+        if member.connected:
+            member.connected = False
+            try:
+                member.monitor.close_connection()
+            except OSError:
+                pass
+
+    def _run(self, member, request, deadline):
+        if not member.lock.acquire(timeout = max(0, deadline - time.monotonic())):
+            raise TimeoutError('Previous request is still running')
+        try:
+            with member.monitor.deadline(deadline - time.monotonic()):
+                if not member.connected:
+                    member.monitor.open_connection()
+                    member.connected = True
+                try:
+                    return request(member.monitor)
+                except BaseException:
+                    # The reply may still arrive later, so the session cannot be reused
+                    self._disconnect(member)
+                    raise
+        finally:
+            member.lock.release()
+
+    def _fan_out(self, requests):
+        """Run one request per Manager concurrently and merge the returned item lists
+
+        Args:
+            requests (dict): Mapping of Manager name to a callable taking its :obj:`Monitor` and returning a list of :obj:`FarmItem`
+
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        futures = {self._executor.submit(self._run, self.members[name], request, deadline): name for name, request in requests.items()}
+        done, pending = wait(futures, timeout = self.timeout)
+
+        view = FarmView()
+        for future, name in futures.items():
+            if future in pending:
+                view.errors[name] = 'Timed out'
+            elif future.exception() is not None:
+                logging.info(f'Manager {name} failed: {future.exception()!r}')
+                view.errors[name] = repr(future.exception())
+            else:
+                view.items.extend(future.result())
+        view.elapsed = time.monotonic() - start
+        return view
+
+    def _gather(self, method, handle_of):
+        """Call `method` on every Manager and wrap the returned items with qualified handles"""
+        def request_for(name):
+            def request(monitor):
+                result = getattr(monitor, method)()
+                items = result if isinstance(result, list) else [result]
+                return [FarmItem(name, name if handle_of is None else qualify(name, handle_of(item)), item) for item in items]
+            return request
+
+        return self._fan_out({name: request_for(name) for name in self.members})
+
+    def get_manager_info(self):
+        """Retrieve information on every Manager. Item handles are the Manager names"""
+        return self._gather('get_manager_info', None)
+
+    def get_server_list(self):
+        """Retrieve the merged server list of every Manager, items are :obj:`ServerListItem` objects"""
+        return self._gather('get_server_list', lambda item: item.handle)
+
+    def get_client_list(self):
+        """Retrieve the merged client list of every Manager, items are :obj:`Client` objects qualified by MAC address"""
+        return self._gather('get_client_list', lambda client: client.system_info.mac)
+
+    def get_job_handle_list(self):
+        """Retrieve the merged job handle list of every Manager, items are :obj:`JobHandleListItem` objects"""
+        return self._gather('get_job_handle_list', lambda item: item.handle)
+
+    def get_job_list(self):
+        """Retrieve the merged job list of every Manager, items are :obj:`JobListItem` objects"""
+        return self._gather('get_job_list', lambda item: item.handle)
+
+    def get_jobarchive(self):
+        """Retrieve the merged job archive list of every Manager, items are :obj:`JobArchiveListItem` objects"""
+        return self._gather('get_jobarchive', lambda item: item.handle)
+
+    def _one(self, qualified_handle, method):
+        name, handle = unqualify(qualified_handle)
+        if name not in self.members:
+            raise KeyError(f'Unknown Manager {name}')
+        deadline = time.monotonic() + self.timeout
+        return self._executor.submit(self._run, self.members[name], lambda monitor: getattr(monitor, method)(handle), deadline).result()
+
+    def get_server(self, qualified_handle):
+        """Retrieve information on a server identified by its Manager-qualified handle
+
+        Returns:
+            A :obj:`Server` data class object
+
+        """
+        return self._one(qualified_handle, 'get_server')
+
+    def get_job(self, qualified_handle):
+        """Retrieve information on a job identified by its Manager-qualified handle
+
+        Returns:
+            A :obj:`Job` data class object
+
+        """
+        return self._one(qualified_handle, 'get_job')
@@ -0,0 +1,304 @@
+"""Health scores of render nodes, updated on every poll
+
+Each node keeps a handful of signals, every one of them a single number updated in constant time and memory:
+
+- `packet_errors`: dropped and bad packets per hour, from the increase of the :obj:`NetworkStatus` counters
+- `rt_failed`: consecutive polls in which a job reported the node as failed, see :obj:`JobServer`
+- `slowdown`: task time relative to the other servers of the same jobs, all scaled by their `perf_index`
+- `perf_drift`: relative drop of the `perf_index` below its long term average
+- `workdisk_hours`: hours until the work disk is full at the rate it has been filling up, unknown while the Manager
+  reports no free space at all
+
+Rates and averages are :obj:`Estimator.Ewma` objects. A signal beyond its threshold, see :obj:`HealthThresholds`, is an
+anomaly, and the anomalies of the last `window` polls of a node are kept as the bits of one integer. A node is unhealthy once
+`min_anomalies` of those polls had an anomaly, so a single bad poll does not pull a node but a recurring one does.
+
+    >>> engine = HealthEngine()
+    >>> engine.update_from_inventory(inventory, catalogue, catalogue.refresh())
+    >>> [health.handle for health in engine.unhealthy()]
+"""
+import logging
+import statistics
+import time
+from dataclasses import dataclass, field
+
+from CapacityPlanner import popcount
+from Estimator import Ewma
+
+SIGNALS = ('packet_errors', 'rt_failed', 'slowdown', 'perf_drift', 'workdisk_hours')
+
+@dataclass
+class HealthThresholds:
+    """Values at which a signal is an anomaly
+
+    Attributes:
+        packet_errors (float): Dropped and bad packets per hour
+        rt_failed (int): Consecutive polls in which a job reported the node as failed
+        slowdown (float): Task time as a multiple of the median of the other servers of the job
+        perf_drift (float): Drop of the `perf_index` as a fraction of its long term average
+        workdisk_hours (float): Hours until the work disk is full
+        workdisk_space (int): Free work disk space, in the unit the Manager reports it
+
+    """
+    packet_errors: float = 100.0
+    rt_failed: int = 3
+    slowdown: float = 1.5
+    perf_drift: float = 0.2
+    workdisk_hours: float = 6.0
+    workdisk_space: int = 1024
+
+@dataclass
+class NodeHealth:
+    """Health of a node after its latest poll
+
+    Attributes:
+        handle (str): Server handle
+        score (float): Between 0.0 (failing) and 1.0 (healthy)
+        signals (dict): Mapping of signal name to its current value, `None` while unknown
+        anomalies (:obj:`list` of str): Signals beyond their thresholds in the latest poll
+        anomaly_polls (int): Polls with an anomaly within the window
+        unhealthy (bool): Whether `anomaly_polls` reached `min_anomalies`
+
+    """
+    handle: str
+    score: float
+    signals: dict = field(default_factory = dict)
+    anomalies: list = field(default_factory = list)
+    anomaly_polls: int = 0
+    unhealthy: bool = False
+
+class _NodeState:
+    """Signals of one node"""
+
+    def __init__(self, time_constant, baseline_time_constant):
+        self.time = None
+        self.boot_time = None
+        self.packets = None
+        self.packet_errors = Ewma(time_constant)
+        self.rt_failed = 0
+        self.slowdown = Ewma(time_constant)
+        self.slowdown_time = None
+        # Job observations since the last server poll, applied once per poll by HealthEngine.update_server
+        self.failed = None
+        self.slowdown_sum = 0.0
+        self.slowdown_count = 0
+        self.perf_index = None
+        self.perf_baseline = Ewma(baseline_time_constant)
+        self.workdisk_space = None
+        self.workdisk_rate = Ewma(time_constant)
+        self.history = 0
+        self.health = None
+
+class HealthEngine:
+    """Scores render nodes from successive :meth:`Monitor.get_server` and :meth:`Monitor.get_job` results
+
+    Job polls collect evidence for the `rt_failed` and `slowdown` signals of their servers. Server polls combine the evidence
+    of all jobs since the previous server poll into one sample per node, feed the other signals and score the node. The cost of a poll is constant per node and per server of a job, so a farm of thousands of nodes can be scored on
+    every poll.
+
+    Attributes:
+        thresholds (:obj:`HealthThresholds`)
+        window (int): Number of polls of a node that are considered
+        min_anomalies (int): Polls with an anomaly within the window that make a node unhealthy
+        time_constant (float): Seconds over which rates and task times are averaged
+        baseline_time_constant (float): Seconds over which the `perf_index` baseline is averaged
+        min_peers (int): Servers of a job with rendered tasks needed to compare their task times
+
+    """
+
+    def __init__(self, thresholds = None, window = 10, min_anomalies = 3, time_constant = 600.0, baseline_time_constant = 86400.0, min_peers = 3):
+        self.thresholds = thresholds or HealthThresholds()
+        self.window = window
+        self.min_anomalies = min_anomalies
+        self.time_constant = time_constant
+        self.baseline_time_constant = baseline_time_constant
+        self.min_peers = min_peers
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _node(self, handle):
+        state = self._nodes.get(handle)
+        if state is None:
+            state = self._nodes[handle] = _NodeState(self.time_constant, self.baseline_time_constant)
+        return state
+
+    def update_job(self, job):
+        """Feed the latest details of a job to the nodes rendering it, they take effect with the next :meth:`update_server`
+
+        Args:
+            job (:obj:`Job`): Job details as returned by :meth:`Monitor.get_job`
+
+        """
+        scaled = {}
+        for server in job.servers:
+            state = self._node(server.handle)
+            state.failed = bool(state.failed) or server.rt_failed
+            if server.task_total > 0 and server.task_time > 0:
+                # Task times are scaled to a perf_index of 1.0, so that nodes are not flagged for being as slow as expected
+                scaled[server.handle] = server.task_time * (state.perf_index or 1.0)
+
+        if len(scaled) < self.min_peers:
+            return
+        median = statistics.median(scaled.values())
+        if median <= 0:
+            return
+        for handle, task_time in scaled.items():
+            state = self._nodes[handle]
+            state.slowdown_sum += task_time / median
+            state.slowdown_count += 1
+
+    def _apply_jobs(self, state, now):
+        """Turn the job observations since the previous server poll into one sample per signal"""
+        if state.failed is not None:
+            state.rt_failed = state.rt_failed + 1 if state.failed else 0
+            state.failed = None
+        if state.slowdown_count:
+            elapsed = now - state.slowdown_time if state.slowdown_time is not None else 0.0
+            state.slowdown.update(state.slowdown_sum / state.slowdown_count, elapsed)
+            state.slowdown_time = now
+            state.slowdown_sum, state.slowdown_count = 0.0, 0
+
+    def update_server(self, handle, server, now = None):
+        """Feed the latest details of a server and score it
+
+        Args:
+            handle (str): The server handle
+            server (:obj:`Server`): Server details as returned by :meth:`Monitor.get_server`
+            now (float): Time the server was fetched, as returned by `time.time()`. Defaults to the current time
+
+        Returns:
+            A :obj:`NodeHealth` object
+
+        """
+        now = time.time() if now is None else now
+        state = self._node(handle)
+        network = server.network_status
+        packets = network.dropped_packets + network.bad_packets
+        elapsed = now - state.time if state.time is not None else 0.0
+
+        if state.packets is None or network.boot_time != state.boot_time or packets < state.packets:
+            # First poll, or the counters restarted with the server
+            state.packets = packets
+            state.boot_time = network.boot_time
+        elif elapsed > 0:
+            state.packet_errors.update((packets - state.packets) * 3600.0 / elapsed, elapsed)
+            state.packets = packets
+
+        if server.perf_index > 0:
+            state.perf_index = server.perf_index
+            state.perf_baseline.update(server.perf_index, elapsed)
+
+        space = server.hw_info.workdisk_space
+        if not space or space < 0:
+            # Not reported, no signal rather than a full disk
+            space = None
+        elif state.workdisk_space is not None and elapsed > 0:
+            # Only filling up counts, space that is freed resets the rate faster than the average would
+            state.workdisk_rate.update(max(0.0, (state.workdisk_space - space) * 3600.0 / elapsed), elapsed)
+        state.workdisk_space = space
+        state.time = now
+        self._apply_jobs(state, now)
+
+        state.health = self._score(handle, state)
+        return state.health
+
+    def _signals(self, state):
+        baseline = state.perf_baseline.value
+        rate = state.workdisk_rate.value
+        return {
+            'packet_errors': state.packet_errors.value,
+            'rt_failed': state.rt_failed,
+            'slowdown': state.slowdown.value,
+            'perf_drift': max(0.0, 1.0 - state.perf_index / baseline) if baseline and state.perf_index else None,
+            'workdisk_hours': state.workdisk_space / rate if rate and state.workdisk_space is not None else None,
+        }
+
+    def _severities(self, state, signals):
+        """Returns the signals as fractions of their thresholds, 1.0 and above are anomalies"""
+        thresholds = self.thresholds
+        severities = {}
+        for name in ('packet_errors', 'rt_failed', 'perf_drift'):
+            value = signals[name]
+            if value is not None:
+                severities[name] = value / getattr(thresholds, name)
+        if signals['slowdown'] is not None:
+            # A slowdown of 1.0 is the norm
+            severities['slowdown'] = max(0.0, signals['slowdown'] - 1.0) / (thresholds.slowdown - 1.0)
+        hours = signals['workdisk_hours']
+        space = state.workdisk_space
+        if space is not None:
+            severities['workdisk_hours'] = max(thresholds.workdisk_hours / hours if hours else 0.0, thresholds.workdisk_space / space)
+        return severities
+
+    def _score(self, handle, state):
+        signals = self._signals(state)
+        severities = self._severities(state, signals)
+        anomalies = [name for name in SIGNALS if severities.get(name, 0.0) >= 1.0]
+        state.history = (state.history << 1 | bool(anomalies)) & ((1 << self.window) - 1)
+        anomaly_polls = popcount(state.history)
+        # Half of the score is the worst signal right now, the other half how often the node was anomalous recently
+        worst = min(1.0, max(severities.values(), default = 0.0))
+        score = 1.0 - worst / 2.0 - anomaly_polls / self.window / 2.0
+        return NodeHealth(handle, score, signals, anomalies, anomaly_polls, anomaly_polls >= self.min_anomalies)
+
+    def update(self, servers, jobs = (), now = None):
+        """Feed one poll of the farm and score every polled server
+
+        Args:
+            servers (dict): Mapping of server handle to :obj:`Server`
+            jobs: Iterable of :obj:`Job` objects polled at the same time
+
+        Returns:
+            A :obj:`dict` mapping server handles to their new :obj:`NodeHealth`
+
+        """
+        now = time.time() if now is None else now
+        for job in jobs:
+            self.update_job(job)
+        result = {handle: self.update_server(handle, server, now) for handle, server in servers.items()}
+        unhealthy = sum(health.unhealthy for health in result.values())
+        if unhealthy:
+            logging.info(f'{unhealthy} of {len(result)} nodes are unhealthy')
+        return result
+
+    def update_from_inventory(self, inventory, catalogue = None, changes = None, now = None):
+        """Score every server of a :obj:`ServerInventory`, feeding the jobs a :meth:`JobCatalogue.refresh` re-fetched first
+
+        Refresh the inventory with `full = True` before, or the counters of servers whose state did not change are only
+        re-fetched every :attr:`ServerInventory.max_age` seconds and their rates are taken as zero in between. Jobs that were not re-fetched are not fed again, so refresh active jobs
+        with `refetch_states = (BDC.JOBSTATE_ACTIVE,)` to keep their evidence current.
+
+        Args:
+            inventory (:obj:`ServerInventory`)
+            catalogue (:obj:`JobCatalogue`)
+            changes (:obj:`TableChanges`): The changes returned by the catalogue refresh, only its added and updated jobs
+                are fed
+
+        Returns:
+            A :obj:`dict` mapping server handles to their new :obj:`NodeHealth`
+
+        """
+        jobs = []
+        if catalogue is not None and changes is not None:
+            records = (catalogue.get_job(handle) for handle in changes.added + changes.updated)
+            jobs = [record.job for record in records if record is not None]
+        result = self.update({handle: record.server for handle, record in inventory.servers.rows.items()}, jobs, now)
+        for handle in [handle for handle in self._nodes if handle not in inventory.servers.rows]:
+            self.forget(handle)
+        return result
+
+    def health(self, handle):
+        """Returns the latest :obj:`NodeHealth` of a node, or `None` if it was never scored"""
+        state = self._nodes.get(handle)
+        return state.health if state is not None else None
+
+    def unhealthy(self):
+        """Returns the :obj:`NodeHealth` of the unhealthy nodes, worst first"""
+        found = [state.health for state in self._nodes.values() if state.health is not None and state.health.unhealthy]
+        return sorted(found, key = lambda health: health.score)
+
+    def forget(self, handle):
+        """Drop the signals of a node, e.g. once it left the farm"""
+        self._nodes.pop(handle, None)
@@ -0,0 +1,286 @@
+import bisect
+
+_EMPTY = frozenset()
+
+class HashIndex:
+    """Equality index mapping a key to the set of primary keys holding it
+
+    Attributes:
+        key (callable): Function extracting the indexed value from a row. Rows for which it returns `None` are not indexed.
+
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._buckets = {}
+
+    def add(self, pk, row):
+        value = self.key(row)
+        if value is not None:
+            self._buckets.setdefault(value, set()).add(pk)
+
+    def remove(self, pk, row):
+        value = self.key(row)
+        if value is None:
+            return
+        bucket = self._buckets.get(value)
+        if bucket is not None:
+            bucket.discard(pk)
+            if not bucket:
+                del self._buckets[value]
+
+    def lookup(self, value):
+        """Returns the :obj:`frozenset` of primary keys whose indexed value equals `value`"""
+        return frozenset(self._buckets.get(value, ()))
+
+    def _bucket(self, value):
+        """Like :meth:`lookup`, but returns the index's own set without copying it. Callers must not modify it"""
+        return self._buckets.get(value, _EMPTY)
+
+    def values(self):
+        """Returns the distinct indexed values"""
+        return self._buckets.keys()
+
+class RangeIndex:
+    """Ordered index over a comparable value, supporting range scans
+
+    Entries are kept as a sorted list of `(value, primary key)` tuples, so primary keys of one table have to be mutually comparable.
+
+    Attributes:
+        key (callable): Function extracting the indexed value from a row. Rows for which it returns `None` are not part of any
+            range, they are only kept in primary key order for :meth:`scan`.
+
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._entries = []
+        self._missing = []
+
+    def add(self, pk, row):
+        value = self.key(row)
+        if value is not None:
+            bisect.insort(self._entries, (value, pk))
+        else:
+            bisect.insort(self._missing, pk)
+
+    def remove(self, pk, row):
+        value = self.key(row)
+        entries, entry = (self._missing, pk) if value is None else (self._entries, (value, pk))
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def _bounds(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self._entries, (low,))
+        end = len(self._entries) if high is None else self._upper(high, start)
+        return start, end
+
+    def _upper(self, high, start):
+        # Primary keys may be of any comparable type, so bisect on the value alone
+        lo, hi = start, len(self._entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entries[mid][0] <= high:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, low = None, high = None):
+        """Returns the set of primary keys whose indexed value lies within `low` and `high` (both inclusive, `None` is unbounded)"""
+        start, end = self._bounds(low, high)
+        return {pk for _, pk in self._entries[start:end]}
+
+    def scan(self, low = None, high = None, reverse = False, missing = False):
+        """Yields primary keys in index order, optionally restricted to a range
+
+        Args:
+            missing (bool): Yield the primary keys of rows without a value afterwards, in primary key order even when
+                `reverse` is set. Ignored when a bound is given
+
+        """
+        start, end = self._bounds(low, high)
+        indices = range(end - 1, start - 1, -1) if reverse else range(start, end)
+        for i in indices:
+            yield self._entries[i][1]
+        if missing and low is None and high is None:
+            yield from self._missing
+
+class Table:
+    """In-memory table of rows keyed by a primary key, with secondary indexes that are maintained on every write
+
+    Args:
+        hash_indexes (dict): Mapping of index name to key function for equality lookups
+        range_indexes (dict): Mapping of index name to key function for range lookups and ordered scans
+
+    """
+
+    def __init__(self, hash_indexes = None, range_indexes = None):
+        self.rows = {}
+        self.hash_indexes = {name: HashIndex(key) for name, key in (hash_indexes or {}).items()}
+        self.range_indexes = {name: RangeIndex(key) for name, key in (range_indexes or {}).items()}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, pk):
+        return pk in self.rows
+
+    def get(self, pk, default = None):
+        return self.rows.get(pk, default)
+
+    def _indexes(self):
+        yield from self.hash_indexes.values()
+        yield from self.range_indexes.values()
+
+    def upsert(self, pk, row):
+        """Insert or replace a row, updating only the index entries of that row"""
+        old = self.rows.get(pk)
+        if old is not None:
+            for index in self._indexes():
+                index.remove(pk, old)
+        self.rows[pk] = row
+        for index in self._indexes():
+            index.add(pk, row)
+
+    def remove(self, pk):
+        """Remove a row if present and return it"""
+        old = self.rows.pop(pk, None)
+        if old is not None:
+            for index in self._indexes():
+                index.remove(pk, old)
+        return old
+
+    def _candidates(self, where, ranges):
+        """Returns the set of primary keys matching all indexed conditions, or `None` if there are none"""
+        sets = []
+        for name, value in where.items():
+            index = self.hash_indexes[name]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                matched = set()
+                for item in value:
+                    matched |= index._bucket(item)
+                sets.append(matched)
+            else:
+                sets.append(index._bucket(value))
+        for name, (low, high) in ranges.items():
+            sets.append(self.range_indexes[name].range(low, high))
+
+        if not sets:
+            return None
+        sets.sort(key = len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            if not result:
+                break
+            result &= other
+        return result
+
+    def count(self, where):
+        """Returns the number of rows matching all given hash index values"""
+        candidates = self._candidates(where, {})
+        return len(self.rows) if candidates is None else len(candidates)
+
+    def query(self, where = None, ranges = None, predicate = None, order_by = None, reverse = False, limit = None):
+        """Query rows using the table's indexes
+
+        Args:
+            where (dict): Mapping of hash index name to a value, or to a collection of accepted values
+            ranges (dict): Mapping of range index name to a `(low, high)` tuple, both inclusive. Use `None` for an open bound
+            predicate (callable): Optional extra filter applied to each candidate row
+            order_by (str or callable): Range index name or key function to sort by
+            reverse (bool): Sort in descending order
+            limit (int): Maximum number of rows to return
+
+        Returns:
+            A :obj:`list` of matching rows
+
+        """
+        where = where or {}
+        ranges = ranges or {}
+        for name in where:
+            if name not in self.hash_indexes:
+                raise KeyError(f'No hash index named {name}')
+        for name in ranges:
+            if name not in self.range_indexes:
+                raise KeyError(f'No range index named {name}')
+
+        candidates = self._candidates(where, ranges)
+
+        # Ordering by an indexed value with a limit: walk the index and stop as soon as the limit is reached.
+        # Small candidate sets are cheaper to sort directly.
+        walk_index = isinstance(order_by, str) and order_by in self.range_indexes
+        if walk_index and limit is not None and (candidates is None or len(candidates) * 4 > len(self.rows)):
+            result = []
+            for pk in self.range_indexes[order_by].scan(reverse = reverse, missing = True):
+                if candidates is not None and pk not in candidates:
+                    continue
+                row = self.rows[pk]
+                if predicate is not None and not predicate(row):
+                    continue
+                result.append(row)
+                if limit is not None and len(result) >= limit:
+                    break
+            return result
+
+        pks = self.rows.keys() if candidates is None else candidates
+        if predicate is not None:
+            pks = [pk for pk in pks if predicate(self.rows[pk])]
+
+        if isinstance(order_by, str):
+            rows = self._sorted_by_index(order_by, pks, reverse)
+        else:
+            rows = [self.rows[pk] for pk in pks]
+            if order_by is not None:
+                rows.sort(key = order_by, reverse = reverse)
+
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
+
+    def _sorted_by_index(self, name, pks, reverse):
+        """Sort rows like a walk of the index `name`: rows without a value come last, whatever the direction
+
+        For range indexes ties and rows without a value are ordered by primary key, exactly as :meth:`RangeIndex.scan`.
+
+        """
+        if name in self.range_indexes:
+            key = self.range_indexes[name].key
+            present, missing = [], []
+            for pk in pks:
+                value = key(self.rows[pk])
+                if value is None:
+                    missing.append(pk)
+                else:
+                    present.append((value, pk))
+            present.sort(reverse = reverse)
+            missing.sort()
+            return [self.rows[pk] for _, pk in present] + [self.rows[pk] for pk in missing]
+        if name not in self.hash_indexes:
+            raise KeyError(f'No index named {name}')
+        key = self.hash_indexes[name].key
+        rows = [self.rows[pk] for pk in pks]
+        present = sorted((row for row in rows if key(row) is not None), key = key, reverse = reverse)
+        return present + [row for row in rows if key(row) is None]
+
+class TableChanges:
+    """Primary keys touched by a refresh of a :obj:`Table`
+
+    Attributes:
+        added (:obj:`list`): Primary keys of new rows
+        updated (:obj:`list`): Primary keys of rows whose content changed
+        removed (:obj:`list`): Primary keys of rows that disappeared
+
+    """
+
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.removed = []
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.removed)
+
+    def __repr__(self):
+        return f'TableChanges(added={self.added}, updated={self.updated}, removed={self.removed})'
@@ -0,0 +1,191 @@
+import logging
+import time
+from dataclasses import dataclass
+
+import BackburnerDataClasses as BDC
+from Diff import same
+from Indexes import Table, TableChanges
+
+@dataclass
+class ServerRecord:
+    """Server entry in the inventory
+
+    Attributes:
+        handle (str)
+        state (int): State as reported by the server list
+        server (:obj:`Server`): Server details as returned by :meth:`Monitor.get_server`
+
+    """
+    handle: str
+    state: int
+    server: BDC.Server
+
+SERVER_HASH_INDEXES = {
+    'name': lambda record: record.server.name,
+    'handle': lambda record: record.handle,
+    'ip_address': lambda record: record.server.ip_address,
+    'mac': lambda record: record.server.hw_info.mac,
+    'current_status': lambda record: record.server.current_status,
+}
+
+SERVER_RANGE_INDEXES = {
+    'num_cpus': lambda record: record.server.hw_info.num_cpus,
+    'total_memory': lambda record: record.server.hw_info.total_memory,
+    'perf_index': lambda record: record.server.perf_index,
+}
+
+CLIENT_HASH_INDEXES = {
+    'name': lambda client: client.system_info.computer_name,
+    'ip_address': lambda client: client.system_info.ip_address,
+    'mac': lambda client: client.system_info.mac,
+}
+
+CLIENT_RANGE_INDEXES = {
+    'num_cpus': lambda client: client.system_info.num_cpus,
+    'total_memory': lambda client: client.system_info.total_memory,
+}
+
+class ServerInventory:
+    """Indexed, incrementally refreshed view of a Manager's servers and clients
+
+    Servers are keyed by handle and clients by MAC address. Both tables carry hash indexes for exact lookups and range indexes
+    for numeric filters and ordering, see :meth:`query_servers` and :meth:`query_clients`.
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor with an open connection to the Manager
+        servers (:obj:`Table`): :obj:`ServerRecord` rows keyed by server handle
+        clients (:obj:`Table`): :obj:`Client` rows keyed by MAC address
+        max_age (float): Seconds after which the details of a server are re-fetched even if its state did not change, or
+            `None` to only re-fetch them on a state change
+
+    """
+
+    def __init__(self, monitor, max_age = 300.0):
+        self.monitor = monitor
+        self.max_age = max_age
+        self.servers = Table(SERVER_HASH_INDEXES, SERVER_RANGE_INDEXES)
+        self.clients = Table(CLIENT_HASH_INDEXES, CLIENT_RANGE_INDEXES)
+        self._fetched = {}
+
+    def refresh_servers(self, full = False):
+        """Synchronise the server table with the Manager
+
+        The server list is fetched first, and :meth:`Monitor.get_server` is only called for servers that are new, whose
+        state or name changed since the previous refresh, or whose details are older than `max_age`. The server list does
+        not report the work disk space or the `perf_index`, so `max_age` bounds how stale those are.
+
+        Args:
+            full (bool): Re-fetch the details of every server, changed or not
+
+        Returns:
+            A :obj:`TableChanges` object listing the affected handles
+
+        """
+        changes = TableChanges()
+        seen = set()
+        now = time.monotonic()
+
+        for item in self.monitor.get_server_list():
+            seen.add(item.handle)
+            record = self.servers.get(item.handle)
+            # Rows filled elsewhere, e.g. by a WarmStart file, age from the first refresh that sees them
+            fetched = self._fetched.setdefault(item.handle, now)
+            expired = self.max_age is not None and now - fetched >= self.max_age
+            if record is not None and not full and not expired and record.state == item.state and record.server.name == item.name:
+                continue
+
+            server = self.monitor.get_server(item.handle)
+            self._fetched[item.handle] = now
+            if record is not None and same(record.server, server) and record.state == item.state:
+                continue
+            self.servers.upsert(item.handle, ServerRecord(item.handle, item.state, server))
+            (changes.updated if record is not None else changes.added).append(item.handle)
+
+        for handle in [handle for handle in self.servers.rows if handle not in seen]:
+            self.servers.remove(handle)
+            changes.removed.append(handle)
+        for handle in [handle for handle in self._fetched if handle not in seen]:
+            del self._fetched[handle]
+
+        logging.debug(f'Server inventory refreshed: {changes}')
+        return changes
+
+    def refresh_clients(self):
+        """Synchronise the client table with the Manager
+
+        Returns:
+            A :obj:`TableChanges` object listing the affected MAC addresses
+
+        """
+        changes = TableChanges()
+        seen = set()
+
+        for client in self.monitor.get_client_list():
+            mac = client.system_info.mac
+            seen.add(mac)
+            old = self.clients.get(mac)
+            if old == client:
+                continue
+            self.clients.upsert(mac, client)
+            (changes.updated if old is not None else changes.added).append(mac)
+
+        for mac in [mac for mac in self.clients.rows if mac not in seen]:
+            self.clients.remove(mac)
+            changes.removed.append(mac)
+
+        logging.debug(f'Client inventory refreshed: {changes}')
+        return changes
+
+    def refresh(self, full = False):
+        """Synchronise both servers and clients
+
+        Returns:
+            A two element tuple of :obj:`TableChanges` for servers and clients
+
+        """
+        return (self.refresh_servers(full), self.refresh_clients())
+
+    def get_server(self, handle):
+        """Returns the :obj:`ServerRecord` for `handle`, or `None`"""
+        return self.servers.get(handle)
+
+    def find_servers(self, **where):
+        """Returns the :obj:`ServerRecord` objects matching all given hash index values, e.g. `find_servers(name='node01')`"""
+        return self.servers.query(where = where)
+
+    def find_server(self, **where):
+        """Returns a single :obj:`ServerRecord` matching all given hash index values, or `None`"""
+        found = self.servers.query(where = where, limit = 1)
+        return found[0] if found else None
+
+    def query_servers(self, where = None, ranges = None, predicate = None, order_by = None, reverse = False, limit = None):
+        """Query servers, e.g. the ten fastest idle nodes with at least 16 cores:
+
+        >>> inventory.query_servers(where={'current_status': 1}, ranges={'num_cpus': (16, None)}, order_by='perf_index', reverse=True, limit=10)
+
+        Hash indexes: `name`, `handle`, `ip_address`, `mac`, `current_status`.
+        Range indexes: `num_cpus`, `total_memory`, `perf_index`.
+        See :meth:`Table.query` for the meaning of the arguments.
+
+        Returns:
+            A :obj:`list` of :obj:`ServerRecord` objects
+
+        """
+        return self.servers.query(where, ranges, predicate, order_by, reverse, limit)
+
+    def find_clients(self, **where):
+        """Returns the :obj:`Client` objects matching all given hash index values"""
+        return self.clients.query(where = where)
+
+    def query_clients(self, where = None, ranges = None, predicate = None, order_by = None, reverse = False, limit = None):
+        """Query clients
+
+        Hash indexes: `name`, `ip_address`, `mac`.
+        Range indexes: `num_cpus`, `total_memory`.
+        See :meth:`Table.query` for the meaning of the arguments.
+
+        Returns:
+            A :obj:`list` of :obj:`Client` objects
+
+        """
+        return self.clients.query(where, ranges, predicate, order_by, reverse, limit)
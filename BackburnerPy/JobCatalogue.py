@@ -0,0 +1,197 @@
+import logging
+from dataclasses import dataclass
+
+import BackburnerDataClasses as BDC
+from Diff import same
+from Indexes import Table, TableChanges
+
+@dataclass
+class JobRecord:
+    """Job entry in the catalogue
+
+    Attributes:
+        handle (int)
+        state (int): State as reported by the job list
+        name (str)
+        job (:obj:`Job`): Job details as returned by :meth:`Monitor.get_job`
+
+    """
+    handle: int
+    state: int
+    name: str
+    job: BDC.Job
+
+JOB_HASH_INDEXES = {
+    'state': lambda record: record.state,
+    'user': lambda record: record.job.info.user,
+    'priority': lambda record: record.job.info.priority,
+    'plugin_name': lambda record: record.job.plugin.plugin_name,
+    'active': lambda record: record.job.flags.active,
+    'complete': lambda record: record.job.flags.complete,
+}
+
+JOB_RANGE_INDEXES = {
+    'priority': lambda record: record.job.info.priority,
+    'submitted': lambda record: record.job.info.submitted,
+}
+
+class JobCatalogue:
+    """Indexed, incrementally refreshed view of a Manager's jobs
+
+    Jobs are keyed by their integer handle. Hash indexes: `state`, `user`, `priority`, `plugin_name`, `active`, `complete`.
+    Range indexes: `priority`, `submitted`.
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor with an open connection to the Manager
+        jobs (:obj:`Table`): :obj:`JobRecord` rows keyed by job handle
+
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.jobs = Table(JOB_HASH_INDEXES, JOB_RANGE_INDEXES)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def refresh(self, full = False, refetch_states = ()):
+        """Synchronise the catalogue with the Manager
+
+        The job list is fetched first, and :meth:`Monitor.get_job` is only called for jobs that are new or whose state or
+        name changed since the previous refresh. The job list does not report progress, so jobs whose details change without a
+        state change (e.g. `tasks_completed` of running jobs) are only re-fetched when their state is in `refetch_states`.
+
+        Args:
+            full (bool): Re-fetch the details of every job
+            refetch_states (:obj:`tuple` of int): Job states whose details are always re-fetched, e.g. `(BDC.JOBSTATE_ACTIVE,)`
+
+        Returns:
+            A :obj:`TableChanges` object listing the affected handles
+
+        """
+        changes = TableChanges()
+        seen = set()
+
+        for item in self.monitor.get_job_list():
+            seen.add(item.handle)
+            record = self.jobs.get(item.handle)
+            unchanged = record is not None and record.state == item.state and record.name == item.name
+            if unchanged and not full and item.state not in refetch_states:
+                continue
+
+            job = self.monitor.get_job(str(item.handle))
+            if unchanged and same(record.job, job):
+                continue
+            self.jobs.upsert(item.handle, JobRecord(item.handle, item.state, item.name, job))
+            (changes.updated if record is not None else changes.added).append(item.handle)
+
+        for handle in [handle for handle in self.jobs.rows if handle not in seen]:
+            self.jobs.remove(handle)
+            changes.removed.append(handle)
+
+        logging.debug(f'Job catalogue refreshed: {changes}')
+        return changes
+
+    def revalidate(self, refetch_states = ()):
+        """Check catalogued jobs against the job handle list, e.g. after loading them from a :obj:`WarmStart` file
+
+        'get jobhlist' only reports handles and states, which makes it the cheapest way to find out which catalogued jobs
+        are still current. :meth:`Monitor.get_job` is only called for jobs that are new, whose state changed, or whose state
+        is in `refetch_states`.
+
+        Args:
+            refetch_states (:obj:`tuple` of int): Job states whose details are always re-fetched
+
+        Returns:
+            A :obj:`TableChanges` object listing the affected handles
+
+        """
+        changes = TableChanges()
+        seen = set()
+
+        for item in self.monitor.get_job_handle_list():
+            seen.add(item.handle)
+            record = self.jobs.get(item.handle)
+            if record is not None and record.state == item.state and item.state not in refetch_states:
+                continue
+
+            job = self.monitor.get_job(str(item.handle))
+            if record is not None and record.state == item.state and same(record.job, job):
+                continue
+            self.jobs.upsert(item.handle, JobRecord(item.handle, item.state, job.info.name, job))
+            (changes.updated if record is not None else changes.added).append(item.handle)
+
+        for handle in [handle for handle in self.jobs.rows if handle not in seen]:
+            self.jobs.remove(handle)
+            changes.removed.append(handle)
+
+        logging.debug(f'Job catalogue revalidated: {changes}')
+        return changes
+
+    def update_job(self, handle, state, job):
+        """Store a job fetched elsewhere, e.g. after a :meth:`Monitor.set_jobstate`
+
+        Returns:
+            `True` if the catalogue changed
+
+        """
+        record = self.jobs.get(handle)
+        if record is not None and record.state == state and same(record.job, job):
+            return False
+        self.jobs.upsert(handle, JobRecord(handle, state, job.info.name, job))
+        return True
+
+    def get_job(self, handle):
+        """Returns the :obj:`JobRecord` for `handle`, or `None`"""
+        return self.jobs.get(handle)
+
+    def find_jobs(self, **where):
+        """Returns the :obj:`JobRecord` objects matching all given hash index values, e.g. `find_jobs(user='alice', state=2)`"""
+        return self.jobs.query(where = where)
+
+    def query(self, where = None, ranges = None, predicate = None, order_by = None, reverse = False, limit = None):
+        """Query jobs, e.g. the five lowest priority values among one user's unfinished jobs:
+
+        >>> catalogue.query(where={'user': 'alice', 'complete': False}, order_by='priority', limit=5)
+
+        See :meth:`Table.query` for the meaning of the arguments.
+
+        Returns:
+            A :obj:`list` of :obj:`JobRecord` objects
+
+        """
+        return self.jobs.query(where, ranges, predicate, order_by, reverse, limit)
+
+    def active_jobs(self, user = None, limit = None):
+        """Returns active jobs ordered by priority, optionally restricted to one user
+
+        Backburner runs lower priority values first, so the list starts with the job that is served first.
+
+        Returns:
+            A :obj:`list` of :obj:`JobRecord` objects
+
+        """
+        where = {'active': True}
+        if user is not None:
+            where['user'] = user
+        return self.jobs.query(where = where, order_by = 'priority', limit = limit)
+
+    def jobs_in_state(self, state, user = None, order_by = 'priority', limit = None):
+        """Returns the jobs in `state`, optionally restricted to one user, ordered by `order_by`
+
+        Returns:
+            A :obj:`list` of :obj:`JobRecord` objects
+
+        """
+        where = {'state': state}
+        if user is not None:
+            where['user'] = user
+        return self.jobs.query(where = where, order_by = order_by, limit = limit)
+
+    def users(self):
+        """Returns the distinct users that own catalogued jobs"""
+        return set(self.jobs.hash_indexes['user'].values())
+
+    def count(self, **where):
+        """Returns the number of jobs matching all given hash index values"""
+        return self.jobs.count(where)
@@ -1,9 +1,33 @@
+import contextlib
 import logging
 import socket
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 import BackburnerDataClasses as BDC
 
+class ControllerError(Exception):
+    """Raised when the Manager refuses controller status, see :meth:`Monitor.del_controller`"""
+
+class _Deadline:
+    """Context manager installing a deadline on a :obj:`Monitor`, see :meth:`Monitor.deadline`"""
+
+    def __init__(self, monitor, seconds):
+        self.monitor = monitor
+        self.seconds = seconds
+
+    def __enter__(self):
+        self.previous = self.monitor._deadline
+        deadline = time.monotonic() + self.seconds
+        # Nested deadlines can only shorten the outer one
+        self.monitor._deadline = deadline if self.previous is None else min(deadline, self.previous)
+        return self.monitor
+
+    def __exit__(self, *exc_info):
+        self.monitor._deadline = self.previous
+        return False
+
 class Monitor:
     """API class that emulates Backburner Monitor behaviour
 
@@ -14,10 +38,11 @@ class Monitor:
         MANAGER_IP (str): Manager IP address
         MANAGER_PORT (int): Manager TCP port
         logging_level (int): Verbosity log level. Defaults to `logging.INFO`. Other options include `logging.DEBUG`. See documentation of Python module `logging` for more information. 
+        timeout (float): Socket timeout in seconds for every send and receive. Defaults to `None`, which waits forever.
 
     """
 
-    def __init__(self, _manager_ip, _manager_port, _debug = logging.INFO):
+    def __init__(self, _manager_ip, _manager_port, _debug = logging.INFO, _timeout = None):
         """Creates an instance of the Manager class
 
         This class contains the API to interact with Backburner Manager instances by 
@@ -26,11 +51,14 @@ class Monitor:
         Args:
             _manager_ip (str): Backburner Manager IP address
             _manager_port (:obj:`int`): Backburner Manager TCP port
+            _timeout (float): Socket timeout in seconds, `None` to wait forever
 
         """
         self.MANAGER_IP = _manager_ip
         self.MANAGER_PORT = _manager_port
         self.logging_level = _debug
+        self.timeout = _timeout
+        self._local = threading.local()
 
         logging.basicConfig(level = self.logging_level)
 
@@ -42,27 +70,85 @@ class Monitor:
             2) "backburner>" or 'backburner(Controller)>'
         """
         self.session = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.session.connect((self.MANAGER_IP, self.MANAGER_PORT))
-
-        # On opening connection, if received message is incorrect, close connection
-        data = self.session.recv(29)
-        logging.info(data.decode("utf-8"))
-        if(data.decode("utf-8") != "250 backburner 1.0 Ready.\r\n"):
-            logging.info("Incorrect response. Closing connection!")
-            self.close_connection()
-        else:
-            data = self.session.recv(23)
+        try:
+            self.session.settimeout(self._remaining())
+            self.session.connect((self.MANAGER_IP, self.MANAGER_PORT))
+            self.session.settimeout(self.timeout)
+            self._buffer = b''
+
+            # On opening connection, if received message is incorrect, close connection
+            data = self._receive_until(b'\r\n')
             logging.info(data.decode("utf-8"))
-
-            if(data.decode("utf-8") != "backburner>" and data.decode("utf-8") != 'backburner(Controller)>'):
-                logging.info("Incorrect console initialisation. Closing connection!")
+            if(data.decode("utf-8") != "250 backburner 1.0 Ready.\r\n"):
+                logging.info("Incorrect response. Closing connection!")
                 self.close_connection()
+            else:
+                data = self._receive_until(b'>')
+                logging.info(data.decode("utf-8"))
+
+                if(data.decode("utf-8") != "backburner>" and data.decode("utf-8") != 'backburner(Controller)>'):
+                    logging.info("Incorrect console initialisation. Closing connection!")
+                    self.close_connection()
+        except BaseException:
+            # A refused or reset connection would otherwise leave the socket open
+            self.session.close()
+            raise
 
     def close_connection(self):
         """Close connection with the Backburner Manager"""
         logging.info('Connection to manager closed')
         self.session.close()
 
+    @property
+    def _deadline(self):
+        """Deadline of the calling thread as a :func:`time.monotonic` value, or `None`"""
+        return getattr(self._local, 'deadline', None)
+
+    @_deadline.setter
+    def _deadline(self, deadline):
+        self._local.deadline = deadline
+
+    def deadline(self, seconds):
+        """Limit the requests made by the calling thread within a `with` block to `seconds` in total
+
+        If the Manager has not answered when the deadline passes, the connection is closed, so that a late reply cannot be
+        mistaken for the answer to a later request, and :obj:`TimeoutError` is raised. Call :meth:`open_connection` to continue.
+
+        Example:
+
+            >>> with monitor.deadline(2.0):
+            ...     job = monitor.get_job('1256275308')
+
+        Args:
+            seconds (float): Time budget for the whole block
+
+        """
+        return _Deadline(self, seconds)
+
+    def _remaining(self):
+        """Returns the socket timeout to use for the next operation, taking the active deadline into account"""
+        if self._deadline is None:
+            return self.timeout
+        remaining = self._deadline - time.monotonic()
+        if remaining <= 0:
+            self._cancel()
+            raise TimeoutError('Deadline exceeded')
+        return remaining if self.timeout is None else min(remaining, self.timeout)
+
+    def _cancel(self):
+        """Abandon the session after a timeout, its byte stream can no longer be trusted"""
+        logging.info('Manager did not answer in time. Closing connection!')
+        self._buffer = b''
+        self.session.close()
+
+    def _exclusive(self, message):
+        """Returns a context manager within which the session is reserved for a reply that is read piecemeal
+
+        Without a :obj:`CommandScheduler` the caller owns the session anyway. A scheduler replaces this method, like
+        :meth:`_send_message`, so that the streamed `message` waits its turn in the queue.
+        """
+        return contextlib.nullcontext()
+
     def _send_message(self, message):
         """Send a message to the Backburner Manager
 
@@ -71,7 +157,7 @@ class Monitor:
             2) The content of the requested information
             3) "backburner>" or "backburner(Controller)>" to denote that it has performed the requested task and has returned to its standby state.
 
-        Note that this method has only been used for 'get' operations! 'Set' operations have not been researched or developed yet.
+        Replies are read through a receive buffer, so it does not matter how the Manager splits them into packets.
 
         Args:
             message (str): Content of the message.
@@ -79,41 +165,112 @@ class Monitor:
         Returns:
             Returns a three element tuple containing the response code (int), response message (str) and the requested data (bytes).
 
+        """
+        response_code, response_message, raw_requested_data = self._send_raw(message)
+
+        if raw_requested_data is not None:
+            requested_data = self._parse_payload(raw_requested_data)
+            logging.debug('Requested data:')
+            logging.debug(str(requested_data))
+            return (response_code, response_message, requested_data)
+
+        return (response_code, response_message, None)
+
+    def _send_raw(self, message):
+        """Send a message to the Backburner Manager and return the reply without parsing it
+
+        Use this to parse and decode the payload elsewhere, e.g. in a :obj:`DecodePool`.
+
+        Returns:
+            Returns a three element tuple containing the response code (int), response message (str) and the raw requested data (bytes, or `None`).
+
         """
         logging.debug('Message')
         logging.debug(str(message))
-        self.session.send(message)
- 
-        first_response = self.session.recv(32)
+        self._send(message)
 
-        logging.debug('First response:')
-        logging.debug(str(first_response))
+        return self._read_reply()
 
-        # TODO: Else does not seem tp work
-        response_code = int(first_response.decode("utf-8").split(' ', 1)[0]) # Get the response code
-        response_message = first_response.decode("utf-8").split(' ', 1)[1] # Get the response message 
-        
-        if int(response_code) == 251: # If the response code is 251, split the response message and get the message_length
-            msg_length = first_response.decode("utf-8").split()[1]
+    def _send_pipeline(self, messages):
+        """Send several messages at once and read all responses afterwards
 
-            raw_requested_data = self.session.recv(int(msg_length))
-            requested_data = ET.fromstring(raw_requested_data.decode("utf-8")[:-1])
-            logging.debug('Requested data:')
-            logging.debug(str(requested_data))
+        The Manager answers commands strictly in order, so the replies can be matched to the messages by position.
 
-            # After all is sent, Manager will send one last packet containing 'backburner>' or 'backburner(Controller)>'
-            data = self.session.recv(23)
-            logging.debug(data.decode("utf-8"))
+        Args:
+            messages (:obj:`list` of bytes): Complete commands, each terminated by '\\r\\n'
 
-            return (response_code, response_message, requested_data)
+        Returns:
+            A :obj:`list` of three element tuples containing the response code (int), response message (str) and the raw requested data (bytes, or `None`)
+
+        """
+        logging.debug(f'Pipelining {len(messages)} messages')
+        self._send(b''.join(messages))
+        return [self._read_reply() for _ in messages]
+
+    def _send(self, data):
+        self.session.settimeout(self._remaining())
+        try:
+            self.session.sendall(data)
+        except socket.timeout:
+            self._cancel()
+            raise TimeoutError('Manager did not accept the request in time')
+
+    def _receive(self):
+        self.session.settimeout(self._remaining())
+        try:
+            data = self.session.recv(65536)
+        except socket.timeout:
+            self._cancel()
+            raise TimeoutError('Manager did not answer in time')
+        if not data:
+            raise ConnectionError('Connection closed by Manager')
+        self._buffer += data
+
+    def _receive_until(self, delimiter):
+        """Read from the session until `delimiter` and return everything up to and including it"""
+        while True:
+            index = self._buffer.find(delimiter)
+            if index != -1:
+                end = index + len(delimiter)
+                data, self._buffer = self._buffer[:end], self._buffer[end:]
+                return data
+            self._receive()
+
+    def _receive_exactly(self, length):
+        while len(self._buffer) < length:
+            self._receive()
+        data, self._buffer = self._buffer[:length], self._buffer[length:]
+        return data
+
+    def _read_reply(self):
+        """Read one complete reply from the session
+
+        A reply consists of a status line, for response code 251 followed by a payload of the announced size, and is terminated
+        by the console prompt "backburner>" or "backburner(Controller)>".
 
-        # If the reponse code is not 251, then simply return the response code and message
-        else:
-            # After all is sent, Manager will send one last packet containing 'backburner>' or 'backburner(Controller)>'
-            data = self.session.recv(23)
-            logging.debug(data.decode("utf-8"))
+        Returns:
+            A three element tuple containing the response code (int), response message (str) and the raw requested data (bytes, or `None`)
+
+        """
+        first_response = self._receive_until(b'\r\n').decode("utf-8")
+        logging.debug('First response:')
+        logging.debug(first_response)
 
-            return (response_code, response_message, None)
+        response_code = int(first_response.split(' ', 1)[0]) # Get the response code
+        response_message = first_response.split(' ', 1)[1].strip() # Get the response message
+
+        raw_requested_data = None
+        if response_code == 251: # If the response code is 251, the response message is the length of the payload
+            raw_requested_data = self._receive_exactly(int(response_message.split()[0]))
+
+        # After all is sent, Manager will send one last packet containing 'backburner>' or 'backburner(Controller)>'
+        data = self._receive_until(b'>')
+        logging.debug(data.decode("utf-8"))
+
+        return (response_code, response_message, raw_requested_data)
+
+    def _parse_payload(self, raw_requested_data):
+        return parse_payload(raw_requested_data)
 
     def get_manager_info(self):
         """Retrieve information on the Backburner Manager
@@ -124,31 +281,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get mgrinfo\r\n')[2]
 
-        version = int(parsed[0].text)
-        servers = int(parsed[1].text)
-        jobs = int(parsed[2].text)
-
-        total_memory = int(parsed[3][0].text)
-        total_memory_f = float(parsed[3][1].text)
-        num_cpus = int(parsed[3][2].text)
-        platform = str(parsed[3][3].text)
-        user = str(parsed[3][4].text)
-        computer_name = str(parsed[3][5].text)
-        mac = str(parsed[3][6].text)
-        workdisk_space = int(parsed[3][7].text)
-        ip_address = str(parsed[3][8].text)
-        sysinfo = BDC.SystemInfo(total_memory, total_memory_f, num_cpus, platform, user, computer_name, mac, workdisk_space, ip_address)
-
-        dropped_packets = int(parsed[4][0].text)
-        bad_packets = int(parsed[4][1].text)
-        tcp_requests = int(parsed[4][2].text)
-        udp_requests = int(parsed[4][3].text)
-        boot_time = str(parsed[4][4].text)
-        net_status = BDC.NetworkStatus(dropped_packets, bad_packets, tcp_requests, udp_requests, boot_time)
-
-        manager_info = BDC.BackburnerManagerInfo(version, servers, jobs, sysinfo, net_status)
-
-        return manager_info
+        return decode_manager_info(parsed)
 
     def get_client_list(self):
         """Retrieve the client list
@@ -159,30 +292,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get clientlist\r\n')[2]
 
-        client_list = []
-
-        for client in parsed:
-            version = int(client[0].text)
-            udp_port = int(client[1].text)
-            controller = False
-            if int(client[2].text) == 1:
-                controller == True
-
-            total_memory = int(client[3][0].text)
-            total_memory_f = float(client[3][1].text)
-            num_cpus = int(client[3][2].text)
-            platform = str(client[3][3].text)
-            user = str(client[3][4].text)
-            computer_name = str(client[3][5].text)
-            mac = str(client[3][6].text)
-            workdisk_space = int(client[3][7].text)
-            ip_address = str(client[3][8].text)
-            sysinfo = BDC.SystemInfo(total_memory, total_memory_f, num_cpus, platform, user, computer_name, mac, workdisk_space, ip_address)
-
-            client_data = BDC.Client(version, udp_port, controller, sysinfo)
-            client_list.append(client_data)
-        
-        return client_list
+        return decode_client_list(parsed)
 
     def get_plugin_list(self):
         """Retrieve the plug-in list
@@ -193,17 +303,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get pluglist\r\n')[2]
 
-        plugin_list = []
-
-        for plugin in parsed:
-            version = int(plugin[0].text)
-            name = str(plugin[1].text)
-            description = str(plugin[2].text)
-
-            plugin_data = BDC.Plugin(version, name, description)
-            plugin_list.append(plugin_data)
-        
-        return plugin_list
+        return decode_plugin_list(parsed)
 
     def get_server_list(self):
         """Retrieve the server list
@@ -214,17 +314,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get srvlist\r\n')[2]
 
-        server_list = []
-
-        for server in parsed:
-            handle = str(server[0].text)
-            state = int(server[1].text)
-            name = str(server[2].text)
-
-            server_data = BDC.ServerListItem(handle, state, name)
-            server_list.append(server_data)
-        
-        return server_list
+        return decode_server_list(parsed)
 
     def get_server(self, server_handle):
         """Retrieve information on a particular server
@@ -241,62 +331,7 @@ class Monitor:
         command.extend(b'\r\n')
         parsed = self._send_message(command)[2]
 
-        version = int(parsed[0][0].text)
-        name = str(parsed[0][1].text)
-        user_name = str(parsed[0][2].text)
-        total_task = int(parsed[0][3].text)
-        total_time = float(parsed[0][4].text)
-        perf_index = float(parsed[0][5].text)
-        ip_address = str(parsed[0][6].text)
-        current_status = int(parsed[0][7].text)
-
-        total_memory = int(parsed[1][0].text)
-        total_memory_f = float(parsed[1][1].text)
-        num_cpus = int(parsed[1][2].text)
-        platform = str(parsed[1][3].text)
-        workdisk_space = int(parsed[1][4].text)
-        mac = str(parsed[1][5].text)
-        hw_info = BDC.HardwareInfo(total_memory, total_memory_f, num_cpus, platform, workdisk_space, mac)
-
-        dropped_packets = int(parsed[2][0].text)
-        bad_packets = int(parsed[2][1].text)
-        tcp_requests = int(parsed[2][2].text)
-        udp_requests = int(parsed[2][3].text)
-        boot_time = str(parsed[2][4].text)
-        net_status = BDC.NetworkStatus(dropped_packets, bad_packets, tcp_requests, udp_requests, boot_time)
-
-        sunday = int(parsed[3][0].text)
-        monday = int(parsed[3][1].text)
-        tuesday = int(parsed[3][2].text)
-        wednesday = int(parsed[3][3].text)
-        thursday = int(parsed[3][4].text)
-        friday = int(parsed[3][5].text)
-        saturday = int(parsed[3][6].text)
-        server_schedule = BDC.ServerSchedule(sunday, monday, tuesday, wednesday, thursday, friday, saturday)
-
-        att_priority = False
-        if int(parsed[4][0].text) == 1:
-            att_priority == True
-        una_priority = False
-        if int(parsed[4][1].text) == 1:
-            att_priority == True
-
-        current_job = int(parsed[5][0].text)
-        current_task = int(parsed[5][1].text)
-        task_started = str(parsed[5][2].text)
-
-        plugin_list = []
-        for plugin in parsed[6]:
-            version = int(plugin[1].text)
-            name = str(plugin[0].text)
-            description = str(plugin[2].text)
-
-            plugin_data = BDC.Plugin(version, name, description)
-            plugin_list.append(plugin_data)
-        
-        server = BDC.Server(version, name, user_name, total_task, total_time, perf_index, ip_address, current_status, hw_info, net_status, server_schedule, att_priority, una_priority, current_job, current_task, task_started, plugin_list)
-
-        return server
+        return decode_server(parsed)
 
     def get_job_handle_list(self):
         """Retrieve the job handle list
@@ -307,16 +342,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get jobhlist\r\n')[2]
 
-        job_handle_list = []
-
-        for job in parsed:
-            handle = int(job[0].text)
-            state = int(job[1].text)
-
-            job_data = BDC.JobHandleListItem(handle, state)
-            job_handle_list.append(job_data)
-        
-        return job_handle_list
+        return decode_job_handle_list(parsed)
 
     def get_job_list(self):
         """Retrieve the job list
@@ -327,19 +353,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get joblist\r\n')[2]
 
-        job_list = []
-
-        for job in parsed:
-            handle = int(job[0].text)
-            state = int(job[1].text)
-            name = str(job[2].text)
-            plugin_name = str(job[3].text)
-            plugin_version = int(job[3].text)
-
-            job_data = BDC.JobListItem(handle, state, name, plugin_name, plugin_version)
-            job_list.append(job_data)
-        
-        return job_list
+        return decode_job_list(parsed)
 
     def get_job(self, job_handle):
         """Retrieve information on a particular job
@@ -356,105 +370,7 @@ class Monitor:
         command.extend(b'\r\n')
         parsed = self._send_message(command)[2]
 
-        version = int(parsed[0][0].text)
-        job_handle = int(parsed[0][1].text)
-        name = str(parsed[0][2].text)
-        description = str(parsed[0][3].text)
-        job_priority = int(parsed[0][4].text)
-        user = str(parsed[0][5].text)
-        computer = str(parsed[0][6].text)
-        last_updated = str(parsed[0][7].text)
-        submitted = str(parsed[0][8].text)
-        started = str(parsed[0][9].text)
-        ended = str(parsed[0][10].text)
-        number_tasks = int(parsed[0][11].text)
-        tasks_completed = int(parsed[0][12].text)
-        encoding = str(parsed[0][13].text)
-        job_info = BDC.JobInfo(version, job_handle, name, description, job_priority, user, computer, last_updated, submitted, started, ended, number_tasks, tasks_completed, encoding)
-
-        active = False
-        if str(parsed[1][0].text) == 'Yes':
-            active == True
-        complete = False
-        if str(parsed[1][1].text) == 'Yes':
-            complete == True
-        nonconcurrent = False
-        if str(parsed[1][2].text) == 'Yes':
-            nonconcurrent == True
-        nonstoppable = False
-        if str(parsed[1][3].text) == 'Yes':
-            nonstoppable == True
-        ignore_job_share = False
-        if str(parsed[1][4].text) == 'Yes':
-            ignore_job_share == True
-        job_has_dependencies = False
-        if str(parsed[1][5].text) == 'Yes':
-            job_has_dependencies == True
-        zip_archive = False
-        if str(parsed[1][6].text) == 'Yes':
-            zip_archive == True
-        leave_in_queue = False
-        if str(parsed[1][7].text) == 'Yes':
-            leave_in_queue == True
-        archive_when_done = False
-        if str(parsed[1][8].text) == 'Yes':
-            archive_when_done == True
-        delete_when_done = False
-        if str(parsed[1][9].text) == 'Yes':
-            delete_when_done == True
-        override_blocking_tasks = False
-        if str(parsed[1][10].text) == 'Yes':
-            override_blocking_tasks == True
-        enable_blocking_tasks = False
-        if str(parsed[1][11].text) == 'Yes':
-            enable_blocking_tasks == True
-        job_flags = BDC.JobFlags(active, complete, nonconcurrent, nonstoppable, ignore_job_share, job_has_dependencies, zip_archive, leave_in_queue, archive_when_done, delete_when_done, override_blocking_tasks, enable_blocking_tasks)
-
-        plugin_name = str(parsed[3][0].text)
-        plugin_version = int(parsed[3][1].text)
-        job_plugin = BDC.JobPlugin(plugin_name, plugin_version)
-
-        enabled = False
-        if int(parsed[4][0].text) == 1:
-            enable_blocking_tasks == True
-        failure = False
-        if str(parsed[4][1].text) == 'Yes':
-            failure == True
-        progress = False
-        if str(parsed[4][2].text) == 'Yes':
-            progress == True
-        completion = False
-        if str(parsed[4][3].text) == 'Yes':
-            completion == True
-        nth_task = int(parsed[4][4].text)
-        send_email = False
-        if str(parsed[4][5].text) == 'Yes':
-            send_email == True
-        include_summary = False
-        if str(parsed[4][6].text) == 'Yes':
-            include_summary == True
-        email_from = str(parsed[4][7].text)
-        email_to = str(parsed[4][8].text)
-        email_server = str(parsed[4][9].text)
-        job_alerts = BDC.JobAlerts(enabled, failure, progress, completion, nth_task, send_email, include_summary, email_from, email_to, email_server)
-
-        job_server_list = []
-        for server in parsed[5]:
-            handle = str(server[0].text)
-            active = False
-            if str(server[1].text) == 'Yes':
-                active == True
-            task_time = float(server[2].text)
-            task_total = int(server[3].text)
-            context_switch = int(server[4].text)
-            rt_failed = False
-            if str(server[5].text) == "Yes":
-                rt_failed = True
-            job_server = BDC.JobServer(handle, active, task_time, task_total, context_switch, rt_failed)
-            job_server_list.append(job_server)
-
-        job = BDC.Job(job_info, job_flags, job_plugin, job_alerts, job_server_list)
-        return job    
+        return decode_job(parsed)
 
     def get_jobstate(self, job_handle):
         """Gets the state of specified job
@@ -467,14 +383,13 @@ class Monitor:
 
         Args:
             job_handle (str): The handle of the server. You might find a hex value for this, convert this first to decimal value!
-            jobstate (int): Jobstate as int. TODO: Find out values of jobstates
 
         Returns:
             Returns a three element tuple containing the response code (int), job state as int (str) and empty requested data (bytes).
 
         """
 
-        return self._send_message(bytes(f'get jobstate {str(job_handle)}'))
+        return self._send_message(f'get jobstate {str(job_handle)}\r\n'.encode('utf-8'))
 
     def set_jobstate(self, job_handle, jobstate):
         """Sets the state of specified job
@@ -485,6 +400,8 @@ class Monitor:
             2 Active
             3 Suspended (presumably)
 
+        The Manager only accepts this from a controller, see :meth:`del_controller`. Use :meth:`set_jobstates` to change many jobs at once.
+
         Args:
             job_handle (str): The handle of the server. You might find a hex value for this, convert this first to decimal value!
             jobstate (int): Jobstate as int. TODO: Find out values of jobstates
@@ -494,13 +411,169 @@ class Monitor:
 
         """
 
-        return self._send_message(bytes(f'set jobstate {str(job_handle)} {str(jobstate)}'))
+        return self._send_message(self._jobstate_command(job_handle, jobstate))
+
+    def _jobstate_command(self, job_handle, jobstate):
+        return f'set jobstate {str(job_handle)} {str(jobstate)}\r\n'.encode('utf-8')
+
+    def set_jobstates(self, jobstates, skip_unchanged = True, batch_size = 64):
+        """Sets the state of many jobs in one controller session
+
+        Controller status is acquired once, the state changes are pipelined in batches of `batch_size` commands without waiting
+        for each reply, and controller status is released afterwards. Changes are coalesced per job, the last requested state wins.
+
+        Args:
+            jobstates (dict): Mapping of job handle to the requested job state. An iterable of `(handle, state)` pairs is accepted as well
+            skip_unchanged (bool): Fetch the job handle list once and drop changes to jobs that are already in the requested state
+            batch_size (int): Maximum number of commands in flight
+
+        Returns:
+            A :obj:`dict` mapping each job handle that was sent to its `(response code, response message)` tuple
+
+        Raises:
+            ControllerError: The Manager did not grant controller status, no state was changed
+
+        """
+        if not isinstance(jobstates, dict):
+            jobstates = dict(jobstates)
+        requested = {int(handle): int(state) for handle, state in jobstates.items()}
+
+        if skip_unchanged and requested:
+            current = {item.handle: item.state for item in self.get_job_handle_list()}
+            requested = {handle: state for handle, state in requested.items() if current.get(handle) != state}
+
+        results = {}
+        if not requested:
+            return results
+
+        response_code, response_message, _ = self.del_controller(True)
+        if response_code != 200:
+            raise ControllerError(f'Could not acquire controller status: {response_code} {response_message}')
+
+        try:
+            handles = list(requested)
+            for start in range(0, len(handles), batch_size):
+                batch = handles[start:start + batch_size]
+                replies = self._send_pipeline([self._jobstate_command(handle, requested[handle]) for handle in batch])
+                for handle, (code, message, _) in zip(batch, replies):
+                    results[handle] = (code, message.strip())
+                    if code != 200:
+                        logging.info(f'Setting state of job {handle} failed: {code} {message.strip()}')
+        except BaseException:
+            # A session closed after a timeout cannot release controller status, and a failed release must not hide the error
+            if self.session.fileno() != -1:
+                try:
+                    self.del_controller(False)
+                except Exception as error:
+                    logging.info(f'Could not release controller status: {error!r}')
+            raise
+        self.del_controller(False)
+
+        return results
+
+    def suspend_all(self, user = None, batch_size = 64):
+        """Suspends every unfinished job, optionally only those of one user
+
+        Args:
+            user (str): Only suspend jobs submitted by this user
+            batch_size (int): Maximum number of commands in flight, see :meth:`set_jobstates`
+
+        Returns:
+            A :obj:`dict` mapping each job handle that was sent to its `(response code, response message)` tuple, see :meth:`set_jobstates`
+
+        """
+        handles = [item.handle for item in self.get_job_handle_list()
+                   if item.state not in (BDC.JOBSTATE_COMPLETED, BDC.JOBSTATE_SUSPENDED)]
+
+        if user is not None and handles:
+            owned = []
+            for start in range(0, len(handles), batch_size):
+                batch = handles[start:start + batch_size]
+                replies = self._send_pipeline([f'get jobinfo {handle}\r\n'.encode('utf-8') for handle in batch])
+                owned.extend(handle for handle, (_, _, raw) in zip(batch, replies)
+                             if raw is not None and decode_job(self._parse_payload(raw)).info.user == user)
+            handles = owned
+
+        return self.set_jobstates({handle: BDC.JOBSTATE_SUSPENDED for handle in handles}, skip_unchanged = False, batch_size = batch_size)
 
     def get_taskname(self, job_handle):
         '''TODO: Research and implement this function'''
         
         return None
 
+    def _task_list_command(self, job_handle, first, count):
+        if first is None:
+            return f'get tasklist {str(job_handle)}\r\n'.encode('utf-8')
+        return f'get tasklist {str(job_handle)} {int(first)} {int(count)}\r\n'.encode('utf-8')
+
+    def get_task_list(self, job_handle, first = None, count = None):
+        """Retrieve the tasks of a job, or one page of them
+
+        The reply layout of 'get tasklist' has not been confirmed against a Manager yet: a TaskList element with one Task
+        element per task, containing TaskID, TaskName, TaskState, ServerHandle, StartTime and EndTime. Paging with a first
+        task and a task count is likewise assumed. Elements are looked up by name, so unknown or missing elements do no harm.
+
+        Args:
+            job_handle (str): The handle of the job as decimal value
+            first (int): Index of the first task of the page, or `None` for all tasks
+            count (int): Number of tasks in the page
+
+        Returns:
+            A :obj:`list` of :obj:`Task` data class objects
+
+        """
+        parsed = self._send_message(self._task_list_command(job_handle, first, count))[2]
+
+        return decode_task_list(parsed)
+
+    def iter_task_list(self, job_handle, first = None, count = None):
+        """Retrieve the tasks of a job while they arrive, see :meth:`get_task_list`
+
+        The payload is parsed incrementally, so a job with tens of thousands of tasks is never held in memory as a whole.
+        The session is reserved until the iteration ends, through the installed :obj:`CommandScheduler` if there is one, so
+        iterate to the end or close the generator. Stopping early reads and discards the rest of the reply.
+
+        Yields:
+            :obj:`Task` data class objects
+
+        """
+        command = self._task_list_command(job_handle, first, count)
+        with self._exclusive(command):
+            yield from self._stream_task_list(job_handle, command)
+
+    def _stream_task_list(self, job_handle, command):
+        self._send(command)
+        first_response = self._receive_until(b'\r\n').decode("utf-8")
+        response_code = int(first_response.split(' ', 1)[0])
+        if response_code != 251:
+            self._receive_until(b'>')
+            logging.info(f'Task list of job {job_handle} not available: {first_response.strip()}')
+            return
+
+        remaining = int(first_response.split(' ', 1)[1].split()[0])
+        parser = ET.XMLPullParser(events = ('start', 'end'))
+        root = None
+        try:
+            while remaining:
+                if not self._buffer:
+                    self._receive()
+                chunk, self._buffer = self._buffer[:remaining], self._buffer[remaining:]
+                remaining -= len(chunk)
+                parser.feed(chunk if remaining else chunk[:-1]) # Drop the terminator byte
+                for event, element in parser.read_events():
+                    if root is None:
+                        root = element
+                    elif event == 'end' and element.tag == 'Task':
+                        yield decode_task(element)
+                        root.clear()
+        except GeneratorExit:
+            # Keep the session usable for the next request
+            self._receive_exactly(remaining)
+            self._receive_until(b'>')
+            raise
+        parser.close()
+        self._receive_until(b'>')
+
     def get_jobarchive(self):
         """Retrieve the job archive list
 
@@ -510,22 +583,7 @@ class Monitor:
         """
         parsed = self._send_message(b'get jobarchive\r\n')[2]
 
-        job_archive_list = []
-
-        for job in parsed:
-            handle = int(job[0].text)
-            name = str(job[1].text)
-            user = str(job[2].text)
-            description = str(job[3].text)
-            sub_date = str(job[4].text)
-            end_date = str(job[5].text)
-            plugin_name = str(job[6].text)
-            plugin_version = int(job[7].text)
-
-            job_data = BDC.JobArchiveListItem(handle, name, user, description, sub_date, end_date, plugin_name, plugin_version)
-            job_archive_list.append(job_data)
-        
-        return job_archive_list
+        return decode_jobarchive(parsed)
 
     def set_jobarchive(self, job_handle):
         """Send or retrieve specified job to or from job archive
@@ -534,13 +592,328 @@ class Monitor:
         """
 
     def del_controller(self, state):
-        '''TODO: Research and implement this function
-        
+        '''Acquire or release controller status
+
         This command has been observed to happen in conjuction with adjusting the state of a job, e.g:
 
         >del controller Yes
         >set jobstate 1256275308 1
         >del controller No
 
-        What del exactly means or what it does is slightly unclear
-        '''
\ No newline at end of file
+        What del exactly means is slightly unclear, but the console prompt switches to 'backburner(Controller)>' while controller status is held.
+
+        Args:
+            state (bool): `True` to acquire controller status, `False` to release it
+
+        Returns:
+            Returns a three element tuple containing the response code (int), response message (str) and empty requested data (bytes).
+        '''
+        return self._send_message(b'del controller Yes\r\n' if state else b'del controller No\r\n')
+
+def parse_payload(raw_requested_data):
+    """Parse a raw payload into an XML element, dropping the trailing terminator byte"""
+    return ET.fromstring(raw_requested_data.decode("utf-8")[:-1])
+
+def decode_manager_info(parsed):
+    """Decode a parsed 'get mgrinfo' response into a :obj:`BackburnerManagerInfo` data class object"""
+    version = int(parsed[0].text)
+    servers = int(parsed[1].text)
+    jobs = int(parsed[2].text)
+
+    total_memory = int(parsed[3][0].text)
+    total_memory_f = float(parsed[3][1].text)
+    num_cpus = int(parsed[3][2].text)
+    platform = str(parsed[3][3].text)
+    user = str(parsed[3][4].text)
+    computer_name = str(parsed[3][5].text)
+    mac = str(parsed[3][6].text)
+    workdisk_space = int(parsed[3][7].text)
+    ip_address = str(parsed[3][8].text)
+    sysinfo = BDC.SystemInfo(total_memory, total_memory_f, num_cpus, platform, user, computer_name, mac, workdisk_space, ip_address)
+
+    dropped_packets = int(parsed[4][0].text)
+    bad_packets = int(parsed[4][1].text)
+    tcp_requests = int(parsed[4][2].text)
+    udp_requests = int(parsed[4][3].text)
+    boot_time = str(parsed[4][4].text)
+    net_status = BDC.NetworkStatus(dropped_packets, bad_packets, tcp_requests, udp_requests, boot_time)
+
+    manager_info = BDC.BackburnerManagerInfo(version, servers, jobs, sysinfo, net_status)
+
+    return manager_info
+
+def decode_client_list(parsed):
+    """Decode a parsed 'get clientlist' response into a :obj:`list` of :obj:`Client` data class objects"""
+    client_list = []
+
+    for client in parsed:
+        version = int(client[0].text)
+        udp_port = int(client[1].text)
+        controller = False
+        if int(client[2].text) == 1:
+            controller == True
+
+        total_memory = int(client[3][0].text)
+        total_memory_f = float(client[3][1].text)
+        num_cpus = int(client[3][2].text)
+        platform = str(client[3][3].text)
+        user = str(client[3][4].text)
+        computer_name = str(client[3][5].text)
+        mac = str(client[3][6].text)
+        workdisk_space = int(client[3][7].text)
+        ip_address = str(client[3][8].text)
+        sysinfo = BDC.SystemInfo(total_memory, total_memory_f, num_cpus, platform, user, computer_name, mac, workdisk_space, ip_address)
+
+        client_data = BDC.Client(version, udp_port, controller, sysinfo)
+        client_list.append(client_data)
+    
+    return client_list
+
+def decode_plugin_list(parsed):
+    """Decode a parsed 'get pluglist' response into a :obj:`list` of :obj:`Plugin` data class objects"""
+    plugin_list = []
+
+    for plugin in parsed:
+        version = int(plugin[0].text)
+        name = str(plugin[1].text)
+        description = str(plugin[2].text)
+
+        plugin_data = BDC.Plugin(version, name, description)
+        plugin_list.append(plugin_data)
+    
+    return plugin_list
+
+def decode_server_list(parsed):
+    """Decode a parsed 'get srvlist' response into a :obj:`list` of :obj:`ServerListItem` data class objects"""
+    server_list = []
+
+    for server in parsed:
+        handle = str(server[0].text)
+        state = int(server[1].text)
+        name = str(server[2].text)
+
+        server_data = BDC.ServerListItem(handle, state, name)
+        server_list.append(server_data)
+    
+    return server_list
+
+def decode_server(parsed):
+    """Decode a parsed 'get jobinfo' response of a server into a :obj:`Server` data class object"""
+    version = int(parsed[0][0].text)
+    name = str(parsed[0][1].text)
+    user_name = str(parsed[0][2].text)
+    total_task = int(parsed[0][3].text)
+    total_time = float(parsed[0][4].text)
+    perf_index = float(parsed[0][5].text)
+    ip_address = str(parsed[0][6].text)
+    current_status = int(parsed[0][7].text)
+
+    total_memory = int(parsed[1][0].text)
+    total_memory_f = float(parsed[1][1].text)
+    num_cpus = int(parsed[1][2].text)
+    platform = str(parsed[1][3].text)
+    workdisk_space = int(parsed[1][4].text)
+    mac = str(parsed[1][5].text)
+    hw_info = BDC.HardwareInfo(total_memory, total_memory_f, num_cpus, platform, workdisk_space, mac)
+
+    dropped_packets = int(parsed[2][0].text)
+    bad_packets = int(parsed[2][1].text)
+    tcp_requests = int(parsed[2][2].text)
+    udp_requests = int(parsed[2][3].text)
+    boot_time = str(parsed[2][4].text)
+    net_status = BDC.NetworkStatus(dropped_packets, bad_packets, tcp_requests, udp_requests, boot_time)
+
+    sunday = int(parsed[3][0].text)
+    monday = int(parsed[3][1].text)
+    tuesday = int(parsed[3][2].text)
+    wednesday = int(parsed[3][3].text)
+    thursday = int(parsed[3][4].text)
+    friday = int(parsed[3][5].text)
+    saturday = int(parsed[3][6].text)
+    server_schedule = BDC.ServerSchedule(sunday, monday, tuesday, wednesday, thursday, friday, saturday)
+
+    att_priority = False
+    if int(parsed[4][0].text) == 1:
+        att_priority == True
+    una_priority = False
+    if int(parsed[4][1].text) == 1:
+        att_priority == True
+
+    current_job = int(parsed[5][0].text)
+    current_task = int(parsed[5][1].text)
+    task_started = str(parsed[5][2].text)
+
+    plugin_list = []
+    for plugin in parsed[6]:
+        plugin_version = int(plugin[1].text)
+        plugin_name = str(plugin[0].text)
+        plugin_description = str(plugin[2].text)
+
+        plugin_data = BDC.Plugin(plugin_version, plugin_name, plugin_description)
+        plugin_list.append(plugin_data)
+    
+    server = BDC.Server(version, name, user_name, total_task, total_time, perf_index, ip_address, current_status, hw_info, net_status, server_schedule, att_priority, una_priority, current_job, current_task, task_started, plugin_list)
+    return server
+
+def decode_job_handle_list(parsed):
+    """Decode a parsed 'get jobhlist' response into a :obj:`list` of :obj:`JobHandleListItem` data class objects"""
+    job_handle_list = []
+
+    for job in parsed:
+        handle = int(job[0].text)
+        state = int(job[1].text)
+
+        job_data = BDC.JobHandleListItem(handle, state)
+        job_handle_list.append(job_data)
+    
+    return job_handle_list
+
+def decode_job_list(parsed):
+    """Decode a parsed 'get joblist' response into a :obj:`list` of :obj:`JobListItem` data class objects"""
+    job_list = []
+
+    for job in parsed:
+        handle = int(job[0].text)
+        state = int(job[1].text)
+        name = str(job[2].text)
+        plugin_name = str(job[3].text)
+        plugin_version = int(job[4].text)
+
+        job_data = BDC.JobListItem(handle, state, name, plugin_name, plugin_version)
+        job_list.append(job_data)
+    
+    return job_list
+
+def decode_job(parsed):
+    """Decode a parsed 'get jobinfo' response of a job into a :obj:`Job` data class object"""
+    version = int(parsed[0][0].text)
+    job_handle = int(parsed[0][1].text)
+    name = str(parsed[0][2].text)
+    description = str(parsed[0][3].text)
+    job_priority = int(parsed[0][4].text)
+    user = str(parsed[0][5].text)
+    computer = str(parsed[0][6].text)
+    last_updated = str(parsed[0][7].text)
+    submitted = str(parsed[0][8].text)
+    started = str(parsed[0][9].text)
+    ended = str(parsed[0][10].text)
+    number_tasks = int(parsed[0][11].text)
+    tasks_completed = int(parsed[0][12].text)
+    encoding = str(parsed[0][13].text)
+    job_info = BDC.JobInfo(version, job_handle, name, description, job_priority, user, computer, last_updated, submitted, started, ended, number_tasks, tasks_completed, encoding)
+
+    active = False
+    if str(parsed[1][0].text) == 'Yes':
+        active = True
+    complete = False
+    if str(parsed[1][1].text) == 'Yes':
+        complete = True
+    nonconcurrent = False
+    if str(parsed[1][2].text) == 'Yes':
+        nonconcurrent = True
+    nonstoppable = False
+    if str(parsed[1][3].text) == 'Yes':
+        nonstoppable = True
+    ignore_job_share = False
+    if str(parsed[1][4].text) == 'Yes':
+        ignore_job_share = True
+    job_has_dependencies = False
+    if str(parsed[1][5].text) == 'Yes':
+        job_has_dependencies = True
+    zip_archive = False
+    if str(parsed[1][6].text) == 'Yes':
+        zip_archive = True
+    leave_in_queue = False
+    if str(parsed[1][7].text) == 'Yes':
+        leave_in_queue = True
+    archive_when_done = False
+    if str(parsed[1][8].text) == 'Yes':
+        archive_when_done = True
+    delete_when_done = False
+    if str(parsed[1][9].text) == 'Yes':
+        delete_when_done = True
+    override_blocking_tasks = False
+    if str(parsed[1][10].text) == 'Yes':
+        override_blocking_tasks = True
+    enable_blocking_tasks = False
+    if str(parsed[1][11].text) == 'Yes':
+        enable_blocking_tasks = True
+    job_flags = BDC.JobFlags(active, complete, nonconcurrent, nonstoppable, ignore_job_share, job_has_dependencies, zip_archive, leave_in_queue, archive_when_done, delete_when_done, override_blocking_tasks, enable_blocking_tasks)
+
+    plugin_name = str(parsed[3][0].text)
+    plugin_version = int(parsed[3][1].text)
+    job_plugin = BDC.JobPlugin(plugin_name, plugin_version)
+
+    enabled = False
+    if int(parsed[4][0].text) == 1:
+        enabled = True
+    failure = False
+    if str(parsed[4][1].text) == 'Yes':
+        failure = True
+    progress = False
+    if str(parsed[4][2].text) == 'Yes':
+        progress = True
+    completion = False
+    if str(parsed[4][3].text) == 'Yes':
+        completion = True
+    nth_task = int(parsed[4][4].text)
+    send_email = False
+    if str(parsed[4][5].text) == 'Yes':
+        send_email = True
+    include_summary = False
+    if str(parsed[4][6].text) == 'Yes':
+        include_summary = True
+    email_from = str(parsed[4][7].text)
+    email_to = str(parsed[4][8].text)
+    email_server = str(parsed[4][9].text)
+    job_alerts = BDC.JobAlerts(enabled, failure, progress, completion, nth_task, send_email, include_summary, email_from, email_to, email_server)
+
+    job_server_list = []
+    for server in parsed[5]:
+        handle = str(server[0].text)
+        active = False
+        if str(server[1].text) == 'Yes':
+            active = True
+        task_time = float(server[2].text)
+        task_total = int(server[3].text)
+        context_switch = int(server[4].text)
+        rt_failed = False
+        if str(server[5].text) == "Yes":
+            rt_failed = True
+        job_server = BDC.JobServer(handle, active, task_time, task_total, context_switch, rt_failed)
+        job_server_list.append(job_server)
+
+    job = BDC.Job(job_info, job_flags, job_plugin, job_alerts, job_server_list)
+    return job
+
+def decode_jobarchive(parsed):
+    """Decode a parsed 'get jobarchive' response into a :obj:`list` of :obj:`JobArchiveListItem` data class objects"""
+    job_archive_list = []
+
+    for job in parsed:
+        handle = int(job[0].text)
+        name = str(job[1].text)
+        user = str(job[2].text)
+        description = str(job[3].text)
+        sub_date = str(job[4].text)
+        end_date = str(job[5].text)
+        plugin_name = str(job[6].text)
+        plugin_version = int(job[7].text)
+
+        job_data = BDC.JobArchiveListItem(handle, name, user, description, sub_date, end_date, plugin_name, plugin_version)
+        job_archive_list.append(job_data)
+    
+    return job_archive_list
+
+def decode_task(element):
+    """Decode a Task element of a 'get tasklist' response into a :obj:`Task` data class object"""
+    return BDC.Task(int(element.findtext('TaskID', '0')),
+                    str(element.findtext('TaskName', '')),
+                    int(element.findtext('TaskState', '0')),
+                    str(element.findtext('ServerHandle', '')),
+                    str(element.findtext('StartTime', '')),
+                    str(element.findtext('EndTime', '')))
+
+def decode_task_list(parsed):
+    """Decode a parsed 'get tasklist' response into a :obj:`list` of :obj:`Task` data class objects"""
+    return [decode_task(element) for element in parsed.iter('Task')]
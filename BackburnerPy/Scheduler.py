@@ -0,0 +1,309 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from Monitor import Monitor
+
+# Priority classes, lower values are served first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+# Commands that are bulky enough to be treated as background work unless the caller says otherwise
+BACKGROUND_COMMANDS = (b'get jobarchive', b'get clientlist', b'get tasklist')
+
+# Commands that depend on per-session controller status, so they always run on the monitor's own session
+PINNED_COMMANDS = (b'del controller', b'set ')
+
+class TokenBucket:
+    """Token bucket rate limiter
+
+    Attributes:
+        rate (float): Tokens added per second
+        capacity (float): Maximum number of tokens, i.e. the allowed burst
+
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens = 1):
+        """Take `tokens` if available
+
+        Returns:
+            0 if the tokens were taken, otherwise the number of seconds until they will be available
+
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+# One bucket per Manager, shared by every scheduler in this process that talks to it
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def manager_bucket(manager_ip, manager_port, rate, capacity):
+    """Returns the shared :obj:`TokenBucket` of a Manager, creating it with `rate` and `capacity` on first use"""
+    with _buckets_lock:
+        key = (manager_ip, manager_port)
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, capacity)
+        return _buckets[key]
+
+class _Lease:
+    """Queue entry reserving the monitor's own session, see :meth:`CommandScheduler.lease`"""
+
+    def __init__(self, message):
+        self.message = message
+        self.released = threading.Event()
+
+class CommandScheduler:
+    """Client-side scheduler for commands sent to one Manager
+
+    Once installed, every request made through the monitor's `get_*`/`set_*` methods is queued with a priority class and
+    executed by a small pool of worker sessions, subject to a per-Manager token bucket. Interactive commands always jump ahead
+    of queued normal and background commands, and the last `reserved_interactive` sessions only run interactive commands, so
+    a long 'get jobarchive' cannot delay an interactive 'get jobinfo'. Pipelines and commands that depend on controller status
+    (see `PINNED_COMMANDS`) always run on the monitor's own session. Streamed replies, e.g. :meth:`Monitor.iter_task_list`,
+    are queued as well and then lease the monitor's own session until the stream ends, see :meth:`lease`.
+
+    The priority of a call is taken from the innermost :meth:`priority` block of the calling thread. Outside such a block,
+    commands listed in `BACKGROUND_COMMANDS` are background work and everything else is normal. A :meth:`Monitor.deadline`
+    of the calling thread travels with each of its commands, and a command whose deadline passed while it was queued fails
+    with :obj:`TimeoutError` without being sent.
+
+    Example:
+
+        >>> scheduler = CommandScheduler(monitor, max_concurrent = 2)
+        >>> scheduler.start()
+        >>> with scheduler.priority(INTERACTIVE):
+        ...     job = monitor.get_job('1256275308')
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor whose requests are scheduled. Its own session is used by the first worker
+        max_concurrent (int): Number of sessions, i.e. the maximum number of commands in flight
+        reserved_interactive (int): Number of sessions that only run interactive commands, when `max_concurrent` > 1. The monitor's own session is never reserved
+        bucket (:obj:`TokenBucket`): Rate limiter shared by all schedulers of the same Manager
+        background_cost (float): Tokens consumed by one background command, normal and interactive commands cost one token
+
+    """
+
+    def __init__(self, monitor, rate = 20.0, burst = 40, max_concurrent = 1, reserved_interactive = 1, background_cost = 5.0):
+        self.monitor = monitor
+        self.max_concurrent = max_concurrent
+        self.reserved_interactive = min(reserved_interactive, max_concurrent - 1)
+        self.bucket = manager_bucket(monitor.MANAGER_IP, monitor.MANAGER_PORT, rate, burst)
+        self.background_cost = background_cost
+
+        self._queue = []
+        self._pinned = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._workers = []
+        self._sessions = []
+        self._leases = set()
+        self._running = False
+
+    @contextmanager
+    def priority(self, priority_class):
+        """Run the calls made by this thread within the block with `priority_class`"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(priority_class)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def _classify(self, message):
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return stack[-1]
+        if bytes(message).startswith(BACKGROUND_COMMANDS):
+            return BACKGROUND
+        return NORMAL
+
+    def start(self):
+        """Open the additional sessions, start the workers and route the monitor's requests through the scheduler"""
+        self._sessions = [self.monitor]
+        for _ in range(self.max_concurrent - 1):
+            session = Monitor(self.monitor.MANAGER_IP, self.monitor.MANAGER_PORT, self.monitor.logging_level)
+            session.open_connection()
+            self._sessions.append(session)
+
+        self._running = True
+        for number, session in enumerate(self._sessions):
+            worker = threading.Thread(target = self._work, args = (number, session), daemon = True, name = f'CommandScheduler-{number}')
+            worker.start()
+            self._workers.append(worker)
+
+        # Route every request of the monitor through the queue
+        self.monitor._send_message = self.submit_wait
+        self.monitor._send_pipeline = self.submit_pipeline_wait
+        self.monitor._exclusive = self.lease
+
+    def stop(self):
+        """Stop the workers, close the additional sessions and restore direct requests on the monitor
+
+        Leases that were never released, e.g. by a streamed reply that was abandoned, are released, so this does not wait for them.
+        """
+        with self._condition:
+            self._running = False
+            for lease in self._leases:
+                lease.released.set()
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+        del self.monitor._send_message
+        del self.monitor._send_pipeline
+        del self.monitor._exclusive
+        for session in self._sessions[1:]:
+            session.close_connection()
+        self._sessions = []
+
+    def _enqueue(self, queue, priority_class, payload):
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError('CommandScheduler is not running')
+            # The deadline is read here, on the calling thread, and applied by the worker for this command only
+            heapq.heappush(queue, (priority_class, next(self._sequence), payload, future, self.monitor._deadline))
+            self._condition.notify_all()
+        return future
+
+    def submit(self, message, priority_class = None):
+        """Queue a message
+
+        Returns:
+            A :obj:`concurrent.futures.Future` resolving to the `_send_message` response tuple
+
+        """
+        if priority_class is None:
+            priority_class = self._classify(message)
+        queue = self._pinned if bytes(message).startswith(PINNED_COMMANDS) else self._queue
+        return self._enqueue(queue, priority_class, message)
+
+    def submit_wait(self, message, priority_class = None):
+        """Queue a message and wait for its response, a drop-in replacement for :meth:`Monitor._send_message`"""
+        return self.submit(message, priority_class).result()
+
+    def submit_pipeline(self, messages, priority_class = None):
+        """Queue a pipeline of messages, which is run as one unit on the monitor's own session
+
+        Returns:
+            A :obj:`concurrent.futures.Future` resolving to the `_send_pipeline` response list
+
+        """
+        if priority_class is None:
+            priority_class = self._classify(messages[0]) if messages else NORMAL
+        return self._enqueue(self._pinned, priority_class, list(messages))
+
+    def submit_pipeline_wait(self, messages, priority_class = None):
+        """Queue a pipeline and wait for its responses, a drop-in replacement for :meth:`Monitor._send_pipeline`"""
+        return self.submit_pipeline(messages, priority_class).result()
+
+    @contextmanager
+    def lease(self, message, priority_class = None):
+        """Reserve the monitor's own session within the block, for a reply the caller reads itself
+
+        The lease is queued like `message` and counts as one command of its priority class. Meanwhile the worker of the
+        monitor's session waits for the block to end, so no other command is interleaved with the streamed reply.
+
+        Args:
+            message (bytes): The command that will be sent, used to classify the lease
+            priority_class (int): Overrides the priority class of the calling thread
+
+        """
+        if priority_class is None:
+            priority_class = self._classify(message)
+        lease = _Lease(message)
+        with self._condition:
+            self._leases.add(lease)
+        try:
+            self._enqueue(self._pinned, priority_class, lease).result()
+            yield
+        finally:
+            lease.released.set()
+            with self._condition:
+                self._leases.discard(lease)
+
+    def queued(self):
+        """Returns the number of queued commands per priority class"""
+        with self._condition:
+            counts = {INTERACTIVE: 0, NORMAL: 0, BACKGROUND: 0}
+            for entry in self._queue + self._pinned:
+                counts[entry[0]] = counts.get(entry[0], 0) + 1
+            return counts
+
+    def _take(self, queues, interactive_only):
+        """Pop the most urgent entry this worker may run, or `None`. Must be called with the condition held"""
+        candidates = [queue for queue in queues if queue]
+        if not candidates:
+            return None
+        queue = min(candidates, key = lambda queue: queue[0][:2])
+        if interactive_only and queue[0][0] != INTERACTIVE:
+            return None
+        return queue, heapq.heappop(queue)
+
+    def _work(self, number, session):
+        interactive_only = number >= self.max_concurrent - self.reserved_interactive
+        queues = [self._queue, self._pinned] if number == 0 else [self._queue]
+        while True:
+            with self._condition:
+                taken = self._take(queues, interactive_only)
+                while taken is None:
+                    if not self._running:
+                        return
+                    self._condition.wait()
+                    taken = self._take(queues, interactive_only)
+
+                queue, entry = taken
+                priority_class, _, payload, future, deadline = entry
+                cost = len(payload) if isinstance(payload, list) else 1
+                if priority_class == BACKGROUND:
+                    cost *= self.background_cost
+                delay = self.bucket.try_acquire(min(cost, self.bucket.capacity))
+                if delay:
+                    # Put the entry back so more urgent work that arrives meanwhile can overtake it
+                    heapq.heappush(queue, entry)
+                    self._condition.wait(delay)
+                    continue
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and deadline <= time.monotonic():
+                future.set_exception(TimeoutError('Deadline exceeded while the command was queued'))
+                continue
+            if isinstance(payload, _Lease):
+                future.set_result(None)
+                payload.released.wait()
+                continue
+            session._deadline = deadline
+            try:
+                if isinstance(payload, list):
+                    future.set_result(Monitor._send_pipeline(session, payload))
+                else:
+                    future.set_result(Monitor._send_message(session, payload))
+            except BaseException as error:
+                logging.debug(f'Scheduled command {payload} failed: {error}')
+                future.set_exception(error)
+            finally:
+                session._deadline = None
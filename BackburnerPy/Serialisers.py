@@ -0,0 +1,396 @@
+"""Typed JSON and MessagePack serialisation of the data classes
+
+`dataclasses.asdict` deep-copies every value and inspects every field on every call. The serialisers in this module are
+generated once per data class from its field annotations, so encoding a :obj:`Job` is a single function call per nested
+object that writes JSON text or MessagePack bytes directly.
+
+    >>> text = dumps(job)
+    >>> job == loads(BDC.Job, text)
+    True
+    >>> job == unpackb(BDC.Job, packb(job))
+    True
+
+JSON objects use the field names as keys. MessagePack encodes each object as an array of its field values in declaration
+order, which keeps messages small but means that both ends need the same version of the data classes. If the `msgpack`
+package is installed it is used, otherwise a pure Python implementation of the subset needed here produces the same bytes.
+"""
+import dataclasses
+import json
+import logging
+import struct
+from json.encoder import encode_basestring_ascii
+
+import BackburnerDataClasses as BDC
+
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+# List fields cannot be annotated with their item type without changing the data classes, so they are declared here
+_LIST_ITEM_TYPES = {
+    ('Job', 'servers'): BDC.JobServer,
+    ('Server', 'plugins'): BDC.Plugin,
+}
+
+_CODECS = {}
+
+_JSON_BOOLS = ('false', 'true')
+
+_JSON_ERRORS = (TypeError, ValueError, IndexError, AttributeError)
+
+def register_list_item_type(cls, field_name, item_cls):
+    """Declare the data class `item_cls` as the item type of the list field `field_name` of `cls`
+
+    Must be called before the first object of `cls` is serialised.
+    """
+    _LIST_ITEM_TYPES[(cls.__name__, field_name)] = item_cls
+
+def _json_float(value):
+    if value - value == 0.0:
+        return float.__repr__(value)
+    return json.dumps(value)
+
+def _json_any(value):
+    return json.dumps(value, separators = (',', ':'), default = _default)
+
+def _default(value):
+    if dataclasses.is_dataclass(value):
+        return to_dict(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _to_dict_any(value):
+    if dataclasses.is_dataclass(value):
+        return to_dict(value)
+    if isinstance(value, list):
+        return [_to_dict_any(item) for item in value]
+    return value
+
+def _to_tuple_any(value):
+    if dataclasses.is_dataclass(value):
+        return _codec(type(value)).to_tuple(value)
+    if isinstance(value, list):
+        return [_to_tuple_any(item) for item in value]
+    return value
+
+class _Codec:
+    """Serialisers of one data class, generated from its field annotations"""
+
+    def __init__(self, cls):
+        self.cls = cls
+        namespace = {
+            'cls': cls, '_str': encode_basestring_ascii, '_int': int.__repr__, '_float': _json_float, '_bools': _JSON_BOOLS,
+            '_any': _json_any, '_to_dict_any': _to_dict_any, '_to_tuple_any': _to_tuple_any, '_join': ','.join,
+            '_pack_value': _pack_value, '_pack_array_header': _pack_array_header,
+        }
+        json_parts, dict_items, dict_args, tuple_items, tuple_args, pack_lines = [], [], [], [], [], []
+
+        for index, field in enumerate(dataclasses.fields(cls)):
+            name = field.name
+            value = f'o.{name}'
+            item_cls = _LIST_ITEM_TYPES.get((cls.__name__, name))
+            key = encode_basestring_ascii(name)
+
+            if dataclasses.is_dataclass(field.type):
+                nested = f'_c{index}'
+                namespace[nested] = _codec(field.type)
+                json_parts.append(f'{key}:{{{nested}.dumps({value})}}')
+                dict_items.append(f'{key}: None if {value} is None else {nested}.to_dict({value})')
+                dict_args.append(f'None if d[{key}] is None else {nested}.from_dict(d[{key}])')
+                tuple_items.append(f'None if {value} is None else {nested}.to_tuple({value})')
+                tuple_args.append(f'None if t[{index}] is None else {nested}.from_tuple(t[{index}])')
+                pack_lines.append(f'    {nested}.pack({value}, out) if {value} is not None else out.append(0xc0)')
+            elif item_cls is not None:
+                nested = f'_c{index}'
+                namespace[nested] = _codec(item_cls)
+                json_parts.append(f'{key}:[{{_join(map({nested}.dumps, {value}))}}]')
+                dict_items.append(f'{key}: [{nested}.to_dict(item) for item in {value}]')
+                dict_args.append(f'[{nested}.from_dict(item) for item in d[{key}]]')
+                tuple_items.append(f'[{nested}.to_tuple(item) for item in {value}]')
+                tuple_args.append(f'[{nested}.from_tuple(item) for item in t[{index}]]')
+                pack_lines.append(f'    _pack_array_header(len({value}), out)')
+                pack_lines.append(f'    for item in {value}:')
+                pack_lines.append(f'        {nested}.pack(item, out)')
+            else:
+                encoder = {str: '_str', int: '_int', float: '_float'}.get(field.type)
+                if field.type is bool:
+                    json_parts.append(f'{key}:{{_bools[{value}]}}')
+                elif encoder is not None:
+                    json_parts.append(f'{key}:{{{encoder}({value})}}')
+                else:
+                    json_parts.append(f'{key}:{{_any({value})}}')
+                plain = field.type in (str, int, float, bool)
+                dict_items.append(f'{key}: {value}' if plain else f'{key}: _to_dict_any({value})')
+                dict_args.append(f'd[{key}]')
+                tuple_items.append(value if plain else f'_to_tuple_any({value})')
+                tuple_args.append(f't[{index}]')
+                pack_lines.append(f'    _pack_value({value}, out)' if plain else f'    _pack_value(_to_tuple_any({value}), out)')
+
+        count = len(json_parts)
+        source = '\n'.join([
+            'def dumps(o):',
+            "    return f'{{" + ','.join(json_parts) + "}}'",
+            'def to_dict(o):',
+            '    return {' + ', '.join(dict_items) + '}',
+            'def from_dict(d):',
+            '    return cls(' + ', '.join(dict_args) + ')',
+            'def to_tuple(o):',
+            '    return (' + ''.join(item + ', ' for item in tuple_items) + ')',
+            'def from_tuple(t):',
+            '    return cls(' + ', '.join(tuple_args) + ')',
+            'def pack(o, out):',
+            f'    _pack_array_header({count}, out)',
+            *pack_lines,
+        ])
+        exec(compile(source, f'<serialisers of {cls.__name__}>', 'exec'), namespace)
+
+        self._dumps = namespace['dumps']
+        self.to_dict = namespace['to_dict']
+        self.from_dict = namespace['from_dict']
+        self.to_tuple = namespace['to_tuple']
+        self.from_tuple = namespace['from_tuple']
+        self.pack = namespace['pack']
+
+    def dumps(self, value):
+        try:
+            return self._dumps(value)
+        except _JSON_ERRORS:
+            # A field holds a value that does not match its annotation, e.g. None
+            return _json_any(self.to_dict(value))
+
+def _codec(cls):
+    codec = _CODECS.get(cls)
+    if codec is None:
+        codec = _CODECS[cls] = _Codec(cls)
+        logging.debug(f'Generated serialisers for {cls.__name__}')
+    return codec
+
+def to_dict(value):
+    """Returns a data class object as a dict of plain values, like `dataclasses.asdict` but much faster"""
+    return _codec(type(value)).to_dict(value)
+
+def from_dict(cls, data):
+    """Returns a `cls` object built from the output of :func:`to_dict` or a decoded JSON object"""
+    return _codec(cls).from_dict(data)
+
+def dumps(value):
+    """Encode a data class object, a list of them or any JSON-compatible value as compact JSON
+
+    Returns:
+        A str with the JSON text
+
+    """
+    if isinstance(value, list):
+        return f'[{",".join(map(dumps, value))}]'
+    if dataclasses.is_dataclass(value):
+        return _codec(type(value)).dumps(value)
+    return _json_any(value)
+
+def loads(cls, text):
+    """Decode a JSON object, or a JSON array of objects, into `cls` objects"""
+    data = json.loads(text)
+    codec = _codec(cls)
+    if isinstance(data, list):
+        return [codec.from_dict(item) for item in data]
+    return codec.from_dict(data)
+
+def iter_json_lines(items):
+    """Yields one line of JSON per item, including the newline, without encoding the whole list at once"""
+    for item in items:
+        yield dumps(item) + '\n'
+
+def write_json_lines(items, stream):
+    """Write one line of JSON per item to a text stream"""
+    write = stream.write
+    for line in iter_json_lines(items):
+        write(line)
+
+def read_json_lines(cls, stream):
+    """Yields the `cls` objects of a stream written by :func:`write_json_lines`, skipping empty lines"""
+    codec = _codec(cls)
+    for line in stream:
+        if line.strip():
+            yield codec.from_dict(json.loads(line))
+
+def packb(value):
+    """Encode a data class object, or a list of them, as MessagePack
+
+    Returns:
+        bytes
+
+    """
+    if _msgpack is not None:
+        return _msgpack.packb(_to_tuple_any(value), use_bin_type = True)
+    out = bytearray()
+    if isinstance(value, list):
+        _pack_array_header(len(value), out)
+        for item in value:
+            _codec(type(item)).pack(item, out)
+    else:
+        _codec(type(value)).pack(value, out)
+    return bytes(out)
+
+def unpackb(cls, data, many = False):
+    """Decode MessagePack written by :func:`packb` into a `cls` object, or a list of them if `many` is set"""
+    if _msgpack is not None:
+        value = _msgpack.unpackb(data, raw = False)
+    else:
+        value, offset = _unpack(memoryview(data), 0)
+        if offset != len(data):
+            raise ValueError(f'{len(data) - offset} bytes of extra data')
+    codec = _codec(cls)
+    if many:
+        return [codec.from_tuple(item) for item in value]
+    return codec.from_tuple(value)
+
+# Pure Python MessagePack, used when the msgpack package is not installed
+
+def _pack_array_header(length, out):
+    if length < 16:
+        out.append(0x90 | length)
+    elif length < 0x10000:
+        out += struct.pack('>BH', 0xdc, length)
+    else:
+        out += struct.pack('>BI', 0xdd, length)
+
+def _pack_int(value, out):
+    if value >= 0:
+        if value < 0x80:
+            out.append(value)
+        elif value < 0x100:
+            out += struct.pack('>BB', 0xcc, value)
+        elif value < 0x10000:
+            out += struct.pack('>BH', 0xcd, value)
+        elif value < 0x100000000:
+            out += struct.pack('>BI', 0xce, value)
+        else:
+            out += struct.pack('>BQ', 0xcf, value)
+    elif value >= -32:
+        out += struct.pack('>b', value)
+    elif value >= -0x80:
+        out += struct.pack('>Bb', 0xd0, value)
+    elif value >= -0x8000:
+        out += struct.pack('>Bh', 0xd1, value)
+    elif value >= -0x80000000:
+        out += struct.pack('>Bi', 0xd2, value)
+    else:
+        out += struct.pack('>Bq', 0xd3, value)
+
+def _pack_str(value, out):
+    data = value.encode('utf-8')
+    length = len(data)
+    if length < 32:
+        out.append(0xa0 | length)
+    elif length < 0x100:
+        out += struct.pack('>BB', 0xd9, length)
+    elif length < 0x10000:
+        out += struct.pack('>BH', 0xda, length)
+    else:
+        out += struct.pack('>BI', 0xdb, length)
+    out += data
+
+def _pack_bin(value, out):
+    length = len(value)
+    if length < 0x100:
+        out += struct.pack('>BB', 0xc4, length)
+    elif length < 0x10000:
+        out += struct.pack('>BH', 0xc5, length)
+    else:
+        out += struct.pack('>BI', 0xc6, length)
+    out += value
+
+def _pack_value(value, out):
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, str):
+        _pack_str(value, out)
+    elif isinstance(value, float):
+        out += struct.pack('>Bd', 0xcb, value)
+    elif isinstance(value, (list, tuple)):
+        _pack_array_header(len(value), out)
+        for item in value:
+            _pack_value(item, out)
+    elif isinstance(value, dict):
+        length = len(value)
+        if length < 16:
+            out.append(0x80 | length)
+        elif length < 0x10000:
+            out += struct.pack('>BH', 0xde, length)
+        else:
+            out += struct.pack('>BI', 0xdf, length)
+        for key, item in value.items():
+            _pack_value(key, out)
+            _pack_value(item, out)
+    elif isinstance(value, (bytes, bytearray)):
+        _pack_bin(value, out)
+    elif dataclasses.is_dataclass(value):
+        _codec(type(value)).pack(value, out)
+    else:
+        raise TypeError(f'Object of type {type(value).__name__} cannot be packed')
+
+# Formats with a fixed size: type byte -> (struct format, size)
+_FIXED = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
+
+# Formats followed by a length: type byte -> (kind, length format, length size)
+_SIZED = {
+    0xc4: ('bin', '>B', 1), 0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+    0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2), 0xdb: ('str', '>I', 4),
+    0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+    0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4),
+}
+
+def _unpack(data, offset):
+    """Decode the value at `offset`, returning it together with the offset of the next value"""
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code < 0xc0:
+        kind, length = 'str', code & 0x1f
+    elif 0x90 <= code < 0xa0:
+        kind, length = 'array', code & 0x0f
+    elif 0x80 <= code < 0x90:
+        kind, length = 'map', code & 0x0f
+    elif code == 0xc0:
+        return None, offset
+    elif code == 0xc2:
+        return False, offset
+    elif code == 0xc3:
+        return True, offset
+    elif code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+    elif code in _SIZED:
+        kind, fmt, size = _SIZED[code]
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += size
+    else:
+        raise ValueError(f'Unsupported MessagePack type 0x{code:02x}')
+
+    if kind == 'str':
+        return str(data[offset:offset + length], 'utf-8'), offset + length
+    if kind == 'bin':
+        return bytes(data[offset:offset + length]), offset + length
+    if kind == 'array':
+        items = []
+        for _ in range(length):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    mapping = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        mapping[key], offset = _unpack(data, offset)
+    return mapping, offset
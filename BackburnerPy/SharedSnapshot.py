@@ -0,0 +1,444 @@
+import logging
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError: # Python 3.7
+    shared_memory = None
+
+import BackburnerDataClasses as BDC
+from Inventory import ServerInventory
+from JobCatalogue import JobCatalogue
+
+# Segment layout, all integers little endian:
+#
+#   header   magic, layout version, active slot, publish count, generation, owner pid, retired
+#   slot[2]  seq, published_ns, job count, server count, data size, followed by the slot data:
+#            job records (sorted by handle), server records (sorted by handle), UTF-8 string area
+#
+# The publisher writes into the inactive slot and then flips the active slot. Each slot has its own seqlock counter, which
+# is odd while the slot is being written, so readers can detect a slot that was rewritten while they were reading it.
+#
+# The generation is bumped whenever a publisher takes over a segment left behind by one that died. A segment that is
+# unlinked is marked as retired first, so readers still mapping it know to attach to the segment that replaced it.
+MAGIC = b'BBSS'
+LAYOUT_VERSION = 2
+
+HEADER = struct.Struct('<4sHHQQII')
+SLOT_HEADER = struct.Struct('<QQIII')
+# handle, state, priority, active, complete, number_tasks, tasks_completed, (offset, length) of name, user and plugin name
+JOB_RECORD = struct.Struct('<QiiBB2xII' + 'II' * 3)
+# (offset, length) of handle, name, ip address and mac, state, current_status, num_cpus, total_memory, perf_index, workdisk_space, current_job
+SERVER_RECORD = struct.Struct('<' + 'II' * 4 + 'iiIQdqq')
+
+DEFAULT_NAME = 'backburner_snapshot'
+DEFAULT_SIZE = 16 * 1024 * 1024
+
+JobEntry = namedtuple('JobEntry', 'handle state priority active complete number_tasks tasks_completed name user plugin_name')
+ServerEntry = namedtuple('ServerEntry', 'handle name ip_address mac state current_status num_cpus total_memory perf_index workdisk_space current_job')
+
+class SnapshotOverflow(Exception):
+    """Raised when a snapshot does not fit into a slot of the shared memory segment"""
+
+class SnapshotBusy(Exception):
+    """Raised when a reader does not get a consistent read of the active slot, e.g. after the publisher died while writing it"""
+
+class SnapshotStale(Exception):
+    """Raised when the publisher of a segment is gone or its latest snapshot is older than the reader accepts"""
+
+def _require_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError('Shared memory snapshots require Python 3.8 or newer')
+
+def _alive(pid):
+    """Returns whether the process `pid` on this host still exists"""
+    if not pid:
+        return False
+    if os.name == 'nt':
+        # Segments disappear with the last handle on Windows, and signal 0 would not be a liveness check there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _attach_segment(name):
+    """Attach to an existing segment without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)
+    except TypeError: # Python < 3.13 registers attached segments and would unlink them on exit
+        # Unregistering afterwards would also drop the registration of a segment this process created, so skip it instead
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name = name)
+        finally:
+            resource_tracker.register = register
+
+def _own(memory):
+    """Track a segment attached with :func:`_attach_segment` like a created one, so it is unlinked on exit"""
+    if getattr(memory, '_track', True):
+        resource_tracker.register(memory._name, 'shared_memory')
+    return memory
+
+def _slot_size(size):
+    return (size - HEADER.size) // 2
+
+def _slot_offset(size, slot):
+    return HEADER.size + slot * _slot_size(size)
+
+class _Strings:
+    """Builder for the string area of a slot, deduplicating repeated strings such as user and plugin names"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, text):
+        encoded = str(text).encode('utf-8')
+        offset = self.offsets.get(encoded)
+        if offset is None:
+            offset = len(self.data)
+            self.offsets[encoded] = offset
+            self.data.extend(encoded)
+        return offset, len(encoded)
+
+def encode_slot(jobs, servers):
+    """Encode job and server records into the slot data layout
+
+    Args:
+        jobs (:obj:`list` of :obj:`JobRecord`)
+        servers (:obj:`list` of :obj:`ServerRecord`)
+
+    Returns:
+        A three element tuple containing the slot data (bytearray), job count and server count
+
+    """
+    strings = _Strings()
+    jobs = sorted(jobs, key = lambda record: record.handle)
+    servers = sorted(servers, key = lambda record: record.handle.encode('utf-8'))
+    strings_offset = len(jobs) * JOB_RECORD.size + len(servers) * SERVER_RECORD.size
+
+    data = bytearray(strings_offset)
+    offset = 0
+    for record in jobs:
+        info = record.job.info
+        JOB_RECORD.pack_into(data, offset, record.handle, record.state, info.priority, record.job.flags.active, record.job.flags.complete,
+                             info.number_tasks, info.tasks_completed, *strings.add(record.name), *strings.add(info.user),
+                             *strings.add(record.job.plugin.plugin_name))
+        offset += JOB_RECORD.size
+    for record in servers:
+        server = record.server
+        SERVER_RECORD.pack_into(data, offset, *strings.add(record.handle), *strings.add(server.name), *strings.add(server.ip_address),
+                                *strings.add(server.hw_info.mac), record.state, server.current_status, server.hw_info.num_cpus,
+                                server.hw_info.total_memory, server.perf_index, server.hw_info.workdisk_space, server.current_job)
+        offset += SERVER_RECORD.size
+
+    # String offsets are relative to the string area
+    data.extend(strings.data)
+    return data, len(jobs), len(servers)
+
+class SnapshotPublisher:
+    """Polls a Manager and publishes the farm state into a shared memory segment
+
+    Run one publisher per host, e.g. next to a gunicorn master, and let every worker process read the segment with a
+    :obj:`SnapshotReader` instead of polling the Manager itself.
+
+    A segment whose publisher is still running is never replaced, a second publisher raises `FileExistsError`. A segment
+    left behind by a publisher that died is taken over in place when it is large enough, so attached readers keep working,
+    otherwise it is retired and replaced.
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor with an open connection to the Manager
+        name (str): Name of the shared memory segment
+        size (int): Size of the segment in bytes, each of the two slots gets half of it. A segment that is taken over keeps its size
+        generation (int): Number of publishers that used the segment before this one
+        interval (float): Seconds between polls when running in the background
+        catalogue (:obj:`JobCatalogue`)
+        inventory (:obj:`ServerInventory`)
+
+    """
+
+    def __init__(self, monitor, name = DEFAULT_NAME, size = DEFAULT_SIZE, interval = 5.0):
+        _require_shared_memory()
+        self.monitor = monitor
+        self.name = name
+        self.size = size
+        self.interval = interval
+        self.catalogue = JobCatalogue(monitor)
+        self.inventory = ServerInventory(monitor)
+
+        self.generation = 0
+        self._active = 0
+        self._publish_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        try:
+            self._memory = self._create(name, size)
+        except FileExistsError:
+            self._memory = self._take_over(name, size)
+        self._buffer = self._memory.buf
+        self._write_header()
+
+    @staticmethod
+    def _create(name, size):
+        memory = shared_memory.SharedMemory(name = name, create = True, size = size)
+        memory.buf[:HEADER.size + 2 * SLOT_HEADER.size] = bytes(HEADER.size + 2 * SLOT_HEADER.size)
+        return memory
+
+    def _take_over(self, name, size):
+        """Take over the existing segment `name` of a publisher that died
+
+        Returns:
+            The segment that was taken over, or a new one replacing it
+
+        Raises:
+            FileExistsError: The publisher of the segment is still running
+
+        """
+        stale = _attach_segment(name)
+        magic, version, active, publish_count, generation, pid, retired = HEADER.unpack_from(stale.buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            logging.warning(f'Replacing shared memory segment {name} of an unknown layout')
+        elif _alive(pid) and not retired:
+            stale.close()
+            raise FileExistsError(f'Shared memory segment {name} is published by running process {pid}')
+        else:
+            self.generation = generation + 1
+            if stale.size >= size:
+                logging.warning(f'Taking over shared memory segment {name} of process {pid}')
+                # Slots keep their sequence numbers, so readers in the middle of a read still detect the next rewrite
+                self.size = stale.size
+                self._active, self._publish_count = active, publish_count
+                return _own(stale)
+            logging.warning(f'Replacing shared memory segment {name} of process {pid}, it is smaller than {size} bytes')
+            # Readers still mapping it attach to the replacement
+            HEADER.pack_into(stale.buf, 0, magic, version, active, publish_count, generation, pid, 1)
+        _own(stale).close()
+        stale.unlink()
+        return self._create(name, size)
+
+    def _write_header(self, retired = False):
+        HEADER.pack_into(self._buffer, 0, MAGIC, LAYOUT_VERSION, self._active, self._publish_count, self.generation, os.getpid(), retired)
+
+    def publish(self, jobs, servers):
+        """Write job and server records into the inactive slot and make it the active one"""
+        data, job_count, server_count = encode_slot(jobs, servers)
+        if SLOT_HEADER.size + len(data) > _slot_size(self.size):
+            raise SnapshotOverflow(f'Snapshot of {len(data)} bytes does not fit into a slot of {_slot_size(self.size)} bytes')
+
+        slot = 1 - self._active
+        offset = _slot_offset(self.size, slot)
+        seq = SLOT_HEADER.unpack_from(self._buffer, offset)[0]
+        # Odd if a publisher that died was writing the slot
+        seq += seq % 2
+
+        # Odd sequence number while the slot is being written
+        SLOT_HEADER.pack_into(self._buffer, offset, seq + 1, 0, 0, 0, 0)
+        self._buffer[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(data)] = data
+        SLOT_HEADER.pack_into(self._buffer, offset, seq + 2, time.time_ns(), job_count, server_count, len(data))
+
+        self._active = slot
+        self._publish_count += 1
+        self._write_header()
+
+    def poll_once(self):
+        """Refresh the farm state incrementally and publish it"""
+        self.catalogue.refresh(refetch_states = (BDC.JOBSTATE_ACTIVE,))
+        self.inventory.refresh_servers()
+        self.publish(self.catalogue.jobs.rows.values(), self.inventory.servers.rows.values())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as error:
+                logging.info(f'Publishing snapshot failed: {error!r}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start polling and publishing in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, daemon = True, name = 'SnapshotPublisher')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stop publishing and remove the shared memory segment, readers raise :obj:`SnapshotStale` from then on"""
+        self.stop()
+        self._write_header(retired = True)
+        self._buffer.release()
+        self._memory.close()
+        self._memory.unlink()
+
+class SnapshotReader:
+    """Reads the farm state published by a :obj:`SnapshotPublisher` in another process
+
+    Records are decoded straight from the shared memory with :mod:`struct`, nothing is pickled. Every read is validated with
+    the slot's sequence number and retried if the publisher rewrote the slot meanwhile.
+
+    Every read also checks that the publisher is still running. A reader still mapping a segment that was retired attaches
+    to the segment that replaced it, and a reader whose publisher is gone raises :obj:`SnapshotStale` instead of serving the
+    last snapshot forever.
+
+    Attributes:
+        name (str): Name of the shared memory segment
+        retries (int): Attempts at a consistent read before :obj:`SnapshotBusy` is raised
+        retry_delay (float): Seconds to sleep before another attempt while the slot is being written
+        max_age (float): Seconds after which a published snapshot is too old to be read, or `None`
+        generation (int): Generation of the segment at the last read, see :obj:`SnapshotPublisher`
+
+    """
+
+    def __init__(self, name = DEFAULT_NAME, retries = 1000, retry_delay = 0.001, max_age = None):
+        _require_shared_memory()
+        self.name = name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_age = max_age
+        self._memory = None
+        self._attach()
+
+    def _attach(self):
+        """Attach to the segment currently published as `name`, replacing the one attached before"""
+        memory = _attach_segment(self.name)
+        magic, version, *_ = header = HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            memory.close()
+            raise ValueError(f'Shared memory segment {self.name} does not contain a snapshot of layout version {LAYOUT_VERSION}')
+        if self._memory is not None:
+            self.close()
+        self._memory = memory
+        self._buffer = memory.buf
+        self.size = memory.size
+        self.generation = header[4]
+
+    def close(self):
+        self._buffer.release()
+        self._memory.close()
+
+    def _header(self):
+        """Returns the header of the live segment, attaching to the replacement of a retired one"""
+        header = HEADER.unpack_from(self._buffer, 0)
+        if header[6] or not _alive(header[5]):
+            try:
+                self._attach()
+            except FileNotFoundError:
+                raise SnapshotStale(f'Shared memory segment {self.name} no longer exists') from None
+            header = HEADER.unpack_from(self._buffer, 0)
+            if header[6] or not _alive(header[5]):
+                raise SnapshotStale(f'The publisher of shared memory segment {self.name}, process {header[5]}, is gone')
+        if header[4] != self.generation:
+            logging.info(f'Shared memory segment {self.name} was taken over by process {header[5]}')
+            self.generation = header[4]
+        return header
+
+    def _read(self, reader, check_age = True):
+        """Run `reader(slot data offset, job count, server count, string offset)` on the active slot until it reads a consistent state"""
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(self.retry_delay)
+            active = self._header()[2]
+            offset = _slot_offset(self.size, active)
+            seq, published_ns, job_count, server_count, _ = SLOT_HEADER.unpack_from(self._buffer, offset)
+            if seq == 0:
+                return None
+            if seq % 2:
+                continue
+            data = offset + SLOT_HEADER.size
+            strings = data + job_count * JOB_RECORD.size + server_count * SERVER_RECORD.size
+            try:
+                result = reader(data, job_count, server_count, strings)
+            except (UnicodeDecodeError, struct.error):
+                # Torn read of a slot that is being rewritten, unless the sequence number says otherwise
+                if SLOT_HEADER.unpack_from(self._buffer, offset)[0] == seq:
+                    raise
+                continue
+            if SLOT_HEADER.unpack_from(self._buffer, offset)[0] == seq:
+                if check_age and self.max_age is not None and time.time_ns() - published_ns > self.max_age * 1e9:
+                    raise SnapshotStale(f'Snapshot in shared memory segment {self.name} is older than {self.max_age} seconds')
+                return result
+        raise SnapshotBusy(f'No consistent read of shared memory segment {self.name} after {self.retries} attempts')
+
+    def _string(self, strings, offset, length):
+        start = strings + offset
+        return bytes(self._buffer[start:start + length]).decode('utf-8')
+
+    def _job(self, record, strings):
+        handle, state, priority, active, complete, number_tasks, tasks_completed, *refs = record
+        return JobEntry(handle, state, priority, bool(active), bool(complete), number_tasks, tasks_completed,
+                        self._string(strings, refs[0], refs[1]), self._string(strings, refs[2], refs[3]), self._string(strings, refs[4], refs[5]))
+
+    def _server(self, record, strings):
+        refs, values = record[:8], record[8:]
+        return ServerEntry(self._string(strings, refs[0], refs[1]), self._string(strings, refs[2], refs[3]),
+                           self._string(strings, refs[4], refs[5]), self._string(strings, refs[6], refs[7]), *values)
+
+    def published(self):
+        """Returns a two element tuple of the publish count and the publication time in seconds since the epoch, or `None` before the first publication"""
+        def reader(data, job_count, server_count, strings):
+            return HEADER.unpack_from(self._buffer, 0)[3], SLOT_HEADER.unpack_from(self._buffer, data - SLOT_HEADER.size)[1] / 1e9
+        return self._read(reader, check_age = False)
+
+    def jobs(self):
+        """Returns every job as a :obj:`JobEntry`, ordered by handle"""
+        def reader(data, job_count, server_count, strings):
+            return [self._job(record, strings) for record in JOB_RECORD.iter_unpack(self._buffer[data:data + job_count * JOB_RECORD.size])]
+        return self._read(reader) or []
+
+    def servers(self):
+        """Returns every server as a :obj:`ServerEntry`, ordered by handle"""
+        def reader(data, job_count, server_count, strings):
+            start = data + job_count * JOB_RECORD.size
+            return [self._server(record, strings) for record in SERVER_RECORD.iter_unpack(self._buffer[start:start + server_count * SERVER_RECORD.size])]
+        return self._read(reader) or []
+
+    def job(self, handle):
+        """Returns the :obj:`JobEntry` of one job by binary search, or `None`"""
+        def reader(data, job_count, server_count, strings):
+            low, high = 0, job_count
+            while low < high:
+                middle = (low + high) // 2
+                found = struct.unpack_from('<Q', self._buffer, data + middle * JOB_RECORD.size)[0]
+                if found < handle:
+                    low = middle + 1
+                elif found > handle:
+                    high = middle
+                else:
+                    return self._job(JOB_RECORD.unpack_from(self._buffer, data + middle * JOB_RECORD.size), strings)
+            return None
+        return self._read(reader)
+
+    def server(self, handle):
+        """Returns the :obj:`ServerEntry` of one server by binary search, or `None`"""
+        wanted = handle.encode('utf-8')
+
+        def reader(data, job_count, server_count, strings):
+            start = data + job_count * JOB_RECORD.size
+            low, high = 0, server_count
+            while low < high:
+                middle = (low + high) // 2
+                offset, length = struct.unpack_from('<II', self._buffer, start + middle * SERVER_RECORD.size)
+                found = bytes(self._buffer[strings + offset:strings + offset + length])
+                if found < wanted:
+                    low = middle + 1
+                elif found > wanted:
+                    high = middle
+                else:
+                    return self._server(SERVER_RECORD.unpack_from(self._buffer, start + middle * SERVER_RECORD.size), strings)
+            return None
+        return self._read(reader)
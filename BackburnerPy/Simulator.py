@@ -0,0 +1,385 @@
+"""Discrete-event simulation of the render queue
+
+The simulator replays how the Manager hands out tasks: whenever a server is free and its :obj:`ServerSchedule` allows it
+to render, it gets tasks of the job chosen by a policy, by default the job with the lowest priority value. Instead of one
+event per task, a server is given a batch of tasks of the same job that ends at its next schedule change, or after
+`quantum` seconds at the latest, so a week of farm time takes a few events per server and hour rather than one per frame.
+A shorter quantum follows priority changes more closely at the cost of more events.
+
+    >>> simulator = Simulator.from_catalogue(catalogue, inventory)
+    >>> baseline = simulator.run()
+    >>> rush = simulator.run(priorities = {1256275308: 0})
+    >>> rush.finished[1256275308] - baseline.finished[1256275308]
+
+Dependencies are only simulated when they are declared: the Manager reports whether a job has dependencies, but not on
+which jobs, so pass `dependencies` to :meth:`Simulator.from_catalogue` to model them.
+"""
+import bisect
+import datetime
+import heapq
+import logging
+from dataclasses import dataclass, field, replace
+
+import BackburnerDataClasses as BDC
+from CapacityPlanner import HOURS_PER_WEEK, hour_of_week, reference_task_seconds, week_mask
+
+@dataclass
+class SimJob:
+    """Job state in a simulation
+
+    Attributes:
+        handle (int)
+        priority (int): Lower values are served first
+        remaining_tasks (int): Tasks left to render
+        task_seconds (float): Seconds per task on a server with a `perf_index` of 1.0
+        plugin (str): Plug-in a server needs to render the job, or `None`
+        servers (:obj:`frozenset` of str): Handles of the servers the job may use, or `None` for all
+        nonconcurrent (bool): Render on one server at a time
+        suspended (bool): Suspended jobs are not rendered
+        depends_on (:obj:`frozenset` of int): Handles of jobs that have to finish first
+        max_servers (int): Maximum number of servers at the same time, or `None`
+
+    """
+    handle: int
+    priority: int
+    remaining_tasks: int
+    task_seconds: float
+    plugin: str = None
+    servers: frozenset = None
+    nonconcurrent: bool = False
+    suspended: bool = False
+    depends_on: frozenset = frozenset()
+    max_servers: int = None
+
+@dataclass
+class SimServer:
+    """Server in a simulation
+
+    Attributes:
+        handle (str)
+        perf_index (float): Relative speed, a task takes `task_seconds / perf_index`
+        week_mask (int): Hours of the week the server may render, see :func:`CapacityPlanner.week_mask`
+        plugins (:obj:`frozenset` of str): Installed plug-ins, or `None` if unknown
+
+    """
+    handle: str
+    perf_index: float
+    week_mask: int
+    plugins: frozenset = None
+
+@dataclass
+class SimulationResult:
+    """Outcome of :meth:`Simulator.run`
+
+    Attributes:
+        start (:obj:`datetime.datetime`): Start of the simulation
+        end (:obj:`datetime.datetime`): End of the simulated period
+        finished (dict): Mapping of job handle to its predicted completion (:obj:`datetime.datetime`)
+        remaining (dict): Mapping of the handles of unfinished jobs to their remaining tasks
+        busy_hours (float): Server hours spent rendering
+        events (int): Number of simulated events
+
+    """
+    start: datetime.datetime
+    end: datetime.datetime
+    finished: dict = field(default_factory = dict)
+    remaining: dict = field(default_factory = dict)
+    busy_hours: float = 0.0
+    events: int = 0
+
+    def hours_to_finish(self, handle):
+        """Returns the predicted hours until a job finishes, or `None` if it does not finish in the simulated period"""
+        finished = self.finished.get(handle)
+        return None if finished is None else (finished - self.start).total_seconds() / 3600.0
+
+class PriorityPolicy:
+    """The Manager's own policy: lowest priority value first, then the oldest job, i.e. the lowest handle
+
+    A free server gets the first job in the order of :meth:`order` it can render.
+
+    Attributes:
+        dynamic (bool): Whether the order depends on the number of servers rendering a job, such jobs are re-sorted
+            whenever a server starts or finishes a batch of their tasks
+
+    """
+    dynamic = False
+
+    def order(self, job, running):
+        """Returns the sort key of a job
+
+        Args:
+            job (:obj:`SimJob`)
+            running (int): Number of servers currently rendering the job
+
+        """
+        return (job.priority, job.handle)
+
+class FairSharePolicy(PriorityPolicy):
+    """Lowest priority value first, jobs of equal priority get servers in turn instead of oldest first"""
+    dynamic = True
+
+    def order(self, job, running):
+        return (job.priority, running, job.handle)
+
+class ShortestJobFirstPolicy(PriorityPolicy):
+    """Lowest priority value first, then the job with the least remaining work at the start"""
+
+    def order(self, job, running):
+        return (job.priority, job.remaining_tasks * job.task_seconds, job.handle)
+
+class _Schedule:
+    """Availability of one server as sorted change times within the week"""
+
+    def __init__(self, mask):
+        self.mask = mask
+        self.changes = [hour for hour in range(HOURS_PER_WEEK) if (mask >> hour & 1) != (mask >> (hour - 1) % HOURS_PER_WEEK & 1)]
+
+    def available(self, hour):
+        return self.mask >> (int(hour) % HOURS_PER_WEEK) & 1
+
+    def next_change(self, seconds):
+        """Returns the time of the next availability change after `seconds`, counted from Sunday 00:00, or `None`"""
+        if not self.changes:
+            return None
+        week, offset = divmod(seconds, HOURS_PER_WEEK * 3600)
+        index = bisect.bisect_right(self.changes, offset / 3600.0)
+        if index == len(self.changes):
+            return (week + 1) * HOURS_PER_WEEK * 3600 + self.changes[0] * 3600
+        return week * HOURS_PER_WEEK * 3600 + self.changes[index] * 3600
+
+class Simulator:
+    """Predicts queue completion times under different priorities, policies and server allocations
+
+    Attributes:
+        jobs (:obj:`list` of :obj:`SimJob`): Jobs as seeded, left unchanged by :meth:`run`
+        servers (:obj:`list` of :obj:`SimServer`)
+        policy: Default policy, see :obj:`PriorityPolicy`
+        quantum (float): Maximum seconds of work handed to a server at once
+
+    """
+
+    def __init__(self, jobs, servers, policy = None, quantum = 3600.0):
+        self.jobs = list(jobs)
+        self.servers = list(servers)
+        self.policy = policy or PriorityPolicy()
+        self.quantum = quantum
+
+    @classmethod
+    def from_catalogue(cls, catalogue, inventory, policy = None, default_task_seconds = 600.0, dependencies = None, quantum = 3600.0):
+        """Seed a simulator with live state
+
+        Task times are the observed ones of each job, see :func:`CapacityPlanner.reference_task_seconds`, or
+        `default_task_seconds` for jobs that have not rendered a task yet.
+
+        Args:
+            catalogue (:obj:`JobCatalogue`): Refreshed job catalogue
+            inventory (:obj:`ServerInventory`): Refreshed server inventory
+            dependencies (dict): Mapping of job handle to the handles of the jobs it waits for
+
+        """
+        dependencies = dependencies or {}
+        server_details = {handle: record.server for handle, record in inventory.servers.rows.items()}
+        servers = [SimServer(handle, server.perf_index if server.perf_index > 0 else 1.0, week_mask(server.server_schedule),
+                             frozenset(plugin.name for plugin in server.plugins) if server.plugins else None)
+                   for handle, server in server_details.items()]
+
+        jobs = []
+        undeclared = 0
+        for record in catalogue.jobs.rows.values():
+            job = record.job
+            remaining = job.info.number_tasks - job.info.tasks_completed
+            if record.state == BDC.JOBSTATE_COMPLETED or job.flags.complete or remaining <= 0:
+                continue
+            if job.flags.has_dependencies and record.handle not in dependencies:
+                undeclared += 1
+            task_seconds = reference_task_seconds(job, server_details) or default_task_seconds
+            jobs.append(SimJob(record.handle, job.info.priority, remaining, task_seconds, job.plugin.plugin_name,
+                               frozenset(server.handle for server in job.servers) or None, job.flags.nonconcurrent,
+                               record.state == BDC.JOBSTATE_SUSPENDED, frozenset(dependencies.get(record.handle, ()))))
+        if undeclared:
+            logging.info(f'{undeclared} jobs have dependencies that were not declared and are simulated independently')
+        return cls(jobs, servers, policy, quantum)
+
+    def run(self, hours = HOURS_PER_WEEK, start = None, policy = None, priorities = None, max_servers = None, schedules = None, suspended = None):
+        """Simulate the queue
+
+        The overrides describe a "what if" and leave the seeded jobs and servers unchanged.
+
+        Args:
+            hours (float): Simulated period
+            start (:obj:`datetime.datetime`): Start of the simulation, defaults to now
+            policy: Policy overriding the default one
+            priorities (dict): Mapping of job handle to a new priority
+            max_servers (dict): Mapping of job handle to the maximum number of servers it may use at once
+            schedules (dict): Mapping of server handle to a new :obj:`ServerSchedule` or week mask
+            suspended (dict): Mapping of job handle to `True` to suspend or `False` to resume the job
+
+        Returns:
+            A :obj:`SimulationResult` object
+
+        """
+        start = start or datetime.datetime.now()
+        policy = policy or self.policy
+        priorities, max_servers, schedules, suspended = priorities or {}, max_servers or {}, schedules or {}, suspended or {}
+
+        jobs = {}
+        for job in self.jobs:
+            changes = {}
+            if job.handle in priorities:
+                changes['priority'] = priorities[job.handle]
+            if job.handle in max_servers:
+                changes['max_servers'] = max_servers[job.handle]
+            if job.handle in suspended:
+                changes['suspended'] = suspended[job.handle]
+            jobs[job.handle] = replace(job, **changes) if changes else job
+
+        servers = []
+        for server in self.servers:
+            schedule = schedules.get(server.handle)
+            if schedule is not None:
+                server = replace(server, week_mask = schedule if isinstance(schedule, int) else week_mask(schedule))
+            servers.append((server, _Schedule(server.week_mask)))
+
+        return _Run(self, jobs, servers, policy, start, hours).result
+
+class _Run:
+    """State of one simulation run, times are seconds since the start"""
+
+    def __init__(self, simulator, jobs, servers, policy, start, hours):
+        self.jobs = jobs
+        self.policy = policy
+        self.quantum = simulator.quantum
+        self.start = start
+        # Offset of the start from Sunday 00:00, to look up schedules
+        self.offset = hour_of_week(start) * 3600 + start.minute * 60 + start.second
+        self.horizon = hours * 3600.0
+        self.unassigned = {handle: job.remaining_tasks for handle, job in jobs.items()}
+        self.running = {}
+        self.finished = {}
+        # Jobs with tasks left to hand out sorted by their keys, fully assigned jobs leave the queue
+        queued = sorted((policy.order(job, 0), job) for job in jobs.values() if job.remaining_tasks > 0 and not job.suspended)
+        self.keys = [key for key, job in queued]
+        self.queue = [job for key, job in queued]
+        self.dependents = {dependency for job in self.queue for dependency in job.depends_on}
+        self.result = SimulationResult(start, start + datetime.timedelta(hours = hours))
+        self.idle = set()
+        self.busy = set()
+        self.events = []
+        self.sequence = 0
+
+        for index, (server, schedule) in enumerate(servers):
+            self._schedule_change(index, schedule, 0.0)
+        self.servers = servers
+        for index, (server, schedule) in enumerate(servers):
+            if schedule.available(self.offset // 3600):
+                self._dispatch(index, 0.0)
+        self._loop()
+
+    def _push(self, time, kind, *payload):
+        self.sequence += 1
+        heapq.heappush(self.events, (time, self.sequence, kind, payload))
+
+    def _schedule_change(self, index, schedule, now):
+        change = schedule.next_change(self.offset + now)
+        if change is not None:
+            self._push(change - self.offset, 'schedule', index)
+
+    def _eligible(self, job, server):
+        running = self.running.get(job.handle, 0)
+        if (job.nonconcurrent and running) or (job.max_servers is not None and running >= job.max_servers):
+            return False
+        if job.servers is not None and server.handle not in job.servers:
+            return False
+        if job.plugin and server.plugins is not None and job.plugin not in server.plugins:
+            return False
+        return all(dependency in self.finished or dependency not in self.jobs for dependency in job.depends_on)
+
+    def _select(self, server):
+        for job in self.queue:
+            if self._eligible(job, server):
+                return job
+        return None
+
+    def _dequeue(self, job, running):
+        index = bisect.bisect_left(self.keys, self.policy.order(job, running))
+        del self.keys[index]
+        del self.queue[index]
+
+    def _enqueue(self, job, running):
+        key = self.policy.order(job, running)
+        index = bisect.bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.queue.insert(index, job)
+
+    def _set_running(self, job, running):
+        """Update the number of servers rendering a job, and its place in the queue if the policy depends on it"""
+        previous = self.running.get(job.handle, 0)
+        self.running[job.handle] = running
+        if self.unassigned[job.handle] > 0 and self.policy.dynamic:
+            self._dequeue(job, previous)
+            self._enqueue(job, running)
+
+    def _dispatch(self, index, now):
+        server, schedule = self.servers[index]
+        if not schedule.available((self.offset + now) // 3600):
+            return
+        job = self._select(server)
+        if job is None:
+            self.idle.add(index)
+            return
+        self.idle.discard(index)
+        self.busy.add(index)
+
+        duration = job.task_seconds / server.perf_index
+        window = now + self.quantum
+        change = schedule.next_change(self.offset + now)
+        if change is not None:
+            window = min(window, change - self.offset)
+        # A started task is always finished, even if the schedule ends first
+        tasks = min(self.unassigned[job.handle], max(1, int((window - now) // duration)))
+        running = self.running.get(job.handle, 0)
+        self.unassigned[job.handle] -= tasks
+        if not self.unassigned[job.handle]:
+            self._dequeue(job, running)
+        self._set_running(job, running + 1)
+        self._push(now + tasks * duration, 'done', index, job.handle, tasks, duration)
+
+    def _wake_idle(self, now):
+        for index in list(self.idle):
+            self._dispatch(index, now)
+
+    def _loop(self):
+        result = self.result
+        remaining = {handle: job.remaining_tasks for handle, job in self.jobs.items()}
+        while self.events:
+            now, _, kind, payload = heapq.heappop(self.events)
+            if now > self.horizon:
+                break
+            result.events += 1
+            if kind == 'schedule':
+                index = payload[0]
+                server, schedule = self.servers[index]
+                self._schedule_change(index, schedule, now)
+                if schedule.available((self.offset + now) // 3600):
+                    if index not in self.busy:
+                        self._dispatch(index, now)
+                else:
+                    self.idle.discard(index)
+                continue
+
+            index, handle, tasks, duration = payload
+            job = self.jobs[handle]
+            remaining[handle] -= tasks
+            self._set_running(job, self.running[handle] - 1)
+            self.busy.discard(index)
+            result.busy_hours += tasks * duration / 3600.0
+            freed = job.nonconcurrent or job.max_servers is not None
+            if remaining[handle] <= 0:
+                self.finished[handle] = now
+                result.finished[handle] = self.start + datetime.timedelta(seconds = now)
+                freed = freed or handle in self.dependents
+            self._dispatch(index, now)
+            if freed and self.idle:
+                self._wake_idle(now)
+
+        result.remaining = {handle: count for handle, count in remaining.items() if count > 0}
@@ -0,0 +1,139 @@
+import logging
+
+import BackburnerDataClasses as BDC
+from Indexes import Table, TableChanges
+
+TASK_HASH_INDEXES = {
+    'state': lambda task: task.state,
+    'server': lambda task: task.server,
+}
+
+TASK_RANGE_INDEXES = {
+    'task_id': lambda task: task.task_id,
+}
+
+class TaskTracker:
+    """Indexed, incrementally refreshed view of the tasks of one job
+
+    The task list is only fetched when the job's progress changed, i.e. its `tasks_completed`, `number_tasks` or
+    `last_updated`. Completed tasks stay completed while `tasks_completed` keeps rising, so after the first fetch only the
+    tasks that were not completed yet are fetched again, in pages of `page_size` tasks. When `tasks_completed` goes down,
+    e.g. because tasks were restarted, the whole list is fetched again. Tasks are streamed with
+    :meth:`Monitor.iter_task_list`, so even jobs with tens of thousands of frames are never decoded as one document.
+
+    Example:
+
+        >>> tracker = TaskTracker(monitor, 1256275308)
+        >>> tracker.refresh()
+        >>> failed = tracker.tasks_in_state(BDC.TASKSTATE_ERROR)
+
+    Attributes:
+        monitor (:obj:`Monitor`): Monitor with an open connection to the Manager
+        job_handle (int): Handle of the tracked job
+        page_size (int): Maximum number of tasks requested at once
+        tasks (:obj:`Table`): :obj:`Task` rows keyed by task id
+
+    """
+
+    def __init__(self, monitor, job_handle, page_size = 500):
+        self.monitor = monitor
+        self.job_handle = job_handle
+        self.page_size = page_size
+        self.tasks = Table(TASK_HASH_INDEXES, TASK_RANGE_INDEXES)
+        self._progress = None
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def _open_pages(self):
+        """Returns `(first, count)` pages covering every task that is not completed, and every task not seen yet"""
+        completed = self.tasks.hash_indexes['state'].lookup(BDC.TASKSTATE_COMPLETED)
+        pages = []
+        first = None
+        for task_id in range(self._progress[0]):
+            if task_id in completed:
+                if first is not None:
+                    pages.append((first, task_id - first))
+                    first = None
+            elif first is None:
+                first = task_id
+            elif task_id - first == self.page_size:
+                pages.append((first, self.page_size))
+                first = task_id
+        if first is not None:
+            pages.append((first, self._progress[0] - first))
+        return pages
+
+    def refresh(self, job = None, full = False):
+        """Synchronise the tasks with the Manager
+
+        Args:
+            job (:obj:`Job`): The job as just returned by :meth:`Monitor.get_job`, fetched if not given
+            full (bool): Fetch every task, changed or not
+
+        Returns:
+            A :obj:`TableChanges` object listing the affected task ids
+
+        """
+        if job is None:
+            job = self.monitor.get_job(str(self.job_handle))
+        progress = (job.info.number_tasks, job.info.tasks_completed, job.info.last_updated)
+        changes = TableChanges()
+        if progress == self._progress and not full:
+            return changes
+
+        previous, self._progress = self._progress, progress
+        full = full or previous is None or progress[0] != previous[0] or progress[1] < previous[1]
+        if full:
+            pages = [(None, None)]
+        else:
+            pages = self._open_pages()
+
+        seen = set()
+        try:
+            for first, count in pages:
+                for task in self.monitor.iter_task_list(self.job_handle, first, count):
+                    seen.add(task.task_id)
+                    current = self.tasks.get(task.task_id)
+                    if current == task:
+                        continue
+                    self.tasks.upsert(task.task_id, task)
+                    (changes.updated if current is not None else changes.added).append(task.task_id)
+        except BaseException:
+            # Tasks of the pages that were not fetched may be outdated, so fetch everything next time
+            self._progress = None
+            raise
+
+        if full:
+            for task_id in [task_id for task_id in self.tasks.rows if task_id not in seen]:
+                self.tasks.remove(task_id)
+                changes.removed.append(task_id)
+
+        logging.debug(f'Tasks of job {self.job_handle} refreshed in {len(pages)} pages: {changes}')
+        return changes
+
+    def get_task(self, task_id):
+        """Returns the :obj:`Task` with `task_id`, or `None`"""
+        return self.tasks.get(task_id)
+
+    def tasks_in_state(self, state, limit = None):
+        """Returns the tasks in `state` ordered by task id, e.g. the failed frames to retry
+
+        Returns:
+            A :obj:`list` of :obj:`Task` objects
+
+        """
+        return self.tasks.query(where = {'state': state}, order_by = 'task_id', limit = limit)
+
+    def tasks_on_server(self, server_handle):
+        """Returns the tasks assigned to a server ordered by task id
+
+        Returns:
+            A :obj:`list` of :obj:`Task` objects
+
+        """
+        return self.tasks.query(where = {'server': server_handle}, order_by = 'task_id')
+
+    def count(self, **where):
+        """Returns the number of tasks matching all given hash index values, e.g. `count(state=BDC.TASKSTATE_COMPLETED)`"""
+        return self.tasks.count(where)
@@ -0,0 +1,216 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+
+import BackburnerDataClasses as BDC
+import Serialisers
+from Inventory import ServerRecord
+from JobCatalogue import JobRecord
+
+MAGIC = b'BBWS'
+
+# Bumped whenever the data classes change, files of other versions are ignored
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<4sH')
+
+@dataclass
+class FarmState:
+    """Farm state persisted by :obj:`WarmStart`
+
+    Attributes:
+        saved_at (float): Time the state was saved, as returned by `time.time()`
+        manager (str): 'ip:port' of the Manager the state was read from
+        manager_info (:obj:`BackburnerManagerInfo`): Manager information, or `None`
+        jobs (:obj:`list` of :obj:`JobRecord`)
+        servers (:obj:`list` of :obj:`ServerRecord`)
+
+    """
+    saved_at: float
+    manager: str
+    manager_info: BDC.BackburnerManagerInfo = None
+    jobs: list = field(default_factory = list)
+    servers: list = field(default_factory = list)
+
+Serialisers.register_list_item_type(FarmState, 'jobs', JobRecord)
+Serialisers.register_list_item_type(FarmState, 'servers', ServerRecord)
+
+def save_state(path, state):
+    """Write a :obj:`FarmState` to `path` as zlib compressed MessagePack
+
+    The file is written next to `path` first and then renamed, so readers and crashes never leave a partial file behind.
+    """
+    data = HEADER.pack(MAGIC, FORMAT_VERSION) + zlib.compress(Serialisers.packb(state), 6)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+    logging.debug(f'Saved {len(state.jobs)} jobs and {len(state.servers)} servers to {path} ({len(data)} bytes)')
+
+def load_state(path):
+    """Read a :obj:`FarmState` written by :func:`save_state`
+
+    Returns:
+        The :obj:`FarmState`, or `None` if the file does not exist, was written by another format version or is damaged
+
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < HEADER.size:
+        logging.info(f'Ignoring warm start file {path}: too short')
+        return None
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        logging.info(f'Ignoring warm start file {path}: format {magic!r} version {version}')
+        return None
+    try:
+        return Serialisers.unpackb(FarmState, zlib.decompress(data[HEADER.size:]))
+    except Exception as error:
+        logging.info(f'Ignoring warm start file {path}: {error!r}')
+        return None
+
+class WarmStart:
+    """Persists a :obj:`JobCatalogue` and a :obj:`ServerInventory` so that a restarted service has data right away
+
+    On startup :meth:`load` fills both from the file and marks them stale. :meth:`revalidate` then brings them up to date
+    with the cheap job handle and server lists, fetching details only for jobs and servers whose state changed, instead of
+    calling :meth:`Monitor.get_job` and :meth:`Monitor.get_server` for everything. While running, the state is saved every
+    `interval` seconds by :meth:`start`, and once more by :meth:`stop`.
+
+    :meth:`save` takes its snapshot under the same lock as :meth:`refresh` and :meth:`revalidate`, so it never sees the
+    tables halfway through an update. While :meth:`start` is saving in the background, refresh the tables through these
+    methods rather than through the catalogue and inventory directly, or call :meth:`save` from the polling thread instead.
+
+    Example:
+
+        >>> warm_start = WarmStart(catalogue, inventory, '/var/cache/backburner.state')
+        >>> warm_start.load()
+        >>> warm_start.start()
+        >>> warm_start.revalidate()
+        >>> warm_start.refresh(refetch_states = (BDC.JOBSTATE_ACTIVE,))
+
+    Attributes:
+        catalogue (:obj:`JobCatalogue`)
+        inventory (:obj:`ServerInventory`)
+        path (str): Path of the state file
+        interval (float): Seconds between periodic saves
+        stale (bool): `True` while loaded data has not been revalidated yet
+        manager_info (:obj:`BackburnerManagerInfo`): Latest Manager information, saved along with the tables
+        saved_at (float): Time of the loaded or last saved state, or `None`
+
+    """
+
+    def __init__(self, catalogue, inventory, path, interval = 60.0):
+        self.catalogue = catalogue
+        self.inventory = inventory
+        self.path = path
+        self.interval = interval
+        self.stale = False
+        self.manager_info = None
+        self.saved_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _manager(self):
+        monitor = self.catalogue.monitor
+        return f'{monitor.MANAGER_IP}:{monitor.MANAGER_PORT}'
+
+    def load(self):
+        """Fill the catalogue and inventory from the state file if it belongs to the same Manager
+
+        Returns:
+            `True` if a state was loaded
+
+        """
+        state = load_state(self.path)
+        if state is None:
+            return False
+        if state.manager != self._manager():
+            logging.info(f'Ignoring warm start file {self.path}: it belongs to Manager {state.manager}')
+            return False
+
+        with self._lock:
+            for record in state.jobs:
+                self.catalogue.jobs.upsert(record.handle, record)
+            for record in state.servers:
+                self.inventory.servers.upsert(record.handle, record)
+            self.manager_info = state.manager_info
+            self.saved_at = state.saved_at
+            self.stale = True
+        logging.info(f'Loaded {len(state.jobs)} jobs and {len(state.servers)} servers saved {time.time() - state.saved_at:.0f}s ago')
+        return True
+
+    def revalidate(self, refetch_states = ()):
+        """Bring loaded data up to date using the job handle and server lists
+
+        Returns:
+            A two element tuple containing the job and server :obj:`TableChanges`
+
+        """
+        with self._lock:
+            job_changes = self.catalogue.revalidate(refetch_states)
+            server_changes = self.inventory.refresh_servers()
+            self.stale = False
+        return job_changes, server_changes
+
+    def refresh(self, full = False, refetch_states = ()):
+        """Synchronise the catalogue and inventory with the Manager, see :meth:`JobCatalogue.refresh`
+
+        Returns:
+            A two element tuple containing the job and server :obj:`TableChanges`
+
+        """
+        with self._lock:
+            job_changes = self.catalogue.refresh(full, refetch_states)
+            server_changes = self.inventory.refresh_servers(full)
+            self.stale = False
+        return job_changes, server_changes
+
+    def save(self, manager_info = None):
+        """Write the current state to the file, see :func:`save_state`"""
+        with self._lock:
+            if manager_info is not None:
+                self.manager_info = manager_info
+            state = FarmState(time.time(), self._manager(), self.manager_info,
+                              list(self.catalogue.jobs.rows.values()), list(self.inventory.servers.rows.values()))
+        save_state(self.path, state)
+        self.saved_at = state.saved_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as error:
+                logging.info(f'Saving warm start file {self.path} failed: {error!r}')
+
+    def start(self):
+        """Save the state every `interval` seconds in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, daemon = True, name = 'WarmStart')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and save the state a last time"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
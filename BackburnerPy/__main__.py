@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules of BackburnerPy import each other by their plain names
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Cli import main
+
+sys.exit(main())
@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(sys.path[0]),'BackburnerPy'))
+
+from DecodePool import DecodePool, decode_payload
+
+# This benchmark shows how decoding large replies affects the latency of other I/O threads in the same process
+# Launch it without arguments, or with the number of archived jobs in the large payload
+# For example: `python decode_pool_benchmark.py 20000`
+#
+# A ticker thread wakes up every millisecond, like a thread waiting on a socket, and records how late it wakes up.
+# Meanwhile the main thread decodes a mix of large job archive payloads and small manager info payloads, first inline and then
+# through a DecodePool, which sends the large payloads to worker processes.
+
+ARCHIVED_JOBS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+ROUNDS = 5
+SMALL_PER_ROUND = 50
+
+def archive_payload(count):
+    jobs = ''.join(f'<Job><Handle>{1256275308 + index}</Handle><Name>shot_{index:05d}</Name><User>artist</User>'
+                   f'<Description>benchmark job</Description><SubmissionDate>2019/01/01 10:00:00</SubmissionDate>'
+                   f'<CompletionDate>2019/01/01 11:00:00</CompletionDate><PluginName>3dsmax</PluginName>'
+                   f'<PluginVersion>1</PluginVersion></Job>' for index in range(count))
+    return f'<JobArchive>{jobs}</JobArchive>\0'.encode('utf-8')
+
+def manager_info_payload():
+    system = '<SystemInfo><TotalMemory>1</TotalMemory><TotalMemoryF>1.0</TotalMemoryF><NumCpus>8</NumCpus><Platform>Windows</Platform>' \
+             '<User>render</User><ComputerName>manager</ComputerName><MAC>000000000000</MAC><WorkDiskSpace>1</WorkDiskSpace>' \
+             '<IPAddress>127.0.0.1</IPAddress></SystemInfo>'
+    network = '<NetworkStatus><DroppedPackets>0</DroppedPackets><BadPackets>0</BadPackets><TCPRequests>1</TCPRequests>' \
+              '<UDPRequests>1</UDPRequests><BootTime>2019/01/01 10:00:00</BootTime></NetworkStatus>'
+    return f'<ManagerInfo><Version>1</Version><Servers>1</Servers><Jobs>1</Jobs>{system}{network}</ManagerInfo>\0'.encode('utf-8')
+
+def run(label, decode):
+    lateness = []
+    stop = threading.Event()
+
+    def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.001)
+            lateness.append(time.perf_counter() - start - 0.001)
+
+    thread = threading.Thread(target = ticker)
+    thread.start()
+    start = time.perf_counter()
+    decode()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+
+    lateness.sort()
+    p99 = lateness[int(0.99 * (len(lateness) - 1))]
+    print(f'{label:<12} total {elapsed * 1000:8.1f} ms   ticker late: median {statistics.median(lateness) * 1000:6.2f} ms  '
+          f'p99 {p99 * 1000:6.2f} ms  max {lateness[-1] * 1000:7.2f} ms')
+
+def main():
+    large = archive_payload(ARCHIVED_JOBS)
+    small = manager_info_payload()
+    print(f'Large payload: {len(large) / 1024:.0f} KiB ({ARCHIVED_JOBS} archived jobs), small payload: {len(small)} bytes')
+
+    def inline():
+        for _ in range(ROUNDS):
+            decode_payload('decode_jobarchive', large)
+            for _ in range(SMALL_PER_ROUND):
+                decode_payload('decode_manager_info', small)
+
+    pool = DecodePool()
+    # Start the workers before measuring
+    pool.submit('decode_jobarchive', large).result()
+
+    def pooled():
+        futures = []
+        for _ in range(ROUNDS):
+            futures.append(pool.submit('decode_jobarchive', large))
+            for _ in range(SMALL_PER_ROUND):
+                futures.append(pool.submit('decode_manager_info', small))
+        for future in futures:
+            future.result()
+
+    run('idle', lambda: time.sleep(0.5))
+    run('inline', inline)
+    run('DecodePool', pooled)
+    pool.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Minimal Backburner Manager speaking the console protocol over TCP, for the tests"""
+import socket
+import threading
+import time
+
+def element(tag, *children, text = None):
+    if text is not None:
+        text = str(text).replace('&', '&amp;').replace('<', '&lt;')
+        return f'<{tag}>{text}</{tag}>'
+    return f'<{tag}>' + ''.join(children) + f'</{tag}>'
+
+def values(tag, items):
+    return element(tag, *[element('Value', text = item) for item in items])
+
+class Farm:
+    """State of the fake farm, shared by all connections
+
+    Attributes:
+        jobs (dict): Job handle to a dict with state, name, user, priority, tasks and done
+        servers (dict): Server handle to a dict with name, state, ip, cpus, memory, perf, disk and job
+        delays (dict): Command prefix to seconds slept before answering, e.g. `{'set jobstate': 0.5}`
+        controller (bool): Whether 'del controller Yes' is granted
+        commands (list): Every command received, in order
+        connections (int): Number of connections accepted
+
+    """
+
+    def __init__(self, jobs = 4, servers = 2):
+        self.jobs = {1000 + i: dict(state = 2 if i % 2 == 0 else 1, name = f'job{i}', user = f'user{i % 2}', priority = 50 - i,
+                                    tasks = 100, done = i * 10, servers = [f'srv{k}' for k in range(servers)]) for i in range(jobs)}
+        self.servers = {f'srv{k}': dict(name = f'node{k}', state = 1, ip = f'10.0.0.{k}', cpus = 8, memory = 16384, perf = 1.0,
+                                        disk = 500000, job = -1) for k in range(servers)}
+        self.delays = {}
+        self.controller = True
+        self.commands = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def count(self, prefix):
+        """Returns the number of received commands starting with `prefix`"""
+        with self.lock:
+            return sum(command.startswith(prefix) for command in self.commands)
+
+    def payload(self, parts):
+        if parts[:2] == ['get', 'mgrinfo']:
+            return element('ManagerInfo', element('Version', text = 1), element('Servers', text = len(self.servers)),
+                           element('Jobs', text = len(self.jobs)),
+                           values('SystemInfo', [16384, 1.0, 8, 'win', 'render', 'manager', '00:11:22:33:44:ff', 500000, '127.0.0.1']),
+                           values('NetworkStatus', [0, 0, 0, 0, 'boot']))
+        if parts[:2] == ['get', 'srvlist']:
+            return element('ServerList', *[element('Server', element('Handle', text = handle), element('State', text = server['state']),
+                                                   element('Name', text = server['name'])) for handle, server in self.servers.items()])
+        if parts[:2] == ['get', 'jobhlist']:
+            return element('JobList', *[element('Job', element('Handle', text = handle), element('State', text = job['state']))
+                                        for handle, job in self.jobs.items()])
+        if parts[:2] == ['get', 'joblist']:
+            return element('JobList', *[element('Job', element('Handle', text = handle), element('State', text = job['state']),
+                                                element('Name', text = job['name']), element('PluginName', text = '3dsmax'),
+                                                element('PluginVersion', text = 1)) for handle, job in self.jobs.items()])
+        if parts[:2] == ['get', 'tasklist']:
+            job = self.jobs[int(parts[2])]
+            ids = range(job['tasks']) if len(parts) == 3 else range(int(parts[3]), min(job['tasks'], int(parts[3]) + int(parts[4])))
+            return element('TaskList', *[element('Task', element('TaskID', text = task), element('TaskName', text = f'frame{task:04d}'),
+                                                 element('TaskState', text = 2 if task < job['done'] else 0),
+                                                 element('ServerHandle', text = 'srv0' if task < job['done'] else ''),
+                                                 element('StartTime', text = 's'), element('EndTime', text = 'e')) for task in ids])
+        if parts[:2] == ['get', 'jobinfo'] and parts[2] in self.servers:
+            server = self.servers[parts[2]]
+            return element('Server',
+                values('Info', [1, server['name'], 'render', 10, 1.5, server['perf'], server['ip'], server['state']]),
+                values('HardwareInfo', [server['memory'], 1.0, server['cpus'], 'win', server['disk'], '00:11:22:33:44:55']),
+                values('NetworkStatus', [0, 0, 0, 0, 'boot']),
+                values('Schedule', [0xFFFFFF] * 7),
+                values('Priority', [0, 0]),
+                values('Current', [server['job'], -1, '']),
+                element('Plugins', element('Plugin', element('Name', text = '3dsmax'), element('Version', text = 1),
+                                           element('Description', text = 'd'))))
+        if parts[:2] == ['get', 'jobinfo']:
+            handle = int(parts[2])
+            job = self.jobs[handle]
+            return element('Job',
+                values('Info', [1, handle, job['name'], 'd', job['priority'], job['user'], 'pc', 'updated', 'submitted', 'started',
+                                'ended', job['tasks'], job['done'], 'utf-8']),
+                values('Flags', ['Yes' if index == 0 and job['state'] == 2 else 'No' for index in range(12)]),
+                values('ServerList', ['Yes']),
+                values('Plugin', ['3dsmax', 1]),
+                values('Alerts', [0, 'No', 'No', 'No', 5, 'No', 'No', 'from', 'to', 'smtp']),
+                element('Servers', *[values('Server', [server, 'Yes', 60.0, 5, 0, 'No']) for server in job['servers']]))
+        return None
+
+    def reply(self, command, controller):
+        """Returns the reply to `command` and the new controller status"""
+        parts = command.split()
+        if parts[:2] == ['del', 'controller']:
+            if parts[2] == 'Yes' and not self.controller:
+                return b'403 Controller denied\r\n', controller
+            return b'200 OK\r\n', parts[2] == 'Yes'
+        if parts[:2] == ['set', 'jobstate']:
+            if not controller:
+                return b'401 Not controller\r\n', controller
+            self.jobs[int(parts[2])]['state'] = int(parts[3])
+            return b'200 OK\r\n', controller
+        if parts[:2] == ['get', 'jobstate']:
+            return f'200 {self.jobs[int(parts[2])]["state"]}\r\n'.encode(), controller
+        with self.lock:
+            payload = self.payload(parts)
+        if payload is None:
+            return b'500 Unknown command\r\n', controller
+        data = (payload + '\0').encode('utf-8')
+        return f'251 {len(data)}\r\n'.encode() + data, controller
+
+def _handle(connection, farm):
+    connection.sendall(b'250 backburner 1.0 Ready.\r\nbackburner>')
+    controller = False
+    buffer = b''
+    with connection:
+        while True:
+            try:
+                data = connection.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while b'\r\n' in buffer:
+                line, buffer = buffer.split(b'\r\n', 1)
+                command = line.decode('utf-8')
+                with farm.lock:
+                    farm.commands.append(command)
+                    delay = max([seconds for prefix, seconds in farm.delays.items() if command.startswith(prefix)], default = 0)
+                time.sleep(delay)
+                reply, controller = farm.reply(command, controller)
+                try:
+                    connection.sendall(reply + (b'backburner(Controller)>' if controller else b'backburner>'))
+                except OSError:
+                    return
+
+def serve(farm):
+    """Serve `farm` on a free local port in background threads
+
+    Returns:
+        A two element tuple containing the port and a function stopping the server
+
+    """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(50)
+
+    def accept():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            with farm.lock:
+                farm.connections += 1
+            threading.Thread(target = _handle, args = (connection, farm), daemon = True).start()
+
+    threading.Thread(target = accept, daemon = True).start()
+    return listener.getsockname()[1], listener.close
@@ -0,0 +1,30 @@
+"""Data class objects and records shared by the tests"""
+import BackburnerDataClasses as BDC
+from Inventory import ServerRecord
+from JobCatalogue import JobRecord
+
+def job(handle, name = None, user = 'alice', priority = 50, number_tasks = 100, tasks_completed = 0, active = True,
+        complete = False, plugin_name = '3dsmax', submitted = '2020/01/01 10:00:00', servers = ()):
+    info = BDC.JobInfo(1, handle, name or f'job{handle}', 'description', priority, user, 'workstation', 'updated', submitted,
+                       'started', 'ended', number_tasks, tasks_completed, 'utf-8')
+    flags = BDC.JobFlags(active, complete, False, False, False, False, False, False, False, False, False, False)
+    alerts = BDC.JobAlerts(False, False, False, False, 0, False, False, '', '', '')
+    return BDC.Job(info, flags, BDC.JobPlugin(plugin_name, 1), alerts, list(servers))
+
+def job_server(handle, active = True, task_time = 60.0, task_total = 1, rt_failed = False):
+    return BDC.JobServer(handle, active, task_time, task_total, 0, rt_failed)
+
+def server(name, ip_address = '10.0.0.1', mac = '00:11:22:33:44:55', num_cpus = 16, total_memory = 32768, perf_index = 1.0,
+           current_status = 1, workdisk_space = 500000, current_job = -1, current_task = -1, plugins = ()):
+    hw_info = BDC.HardwareInfo(total_memory, float(total_memory), num_cpus, 'win', workdisk_space, mac)
+    network_status = BDC.NetworkStatus(0, 0, 0, 0, 'boot')
+    schedule = BDC.ServerSchedule(*[0xFFFFFF] * 7)
+    return BDC.Server(1, name, 'render', 0, 0.0, perf_index, ip_address, current_status, hw_info, network_status, schedule,
+                      False, False, current_job, current_task, '', [BDC.Plugin(1, plugin, '') for plugin in plugins])
+
+def job_record(handle, state = 2, **kwargs):
+    details = job(handle, **kwargs)
+    return JobRecord(handle, state, details.info.name, details)
+
+def server_record(handle, state = 1, **kwargs):
+    return ServerRecord(handle, state, server(kwargs.pop('name', f'node-{handle}'), **kwargs))
@@ -0,0 +1,173 @@
+import os
+import sys
+import unittest
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+import BackburnerDataClasses as BDC
+from Alerts import ALERT_FIRING, ALERT_RESOLVED, AlertEngine, CallbackSink, FarmRule, Rule, StallRule, failed_servers
+from Indexes import TableChanges
+from JobCatalogue import JobCatalogue
+
+def changes(added = (), updated = (), removed = ()):
+    result = TableChanges()
+    result.added.extend(added)
+    result.updated.extend(updated)
+    result.removed.extend(removed)
+    return result
+
+def progressed(record, tasks_completed):
+    job = record.job
+    return replace(record, job = replace(job, info = replace(job.info, tasks_completed = tasks_completed)))
+
+class AlertTestCase(unittest.TestCase):
+    """Feeds the jobs of a :obj:`JobCatalogue` filled without a Manager to an :obj:`AlertEngine`"""
+
+    def setUp(self):
+        self.catalogue = JobCatalogue(None)
+        self.alerts = []
+
+    def engine(self, *rules, **kwargs):
+        return AlertEngine(rules, [CallbackSink(self.alerts.append)], **kwargs)
+
+    def upsert(self, record):
+        self.catalogue.jobs.upsert(record.handle, record)
+
+    def sent(self):
+        return [(alert.rule, alert.key, alert.status, alert.message) for alert in self.alerts]
+
+class TestRule(AlertTestCase):
+
+    def test_fire_once_and_resolve(self):
+        engine = self.engine(Rule('failing', 'job', {failed_servers: ('>=', 1)}))
+        failing = samples.job_record(1000, servers = [samples.job_server('srv0', rt_failed = True)])
+        self.upsert(failing)
+        engine.update_jobs(self.catalogue, changes(added = [1000]), now = 0.0)
+        engine.update_jobs(self.catalogue, changes(updated = [1000]), now = 60.0)
+        self.assertEqual(engine.firing(), [('failing', 1000)])
+        self.upsert(samples.job_record(1000, servers = [samples.job_server('srv0')]))
+        engine.update_jobs(self.catalogue, changes(updated = [1000]), now = 120.0)
+        self.assertEqual(self.sent(), [('failing', 1000, ALERT_FIRING, 'failing: job 1000'),
+                                       ('failing', 1000, ALERT_RESOLVED, 'failing: job 1000 cleared')])
+        self.assertEqual(engine.firing(), [])
+
+    def test_for_seconds(self):
+        engine = self.engine(Rule('suspended', 'job', {'state': BDC.JOBSTATE_SUSPENDED}, for_seconds = 300.0))
+        self.upsert(samples.job_record(1000, state = BDC.JOBSTATE_SUSPENDED))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        engine.tick(now = 299.0)
+        self.assertEqual(self.alerts, [])
+        engine.tick(now = 300.0)
+        self.assertEqual([(alert.status, alert.since, alert.time) for alert in self.alerts], [(ALERT_FIRING, 0.0, 300.0)])
+
+    def test_cleared_before_for_seconds(self):
+        engine = self.engine(Rule('suspended', 'job', {'state': BDC.JOBSTATE_SUSPENDED}, for_seconds = 300.0))
+        self.upsert(samples.job_record(1000, state = BDC.JOBSTATE_SUSPENDED))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        self.catalogue.jobs.remove(1000)
+        engine.update_jobs(self.catalogue, changes(removed = [1000]), now = 100.0)
+        engine.tick(now = 400.0)
+        # Neither fired nor resolved
+        self.assertEqual(self.alerts, [])
+
+    def test_removed_job_resolves(self):
+        engine = self.engine(Rule('any', 'job'))
+        self.upsert(samples.job_record(1000))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        self.catalogue.jobs.remove(1000)
+        engine.update_jobs(self.catalogue, changes(removed = [1000]), now = 60.0)
+        self.assertEqual(self.sent()[-1], ('any', 1000, ALERT_RESOLVED, 'any: job 1000 removed'))
+
+    def test_repeat_interval(self):
+        engine = self.engine(Rule('any', 'job'), repeat_interval = 100.0)
+        self.upsert(samples.job_record(1000))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        engine.tick(now = 250.0)
+        # The next repetition is due 100 seconds after the previous one was sent
+        engine.tick(now = 300.0)
+        engine.tick(now = 350.0)
+        self.assertEqual([alert.time for alert in self.alerts], [0.0, 250.0, 350.0])
+
+    def test_failing_sink(self):
+        def broken(alert):
+            raise OSError('unreachable')
+
+        engine = AlertEngine([Rule('any', 'job')], [CallbackSink(broken), CallbackSink(self.alerts.append)])
+        self.upsert(samples.job_record(1000))
+        with self.assertLogs(level = 'WARNING'):
+            engine.update_jobs(self.catalogue, None, now = 0.0)
+        self.assertEqual(len(self.alerts), 1)
+
+class TestStallRule(AlertTestCase):
+
+    def test_stall_and_progress(self):
+        engine = self.engine(StallRule('stalled', seconds = 600.0))
+        record = samples.job_record(1000, tasks_completed = 10)
+        self.upsert(record)
+        engine.update_jobs(self.catalogue, changes(added = [1000]), now = 0.0)
+        engine.tick(now = 300.0)
+        self.assertEqual(self.alerts, [])
+        # A stalled job does not show up as changed, the timer fires
+        engine.tick(now = 600.0)
+        self.assertEqual(self.sent(), [('stalled', 1000, ALERT_FIRING, 'stalled: job 1000 made no progress')])
+
+        self.upsert(progressed(record, 11))
+        engine.update_jobs(self.catalogue, changes(updated = [1000]), now = 700.0)
+        self.assertEqual(self.sent()[-1], ('stalled', 1000, ALERT_RESOLVED, 'stalled: job 1000 is progressing again'))
+        # The clock starts again from the progress
+        engine.tick(now = 1299.0)
+        self.assertEqual(len(self.alerts), 2)
+        engine.tick(now = 1300.0)
+        self.assertEqual(self.alerts[-1].status, ALERT_FIRING)
+        self.assertEqual(self.alerts[-1].since, 700.0)
+
+    def test_custom_resolved_message(self):
+        engine = self.engine(StallRule('stalled', seconds = 0.0, resolved_message = '{rule}: {record.job.info.name} moves'))
+        record = samples.job_record(1000, name = 'shot_010')
+        self.upsert(record)
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        self.upsert(progressed(record, 1))
+        engine.update_jobs(self.catalogue, changes(updated = [1000]), now = 60.0)
+        self.assertEqual(self.alerts[1].message, 'stalled: shot_010 moves')
+
+class TestFarmRule(AlertTestCase):
+
+    def test_counter_follows_the_changes(self):
+        engine = self.engine(FarmRule('suspended', 'job', {'state': BDC.JOBSTATE_SUSPENDED}, above = 1))
+        for handle in (1000, 1001, 1002):
+            self.upsert(samples.job_record(handle))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+
+        for handle in (1000, 1001):
+            self.upsert(samples.job_record(handle, state = BDC.JOBSTATE_SUSPENDED))
+        engine.update_jobs(self.catalogue, changes(updated = [1000, 1001]), now = 60.0)
+        self.assertEqual(self.sent(), [('suspended', None, ALERT_FIRING, 'suspended: 2 of 3 jobs')])
+
+        self.catalogue.jobs.remove(1001)
+        engine.update_jobs(self.catalogue, changes(removed = [1001]), now = 120.0)
+        self.assertEqual(self.sent()[-1], ('suspended', None, ALERT_RESOLVED, 'suspended: cleared, 1 of 2 jobs'))
+        self.assertEqual(engine._matching['suspended'], {1000})
+
+    def test_ratio(self):
+        engine = self.engine(FarmRule('busy', 'job', {'state': BDC.JOBSTATE_ACTIVE}, ratio_above = 0.5))
+        self.upsert(samples.job_record(1000))
+        self.upsert(samples.job_record(1001, state = BDC.JOBSTATE_SUSPENDED))
+        engine.update_jobs(self.catalogue, None, now = 0.0)
+        self.assertEqual(self.alerts, [])
+        self.upsert(samples.job_record(1002))
+        engine.update_jobs(self.catalogue, changes(added = [1002]), now = 60.0)
+        self.assertEqual(engine.firing(), [('busy', None)])
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            FarmRule('no threshold', 'job')
+        with self.assertRaises(ValueError):
+            Rule('unknown', 'client')
+        with self.assertRaises(ValueError):
+            AlertEngine([Rule('same', 'job'), Rule('same', 'server')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import datetime
+import os
+import random
+import sys
+import unittest
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+import BackburnerDataClasses as BDC
+from CapacityPlanner import (HOURS_PER_WEEK, CapacityPlanner, hour_of_week, popcount, reference_task_seconds,
+                             schedule_from_mask, week_mask)
+
+# Sunday 7 January 2024, 00:00
+SUNDAY = datetime.datetime(2024, 1, 7)
+
+# Off during office hours, 07:00 till 18:00, see ServerSchedule
+NIGHTS = 0b111111100000000000111111
+
+def scheduled(server, schedule):
+    return replace(server, server_schedule = schedule)
+
+def random_farm(count, seed = 1):
+    generator = random.Random(seed)
+    servers = {}
+    for index in range(count):
+        server = samples.server(f'node{index}', num_cpus = generator.choice([8, 16, 24, 64]),
+                                total_memory = generator.choice([16384, 32768, 131072]), perf_index = generator.choice([0.5, 1.0, 1.37, 2.0]))
+        servers[f'srv{index}'] = scheduled(server, BDC.ServerSchedule(*[generator.choice([0, NIGHTS, 0xFFFFFF]) for _ in range(7)]))
+    return servers
+
+def available(server, hour):
+    return week_mask(server.server_schedule) >> hour & 1
+
+class TestSchedules(unittest.TestCase):
+
+    def test_week_mask(self):
+        schedule = BDC.ServerSchedule(1 << 23, 0, 0, 0, 0, 0, NIGHTS)
+        mask = week_mask(schedule)
+        # Sunday 00:00 is the most significant bit of Sunday and bit 0 of the week
+        self.assertEqual(mask & 0xFFFFFF, 1)
+        self.assertEqual([hour - 144 for hour in range(144, HOURS_PER_WEEK) if mask >> hour & 1], list(range(7)) + list(range(18, 24)))
+        self.assertEqual(schedule_from_mask(mask), schedule)
+
+    def test_hour_of_week(self):
+        self.assertEqual(hour_of_week(SUNDAY), 0)
+        self.assertEqual(hour_of_week(SUNDAY + datetime.timedelta(days = 1, hours = 10, minutes = 59)), 34)
+        self.assertEqual(hour_of_week(SUNDAY - datetime.timedelta(minutes = 1)), HOURS_PER_WEEK - 1)
+
+    def test_popcount(self):
+        self.assertEqual([popcount(value) for value in (0, 1, 0b1011, (1 << 200) - 1)], [0, 1, 3, 200])
+
+class TestCapacity(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = random_farm(40)
+        self.planner = CapacityPlanner(self.servers)
+
+    def test_matches_a_loop_over_the_servers(self):
+        cores, memory, capacity = self.planner.cores(), self.planner.memory(), self.planner.capacity()
+        counts = self.planner.server_counts()
+        for hour in range(HOURS_PER_WEEK):
+            up = [server for server in self.servers.values() if available(server, hour)]
+            self.assertEqual(counts[hour], len(up))
+            self.assertEqual(cores[hour], sum(server.hw_info.num_cpus for server in up))
+            self.assertEqual(memory[hour], sum(server.hw_info.total_memory for server in up))
+            self.assertAlmostEqual(capacity[hour], sum(round(server.perf_index * 100) for server in up) / 100)
+
+    def test_selected_servers(self):
+        selected = self.planner.mask(['srv1', 'srv2', 'unknown'], predicate = lambda server: server.hw_info.num_cpus >= 16)
+        expected = [handle for handle in ('srv1', 'srv2') if self.servers[handle].hw_info.num_cpus >= 16]
+        self.assertEqual(self.planner.servers(selected), expected)
+        cores = self.planner.cores(selected)
+        for hour in range(HOURS_PER_WEEK):
+            self.assertEqual(cores[hour], sum(self.servers[handle].hw_info.num_cpus for handle in expected if available(self.servers[handle], hour)))
+
+        job = samples.job(1000, servers = [samples.job_server('srv3')])
+        self.assertEqual(self.planner.servers(self.planner.job_mask(job)), ['srv3'])
+        self.assertEqual(self.planner.job_mask(samples.job(1001)), self.planner.all)
+
+    def test_what_if(self):
+        changes = {'srv0': BDC.ServerSchedule(*[NIGHTS] * 7), 'srv5': 0}
+        changed = self.planner.with_schedules(changes)
+        servers = dict(self.servers)
+        servers['srv0'] = scheduled(servers['srv0'], changes['srv0'])
+        servers['srv5'] = scheduled(servers['srv5'], schedule_from_mask(0))
+        rebuilt = CapacityPlanner(servers)
+        self.assertEqual(changed.availability, rebuilt.availability)
+        self.assertEqual(changed.cores(), rebuilt.cores())
+        # The original planner is unchanged
+        self.assertEqual(self.planner.cores(), CapacityPlanner(self.servers).cores())
+
+class TestFinishTime(unittest.TestCase):
+
+    def test_hours_to_finish(self):
+        planner = CapacityPlanner({'srv0': samples.server('a'), 'srv1': samples.server('b')})
+        self.assertEqual(planner.hours_to_finish(10, 3600.0, start = SUNDAY), 5.0)
+        self.assertEqual(planner.hours_to_finish(10, 3600.0, start = SUNDAY, share = 0.5), 10.0)
+        self.assertEqual(planner.hours_to_finish(1, 3600.0, start = SUNDAY + datetime.timedelta(minutes = 30)), 0.5)
+        self.assertEqual(planner.hours_to_finish(0, 3600.0, start = SUNDAY), 0.0)
+        self.assertEqual(planner.finish_time(10, 3600.0, start = SUNDAY), SUNDAY + datetime.timedelta(hours = 5))
+
+    def test_whole_weeks_match_hour_by_hour(self):
+        planner = CapacityPlanner(random_farm(12, seed = 2))
+        start = SUNDAY + datetime.timedelta(days = 2, hours = 9, minutes = 15)
+        tasks_per_hour = [capacity * 3600.0 / 600.0 for capacity in planner.capacity()]
+        remaining, hours, hour = 50000.0, 0.0, hour_of_week(start)
+        fraction = 0.75
+        while tasks_per_hour[hour] * fraction < remaining:
+            remaining -= tasks_per_hour[hour] * fraction
+            hours += fraction
+            fraction = 1.0
+            hour = (hour + 1) % HOURS_PER_WEEK
+        hours += remaining / tasks_per_hour[hour]
+        self.assertAlmostEqual(planner.hours_to_finish(50000, 600.0, start = start), hours)
+
+    def test_cannot_finish(self):
+        planner = CapacityPlanner({'srv0': scheduled(samples.server('a'), schedule_from_mask(0))})
+        self.assertIsNone(planner.hours_to_finish(10, 60.0, start = SUNDAY))
+        planner = CapacityPlanner({'srv0': samples.server('a')})
+        self.assertIsNone(planner.finish_time(10 ** 9, 3600.0, start = SUNDAY, max_weeks = 1))
+
+    def test_job_finish_time(self):
+        servers = {'srv0': samples.server('a', perf_index = 2.0), 'srv1': samples.server('b', perf_index = 1.0)}
+        job = samples.job(1000, number_tasks = 13, tasks_completed = 1,
+                          servers = [samples.job_server('srv0', task_time = 900.0, task_total = 3), samples.job_server('srv1', task_time = 1800.0, task_total = 1)])
+        # Scaled to a perf_index of 1.0 every task took 1800 s
+        self.assertEqual(reference_task_seconds(job, servers), 1800.0)
+        planner = CapacityPlanner(servers)
+        # 12 tasks at 3.0 capacity, 6 tasks per hour
+        self.assertEqual(planner.job_finish_time(job, start = SUNDAY), SUNDAY + datetime.timedelta(hours = 2))
+        self.assertIsNone(planner.job_finish_time(samples.job(1001), start = SUNDAY))
+
+if __name__ == '__main__':
+    unittest.main()
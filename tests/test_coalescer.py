@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+import BackburnerDataClasses as BDC
+from Coalescer import CoalescingMonitor
+from Monitor import Monitor
+
+class CoalescerTestCase(unittest.TestCase):
+    """Serves a :obj:`fakemanager.Farm` and wraps a connected :obj:`Monitor` in a :obj:`CoalescingMonitor`"""
+
+    freshness = 0.0
+
+    def setUp(self):
+        self.farm = fakemanager.Farm()
+        port, stop = fakemanager.serve(self.farm)
+        self.addCleanup(stop)
+        monitor = Monitor('127.0.0.1', port, logging.WARNING, 5.0)
+        monitor.open_connection()
+        self.addCleanup(monitor.close_connection)
+        self.monitor = CoalescingMonitor(monitor, freshness = self.freshness)
+
+class TestInFlight(CoalescerTestCase):
+
+    def test_concurrent_calls_share_one_request(self):
+        self.farm.delays['get jobinfo'] = 0.2
+        results = []
+        threads = [threading.Thread(target = lambda: results.append(self.monitor.get_job('1000'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.farm.count('get jobinfo'), 1)
+        self.assertEqual((self.monitor.requests, self.monitor.coalesced), (1, 4))
+        self.assertTrue(all(result is results[0] for result in results))
+        # Without a freshness window a later call sends its own request
+        self.monitor.get_job('1000')
+        self.assertEqual(self.farm.count('get jobinfo'), 2)
+
+    def test_different_arguments_are_not_shared(self):
+        self.assertNotEqual(self.monitor.get_job('1000'), self.monitor.get_job('1001'))
+        self.assertEqual(self.farm.count('get jobinfo'), 2)
+
+    def test_error_reaches_every_caller(self):
+        self.monitor.monitor.timeout = 0.2
+        self.farm.delays['get jobinfo'] = 0.5
+        errors = []
+
+        def call():
+            try:
+                self.monitor.get_job('1000')
+            except TimeoutError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target = call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.farm.count('get jobinfo'), 1)
+        self.assertEqual(self.monitor._in_flight, {})
+
+    def test_async(self):
+        self.farm.delays['get srvlist'] = 0.1
+
+        async def main():
+            return await asyncio.gather(*[self.monitor.call_async('get_server_list') for _ in range(3)])
+
+        results = asyncio.run(main())
+        self.assertEqual(len(results[0]), 2)
+        self.assertEqual(self.farm.count('get srvlist'), 1)
+
+class TestFreshness(CoalescerTestCase):
+
+    freshness = 0.2
+
+    def test_result_is_reused_within_the_window(self):
+        self.monitor.get_server_list()
+        self.monitor.get_server_list()
+        self.assertEqual(self.monitor.reused, 1)
+        time.sleep(0.25)
+        self.monitor.get_server_list()
+        self.assertEqual(self.farm.count('get srvlist'), 2)
+
+    def test_expired_results_are_dropped(self):
+        for handle in self.farm.jobs:
+            self.monitor.get_job(str(handle))
+        self.assertEqual(len(self.monitor._fresh), len(self.farm.jobs))
+        time.sleep(0.25)
+        # Storing a new result purges the expired ones, even for keys that are never looked up again
+        self.monitor.get_server_list()
+        self.assertEqual(list(self.monitor._fresh), [('get_server_list', ())])
+
+    def test_writes_clear_the_window(self):
+        self.monitor.get_jobstate('1000')
+        self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED})
+        self.assertEqual(self.monitor._fresh, {})
+        self.assertEqual(self.monitor.get_jobstate('1000')[1], str(BDC.JOBSTATE_SUSPENDED))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import copy
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+from samples import job, job_server, server
+
+import BackburnerDataClasses as BDC
+from Diff import Change, apply, diff, diff_snapshots, fingerprint, same
+
+def sample_job():
+    return job(1001, tasks_completed = 10, servers = [job_server(f'node{k}', task_total = k) for k in range(4)])
+
+class TestSame(unittest.TestCase):
+
+    def test_distinct_values_with_equal_hashes(self):
+        # hash(-1) == hash(-2), the digests tell them apart
+        self.assertFalse(same(server('node', current_job = -1), server('node', current_job = -2)))
+        self.assertEqual(diff(server('node', current_job = -1), server('node', current_job = -2)),
+                         [Change(('current_job',), -1, -2)])
+
+    def test_nan_fields(self):
+        self.assertTrue(same(server('node', perf_index = float('nan')), server('node', perf_index = float('nan'))))
+
+    def test_mutation_after_comparison(self):
+        old, new = sample_job(), sample_job()
+        self.assertTrue(same(old, new))
+        digest = fingerprint(new)
+        new.info.tasks_completed = 11
+        self.assertFalse(same(old, new))
+        self.assertNotEqual(fingerprint(new), digest)
+        self.assertEqual(diff(old, new), [Change(('info', 'tasks_completed'), 10, 11)])
+
+    def test_list_modified_in_place(self):
+        old, new = sample_job(), sample_job()
+        fingerprint(new)
+        new.servers[2].task_total = 99
+        new.servers.append(job_server('node9'))
+        self.assertEqual(diff(old, new), [Change(('servers', 'node2', 'task_total'), 2, 99),
+                                          Change(('servers', 'node9'), None, job_server('node9'))])
+
+    def test_edited_copy(self):
+        old = sample_job()
+        fingerprint(old)
+        new = copy.copy(old)
+        new.info = copy.copy(old.info)
+        new.info.priority = 10
+        self.assertFalse(same(old, new))
+        self.assertEqual(diff(old, new), [Change(('info', 'priority'), 50, 10)])
+        self.assertEqual(old.info.priority, 50)
+
+class TestApply(unittest.TestCase):
+
+    def test_round_trip(self):
+        old, new = sample_job(), sample_job()
+        new.info.tasks_completed = 20
+        new.flags.active = False
+        del new.servers[0]
+        new.servers[1].rt_failed = True
+        new.servers.append(job_server('node7'))
+        changes = diff(old, new)
+        self.assertEqual(changes.paths(), {'info', 'flags', 'servers'})
+        result = apply(old, changes)
+        self.assertEqual(result, new)
+        self.assertTrue(same(result, new))
+        self.assertEqual(diff(result, new), [])
+
+    def test_apply_shares_unchanged_parts(self):
+        old, new = sample_job(), sample_job()
+        new.info.priority = 1
+        result = apply(old, diff(old, new))
+        self.assertIs(result.flags, old.flags)
+        self.assertIsNot(result.info, old.info)
+        self.assertEqual(old.info.priority, 50)
+
+    def test_reordered_list_is_replaced(self):
+        old, new = sample_job(), sample_job()
+        new.servers.reverse()
+        self.assertEqual(apply(old, diff(old, new)).servers, new.servers)
+
+    def test_pickle_round_trip(self):
+        old = sample_job()
+        restored = pickle.loads(pickle.dumps(old))
+        self.assertTrue(same(old, restored))
+        self.assertEqual(fingerprint(restored), fingerprint(old))
+        restored.plugin.plugin_version = 2
+        self.assertEqual(diff(old, restored), [Change(('plugin', 'plugin_version'), 1, 2)])
+
+class TestDiffSnapshots(unittest.TestCase):
+
+    def test_added_removed_changed(self):
+        old = {1: sample_job(), 2: sample_job()}
+        new = {1: sample_job(), 3: sample_job()}
+        new[1].alerts.enabled = True
+        result = diff_snapshots(old, new)
+        self.assertEqual(result[1], [Change(('alerts', 'enabled'), False, True)])
+        self.assertEqual(result[2], [Change((), old[2], None)])
+        self.assertEqual(result[3], [Change((), None, new[3])])
+
+    def test_plugins_keyed_by_name(self):
+        old = server('node', plugins = ['max', 'maya'])
+        new = server('node', plugins = ['max', 'maya', 'nuke'])
+        self.assertEqual(diff(old, new), [Change(('plugins', 'nuke'), None, BDC.Plugin(1, 'nuke', ''))])
+
+if __name__ == '__main__':
+    unittest.main()
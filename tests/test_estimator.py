@@ -0,0 +1,114 @@
+import math
+import os
+import statistics
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+from Estimator import Ewma, JobEstimator, Welford
+from Indexes import TableChanges
+from JobCatalogue import JobCatalogue
+
+class TestStatistics(unittest.TestCase):
+
+    def test_welford(self):
+        values = [3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0]
+        welford = Welford()
+        self.assertEqual(welford.variance, 0.0)
+        for value in values:
+            welford.add(value)
+        self.assertEqual(welford.count, len(values))
+        self.assertAlmostEqual(welford.mean, statistics.mean(values))
+        self.assertAlmostEqual(welford.stddev, statistics.stdev(values))
+
+    def test_ewma_weights_by_elapsed_time(self):
+        ewma = Ewma(60.0)
+        self.assertEqual(ewma.update(10.0, 0.0), 10.0)
+        self.assertEqual(ewma.update(20.0, 0.0), 10.0)
+        self.assertAlmostEqual(ewma.update(20.0, 60.0), 20.0 - 10.0 / math.e)
+        # One update covering a long time forgets as much as many short ones
+        short, long = Ewma(60.0), Ewma(60.0)
+        short.update(0.0, 0.0)
+        long.update(0.0, 0.0)
+        for _ in range(10):
+            short.update(1.0, 6.0)
+        long.update(1.0, 60.0)
+        self.assertAlmostEqual(short.value, long.value)
+
+class TestJobEstimator(unittest.TestCase):
+
+    def job(self, tasks_completed, servers = 2, task_time = 60.0, task_total = 1, active = True, number_tasks = 100):
+        return samples.job(1000, tasks_completed = tasks_completed, number_tasks = number_tasks, active = active,
+                           servers = [samples.job_server(f'srv{index}', task_time = task_time, task_total = task_total) for index in range(servers)])
+
+    def test_server_based_estimate_before_progress(self):
+        estimate = JobEstimator().update(1000, self.job(0), now = 0.0)
+        # Two servers at 60 s per frame
+        self.assertAlmostEqual(estimate.frames_per_hour, 120.0)
+        self.assertAlmostEqual(estimate.eta_seconds, 100 * 30.0)
+        self.assertEqual(estimate.active_servers, 2)
+        self.assertLess(estimate.confidence, 0.5)
+
+    def test_observed_rate(self):
+        estimator = JobEstimator(min_samples = 3)
+        for poll in range(6):
+            estimate = estimator.update(1000, self.job(poll * 10), now = poll * 60.0)
+        # 10 frames per minute, steadily
+        self.assertAlmostEqual(estimate.frames_per_hour, 600.0)
+        self.assertEqual(estimate.remaining_tasks, 50)
+        self.assertAlmostEqual(estimate.eta_seconds, 300.0)
+        self.assertAlmostEqual(estimate.eta, 600.0)
+        self.assertGreater(estimate.confidence, 0.5)
+
+    def test_erratic_progress_lowers_the_confidence(self):
+        steady, erratic = JobEstimator(), JobEstimator()
+        completed = 0
+        for poll, step in enumerate([10, 10, 10, 10, 10, 10]):
+            completed += step
+            steady_estimate = steady.update(1000, self.job(completed), now = (poll + 1) * 60.0)
+        completed = 0
+        for poll, step in enumerate([1, 25, 2, 20, 0, 12]):
+            completed += step
+            erratic_estimate = erratic.update(1000, self.job(completed), now = (poll + 1) * 60.0)
+        self.assertLess(erratic_estimate.confidence, steady_estimate.confidence)
+
+    def test_restarted_job(self):
+        estimator = JobEstimator()
+        for poll in range(4):
+            estimator.update(1000, self.job(50 + poll * 10), now = poll * 60.0)
+        estimate = estimator.update(1000, self.job(0), now = 300.0)
+        # The history of the previous run no longer applies
+        self.assertAlmostEqual(estimate.frames_per_hour, 120.0)
+
+    def test_inactive_and_complete_jobs(self):
+        estimator = JobEstimator()
+        estimate = estimator.update(1000, self.job(10, active = False), now = 0.0)
+        self.assertIsNone(estimate.eta_seconds)
+        self.assertAlmostEqual(estimate.frames_per_hour, 120.0)
+        estimate = estimator.update(1001, self.job(10, servers = 0), now = 0.0)
+        self.assertEqual((estimate.frames_per_hour, estimate.eta_seconds, estimate.confidence), (0.0, None, 0.0))
+        estimate = estimator.update(1002, self.job(100), now = 0.0)
+        self.assertEqual((estimate.remaining_tasks, estimate.eta_seconds, estimate.confidence), (0, 0.0, 1.0))
+
+    def test_update_from_catalogue(self):
+        catalogue = JobCatalogue(None)
+        for handle in (1000, 1001):
+            catalogue.jobs.upsert(handle, samples.job_record(handle, servers = [samples.job_server('srv0')]))
+        estimator = JobEstimator()
+        changes = TableChanges()
+        changes.added.extend([1000, 1001])
+        self.assertEqual(set(estimator.update_from_catalogue(catalogue, changes, now = 0.0)), {1000, 1001})
+
+        catalogue.jobs.remove(1001)
+        changes = TableChanges()
+        changes.removed.append(1001)
+        self.assertEqual(estimator.update_from_catalogue(catalogue, changes, now = 60.0), {})
+        self.assertEqual(len(estimator), 1)
+        self.assertIsNone(estimator.estimate(1001))
+        self.assertEqual(set(estimator.estimates()), {1000})
+
+if __name__ == '__main__':
+    unittest.main()
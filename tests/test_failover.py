@@ -0,0 +1,101 @@
+import logging
+import os
+import socket
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+import BackburnerDataClasses as BDC
+from Failover import RedundantMonitor
+from Monitor import Monitor
+
+def closed_port():
+    """Returns a local port nothing listens on"""
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        return listener.getsockname()[1]
+
+class FailoverTestCase(unittest.TestCase):
+    """Serves two :obj:`fakemanager.Farm` objects, a primary and a standby"""
+
+    def setUp(self):
+        self.farms = [fakemanager.Farm(), fakemanager.Farm()]
+        self.ports = []
+        for farm in self.farms:
+            port, stop = fakemanager.serve(farm)
+            self.addCleanup(stop)
+            self.ports.append(port)
+
+    def redundant(self, primary_port, secondary_port, **kwargs):
+        monitor = RedundantMonitor(Monitor('127.0.0.1', primary_port, logging.WARNING, 5.0),
+                                   Monitor('127.0.0.1', secondary_port, logging.WARNING, 5.0), **kwargs)
+        self.addCleanup(monitor.close_connection)
+        return monitor
+
+class TestOpenConnection(FailoverTestCase):
+
+    def test_refused_connection_closes_the_socket(self):
+        monitor = Monitor('127.0.0.1', closed_port(), logging.WARNING, 5.0)
+        with self.assertRaises(ConnectionRefusedError):
+            monitor.open_connection()
+        self.assertEqual(monitor.session.fileno(), -1)
+
+    def test_fails_over_when_the_primary_is_down(self):
+        monitor = self.redundant(closed_port(), self.ports[1])
+        secondary = monitor._endpoints[1].monitor
+        monitor.open_connection()
+        self.assertIs(monitor.primary, secondary)
+        self.assertEqual(len(monitor.get_server_list()), 2)
+
+class TestRequests(FailoverTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.monitor = self.redundant(*self.ports, timeout = 0.5, hedge = False)
+        self.monitor.open_connection()
+        self.primary, self.secondary = self.monitor.primary, self.monitor._endpoints[1].monitor
+
+    def test_read_is_retried_on_the_standby(self):
+        # The session with the primary breaks
+        self.primary.session.close()
+        self.assertEqual(len(self.monitor.get_server_list()), 2)
+        self.assertEqual(self.farms[1].count('get srvlist'), 1)
+        self.assertIs(self.monitor.primary, self.secondary)
+
+    def test_write_is_not_sent_again(self):
+        self.farms[0].delays['set jobstate'] = 1.0
+        with self.assertRaises(TimeoutError):
+            self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED}, skip_unchanged = False)
+        self.assertEqual(self.farms[1].count('del controller'), 0)
+        self.assertEqual(self.farms[1].count('set jobstate'), 0)
+        # Later requests go to the standby
+        self.assertIs(self.monitor.primary, self.secondary)
+        self.assertEqual(self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED}), {1000: (200, 'OK')})
+        self.assertEqual(self.farms[1].jobs[1000]['state'], BDC.JOBSTATE_SUSPENDED)
+
+    def test_concurrent_failures_swap_once(self):
+        endpoint = self.monitor._endpoints[0]
+        self.monitor._fail_over(endpoint)
+        self.monitor._fail_over(endpoint)
+        self.assertIs(self.monitor.primary, self.secondary)
+
+class TestHedging(FailoverTestCase):
+
+    def test_slow_primary_is_hedged(self):
+        monitor = self.redundant(*self.ports, timeout = 2.0, hedge_delay = 0.05)
+        monitor.open_connection()
+        primary = monitor.primary
+        self.farms[0].delays['get srvlist'] = 0.5
+        start = time.monotonic()
+        self.assertEqual(len(monitor.get_server_list()), 2)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(self.farms[1].count('get srvlist'), 1)
+        # A slow answer is not a failure
+        self.assertIs(monitor.primary, primary)
+
+if __name__ == '__main__':
+    unittest.main()
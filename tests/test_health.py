@@ -0,0 +1,109 @@
+import os
+import sys
+import unittest
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+import BackburnerDataClasses as BDC
+from Health import HealthEngine
+from Inventory import ServerInventory
+
+def with_packets(server, dropped, boot_time = 'boot'):
+    return replace(server, network_status = BDC.NetworkStatus(dropped, 0, 0, 0, boot_time))
+
+def with_space(server, workdisk_space):
+    return replace(server, hw_info = replace(server.hw_info, workdisk_space = workdisk_space))
+
+class TestSignals(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = HealthEngine(window = 4, min_anomalies = 2)
+        self.server = samples.server('node')
+
+    def test_healthy_node(self):
+        health = self.engine.update_server('srv0', self.server, now = 0.0)
+        self.assertGreater(health.score, 0.99)
+        self.assertEqual(health.anomalies, [])
+        self.assertIsNone(health.signals['workdisk_hours'])
+
+    def test_packet_errors(self):
+        self.engine.update_server('srv0', with_packets(self.server, 0), now = 0.0)
+        health = self.engine.update_server('srv0', with_packets(self.server, 200), now = 3600.0)
+        self.assertEqual(health.signals['packet_errors'], 200.0)
+        self.assertEqual(health.anomalies, ['packet_errors'])
+        # Counters that restart with the server are not an increase
+        health = self.engine.update_server('srv0', with_packets(self.server, 5, 'reboot'), now = 7200.0)
+        self.assertEqual(health.signals['packet_errors'], 200.0)
+        self.engine.update_server('srv0', with_packets(self.server, 5, 'reboot'), now = 7200.0 + 86400.0)
+        self.assertLess(self.engine.health('srv0').signals['packet_errors'], 1.0)
+
+    def test_rt_failed(self):
+        failed = samples.job(1000, servers = [samples.job_server('srv0', rt_failed = True)])
+        for poll in range(3):
+            self.engine.update_job(failed)
+            health = self.engine.update_server('srv0', self.server, now = poll * 60.0)
+        self.assertEqual(health.signals['rt_failed'], 3)
+        self.assertEqual(health.anomalies, ['rt_failed'])
+        # A poll without a failure resets the count
+        self.engine.update_job(samples.job(1000, servers = [samples.job_server('srv0')]))
+        self.assertEqual(self.engine.update_server('srv0', self.server, now = 180.0).signals['rt_failed'], 0)
+
+    def test_slowdown_is_scaled_by_perf_index(self):
+        servers = {f'srv{index}': samples.server(f'node{index}', perf_index = 0.5 if index == 3 else 1.0) for index in range(5)}
+        self.engine.update(servers, now = 0.0)
+        task_times = {'srv0': 60.0, 'srv1': 60.0, 'srv2': 60.0, 'srv3': 120.0, 'srv4': 120.0}
+        job = samples.job(1000, servers = [samples.job_server(handle, task_time = task_time) for handle, task_time in task_times.items()])
+        result = self.engine.update(servers, [job], now = 60.0)
+        # srv3 is as slow as its perf_index predicts, srv4 is not
+        self.assertEqual(result['srv3'].anomalies, [])
+        self.assertEqual(result['srv4'].anomalies, ['slowdown'])
+        self.assertEqual(result['srv4'].signals['slowdown'], 2.0)
+
+    def test_workdisk(self):
+        self.assertIsNone(self.engine.update_server('srv0', with_space(self.server, -1), now = 0.0).signals['workdisk_hours'])
+        self.engine.update_server('srv0', with_space(self.server, 10000), now = 0.0)
+        health = self.engine.update_server('srv0', with_space(self.server, 8000), now = 3600.0)
+        self.assertEqual(health.signals['workdisk_hours'], 4.0)
+        self.assertEqual(health.anomalies, ['workdisk_hours'])
+        self.assertEqual(self.engine.update_server('srv1', with_space(self.server, 100), now = 0.0).anomalies, ['workdisk_hours'])
+
+    def test_perf_drift(self):
+        self.engine.update_server('srv0', self.server, now = 0.0)
+        health = self.engine.update_server('srv0', replace(self.server, perf_index = 0.5), now = 60.0)
+        self.assertAlmostEqual(health.signals['perf_drift'], 0.5, places = 3)
+        self.assertEqual(health.anomalies, ['perf_drift'])
+
+class TestWindow(unittest.TestCase):
+
+    def test_recurring_anomalies_make_a_node_unhealthy(self):
+        engine = HealthEngine(window = 4, min_anomalies = 2)
+        low = samples.server('node', workdisk_space = 100)
+        healthy = samples.server('node')
+        self.assertFalse(engine.update_server('srv0', low, now = 0.0).unhealthy)
+        health = engine.update_server('srv0', low, now = 60.0)
+        self.assertTrue(health.unhealthy)
+        self.assertEqual(health.anomaly_polls, 2)
+        self.assertEqual(engine.unhealthy(), [health])
+        # Anomalies leave the window again
+        for poll in range(2, 5):
+            health = engine.update_server('srv0', healthy, now = poll * 60.0)
+        self.assertEqual(health.anomaly_polls, 1)
+        self.assertFalse(health.unhealthy)
+        self.assertEqual(engine.unhealthy(), [])
+
+    def test_inventory(self):
+        engine = HealthEngine()
+        inventory = ServerInventory(None)
+        for handle in ('srv0', 'srv1'):
+            inventory.servers.upsert(handle, samples.server_record(handle))
+        self.assertEqual(set(engine.update_from_inventory(inventory, now = 0.0)), {'srv0', 'srv1'})
+        inventory.servers.remove('srv1')
+        engine.update_from_inventory(inventory, now = 60.0)
+        self.assertEqual(len(engine), 1)
+        self.assertIsNone(engine.health('srv1'))
+
+if __name__ == '__main__':
+    unittest.main()
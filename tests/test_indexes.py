@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+from Indexes import Table
+
+class TestRangeOrderWithoutValue(unittest.TestCase):
+    """Ordered queries keep rows without an indexed value last, whether they walk the index or sort the candidates"""
+
+    def setUp(self):
+        self.table = Table(hash_indexes = {'group': lambda row: row['group']},
+                           range_indexes = {'priority': lambda row: row['priority']})
+        priorities = {1: 50, 2: None, 3: 10, 4: None, 5: 30, 6: 10, 7: 70}
+        for pk, priority in priorities.items():
+            self.table.upsert(pk, {'pk': pk, 'group': 'a', 'priority': priority})
+        # Moving a row into and out of the missing rows must keep the index consistent
+        self.table.upsert(7, {'pk': 7, 'group': 'a', 'priority': None})
+        self.table.upsert(4, {'pk': 4, 'group': 'a', 'priority': 20})
+
+    def query(self, **kwargs):
+        return [row['pk'] for row in self.table.query(order_by = 'priority', **kwargs)]
+
+    def test_index_walk(self):
+        self.assertEqual(self.query(limit = 10), [3, 6, 4, 5, 1, 2, 7])
+        self.assertEqual(self.query(reverse = True, limit = 10), [1, 5, 4, 6, 3, 2, 7])
+        self.assertEqual(self.query(reverse = True, limit = 6), [1, 5, 4, 6, 3, 2])
+
+    def test_sort(self):
+        # Without a limit the candidates are sorted
+        self.assertEqual(self.query(), [3, 6, 4, 5, 1, 2, 7])
+        self.assertEqual(self.query(reverse = True), [1, 5, 4, 6, 3, 2, 7])
+
+        # A small candidate set is sorted as well, even with a limit
+        for pk in range(100, 140):
+            self.table.upsert(pk, {'pk': pk, 'group': 'b', 'priority': pk})
+        self.assertEqual(self.query(where = {'group': 'a'}, limit = 10), [3, 6, 4, 5, 1, 2, 7])
+        self.assertEqual(self.query(where = {'group': 'a'}, reverse = True, limit = 6), [1, 5, 4, 6, 3, 2])
+
+class TestHashLookup(unittest.TestCase):
+
+    def test_lookup_cannot_change_the_index(self):
+        table = Table(hash_indexes = {'group': lambda row: row['group']})
+        table.upsert(1, {'group': 'a'})
+        found = table.hash_indexes['group'].lookup('a')
+        self.assertEqual(found, {1})
+        with self.assertRaises(AttributeError):
+            found.add(2)
+        table.upsert(2, {'group': 'a'})
+        self.assertEqual(found, {1})
+        self.assertEqual(table.hash_indexes['group'].lookup('b'), frozenset())
+        self.assertEqual([row['group'] for row in table.query(where = {'group': ['a', 'b']})], ['a', 'a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import logging
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+from Inventory import ServerInventory
+from Monitor import Monitor
+
+class TestRefreshServers(unittest.TestCase):
+
+    def setUp(self):
+        self.farm = fakemanager.Farm(servers = 3)
+        port, stop = fakemanager.serve(self.farm)
+        self.addCleanup(stop)
+        self.monitor = Monitor('127.0.0.1', port, logging.WARNING, 5.0)
+        self.monitor.open_connection()
+        self.addCleanup(self.monitor.close_connection)
+
+    def test_details_only_for_changed_servers(self):
+        inventory = ServerInventory(self.monitor)
+        self.assertEqual(sorted(inventory.refresh_servers().added), ['srv0', 'srv1', 'srv2'])
+        self.farm.servers['srv1']['state'] = 2
+        self.farm.servers['srv2']['disk'] = 1000
+        changes = inventory.refresh_servers()
+        self.assertEqual(changes.updated, ['srv1'])
+        self.assertEqual(self.farm.count('get jobinfo'), 4)
+        # The disk space is not part of the server list
+        self.assertEqual(inventory.get_server('srv2').server.hw_info.workdisk_space, 500000)
+
+    def test_details_are_refetched_after_max_age(self):
+        inventory = ServerInventory(self.monitor, max_age = 0.1)
+        inventory.refresh_servers()
+        self.farm.servers['srv2']['disk'] = 1000
+        self.assertFalse(inventory.refresh_servers())
+        time.sleep(0.15)
+        self.assertEqual(inventory.refresh_servers().updated, ['srv2'])
+        self.assertEqual(inventory.get_server('srv2').server.hw_info.workdisk_space, 1000)
+        self.assertEqual(self.farm.count('get jobinfo'), 6)
+
+    def test_full_refresh(self):
+        inventory = ServerInventory(self.monitor, max_age = None)
+        inventory.refresh_servers()
+        self.farm.servers['srv0']['perf'] = 0.5
+        self.assertFalse(inventory.refresh_servers())
+        self.assertEqual(inventory.refresh_servers(full = True).updated, ['srv0'])
+        self.assertEqual(inventory.query_servers(order_by = 'perf_index', limit = 1)[0].handle, 'srv0')
+
+    def test_removed_servers(self):
+        inventory = ServerInventory(self.monitor)
+        inventory.refresh_servers()
+        del self.farm.servers['srv1']
+        self.assertEqual(inventory.refresh_servers().removed, ['srv1'])
+        self.assertIsNone(inventory.get_server('srv1'))
+        self.assertEqual(set(inventory._fetched), {'srv0', 'srv2'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+import BackburnerDataClasses as BDC
+from Monitor import ControllerError, Monitor, decode_job_list, parse_payload
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+def payload(name):
+    """Returns a sample reply as the Manager sends it, terminated by a NUL byte"""
+    with open(os.path.join(DATA, name), 'rb') as stream:
+        return stream.read().strip() + b'\0'
+
+class TestDecodeJobList(unittest.TestCase):
+
+    def test_decode(self):
+        jobs = decode_job_list(parse_payload(payload('joblist.xml')))
+        self.assertEqual(jobs, [
+            BDC.JobListItem(1256275308, 2, 'shot_010_beauty', '3dsmax', 1),
+            BDC.JobListItem(1256275412, 1, 'shot_020 lighting pass', 'Command Line', 2),
+            BDC.JobListItem(1256275577, 0, 'café exterior', '3dsmax', 1),
+        ])
+
+class ManagerTestCase(unittest.TestCase):
+    """Serves a :obj:`fakemanager.Farm` and connects a :obj:`Monitor` to it"""
+
+    def setUp(self):
+        self.farm = fakemanager.Farm(jobs = 6)
+        port, stop = fakemanager.serve(self.farm)
+        self.addCleanup(stop)
+        self.monitor = Monitor('127.0.0.1', port, logging.WARNING, 5.0)
+        self.monitor.open_connection()
+        self.addCleanup(self.monitor.close_connection)
+
+class TestSetJobstates(ManagerTestCase):
+
+    def test_pipelined_in_batches(self):
+        results = self.monitor.set_jobstates({handle: BDC.JOBSTATE_SUSPENDED for handle in self.farm.jobs}, batch_size = 4)
+        # Jobs already suspended are skipped, the rest is sent within one controller session
+        self.assertEqual(set(results), set(self.farm.jobs))
+        self.assertTrue(all(result == (200, 'OK') for result in results.values()))
+        self.assertTrue(all(job['state'] == BDC.JOBSTATE_SUSPENDED for job in self.farm.jobs.values()))
+        self.assertEqual(self.farm.commands[-1], 'del controller No')
+        self.assertEqual(self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED}), {})
+
+    def test_controller_refused(self):
+        self.farm.controller = False
+        with self.assertRaises(ControllerError):
+            self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED})
+        self.assertEqual(self.farm.count('set jobstate'), 0)
+
+    def test_deadline_keeps_the_original_error(self):
+        self.farm.delays['set jobstate'] = 0.5
+        with self.assertRaises(TimeoutError):
+            with self.monitor.deadline(0.2):
+                self.monitor.set_jobstates({1000: BDC.JOBSTATE_SUSPENDED, 1001: BDC.JOBSTATE_SUSPENDED})
+        # The session was abandoned, so no release was attempted on it
+        self.assertEqual(self.monitor.session.fileno(), -1)
+        self.assertEqual(self.farm.count('del controller No'), 0)
+        self.monitor.open_connection()
+
+    def test_suspend_all(self):
+        results = self.monitor.suspend_all(user = 'user0', batch_size = 2)
+        self.assertEqual(set(results), {handle for handle, job in self.farm.jobs.items() if job['user'] == 'user0'})
+        self.assertEqual(self.farm.jobs[1001]['state'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
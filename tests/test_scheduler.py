@@ -0,0 +1,123 @@
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+from Monitor import Monitor
+from Scheduler import INTERACTIVE, NORMAL, CommandScheduler
+
+class SchedulerTestCase(unittest.TestCase):
+    """Serves a :obj:`fakemanager.Farm` and routes the requests of a :obj:`Monitor` through a :obj:`CommandScheduler`"""
+
+    max_concurrent = 1
+
+    def setUp(self):
+        self.farm = fakemanager.Farm()
+        port, stop = fakemanager.serve(self.farm)
+        self.addCleanup(stop)
+        self.monitor = Monitor('127.0.0.1', port, logging.WARNING, 5.0)
+        self.monitor.open_connection()
+        self.addCleanup(self.monitor.close_connection)
+        self.scheduler = CommandScheduler(self.monitor, max_concurrent = self.max_concurrent, reserved_interactive = 0)
+        self.scheduler.start()
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        if self.scheduler._running:
+            self.scheduler.stop()
+
+    def in_background(self, function):
+        """Run `function` in a thread, returns a list receiving its result or exception"""
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(function())
+            except Exception as error:
+                outcome.append(error)
+
+        thread = threading.Thread(target = run, daemon = True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return outcome
+
+class TestPriority(SchedulerTestCase):
+
+    def test_interactive_jumps_ahead(self):
+        self.farm.delays['get jobinfo'] = 0.3
+        busy = self.scheduler.submit(b'get jobinfo 1000\r\n')
+        time.sleep(0.1)
+        normal = [self.scheduler.submit(b'get srvlist\r\n', NORMAL) for _ in range(3)]
+        interactive = self.scheduler.submit(b'get jobhlist\r\n', INTERACTIVE)
+        for future in [busy, *normal, interactive]:
+            future.result(5)
+        self.assertEqual(self.farm.commands, ['get jobinfo 1000', 'get jobhlist'] + ['get srvlist'] * 3)
+
+    def test_requests_go_through_the_queue(self):
+        with self.scheduler.priority(INTERACTIVE):
+            servers = self.monitor.get_server_list()
+        self.assertEqual([server.name for server in servers], ['node0', 'node1'])
+        self.assertEqual(self.scheduler.queued(), {INTERACTIVE: 0, NORMAL: 0, 2: 0})
+
+class TestLease(SchedulerTestCase):
+
+    def test_stream_is_not_interleaved(self):
+        tasks = self.monitor.iter_task_list('1000')
+        first = next(tasks)
+        outcome = self.in_background(self.monitor.get_server_list)
+        time.sleep(0.1)
+        # The other request waits until the stream ends
+        self.assertEqual(outcome, [])
+        self.assertEqual(len([first, *tasks]), 100)
+        time.sleep(0.1)
+        self.assertEqual(len(outcome[0]), 2)
+
+    def test_stop_releases_abandoned_stream(self):
+        tasks = self.monitor.iter_task_list('1000')
+        next(tasks)
+        stopping = threading.Thread(target = self.scheduler.stop, daemon = True)
+        stopping.start()
+        stopping.join(5)
+        self.assertFalse(stopping.is_alive())
+        tasks.close()
+
+class TestDeadline(SchedulerTestCase):
+
+    max_concurrent = 2
+
+    def test_deadline_of_another_thread(self):
+        def hold_deadline():
+            with self.monitor.deadline(0.1):
+                time.sleep(1.0)
+
+        self.in_background(hold_deadline)
+        self.farm.delays['get srvlist'] = 0.4
+        time.sleep(0.05)
+        # Neither worker applies the deadline held by the other thread
+        self.assertEqual(len(self.monitor.get_server_list()), 2)
+        self.assertEqual(len(self.scheduler.submit(b'get srvlist\r\n').result(5)[2]), 2)
+
+    def test_expired_while_queued(self):
+        self.scheduler.stop()
+        self.scheduler = CommandScheduler(self.monitor, max_concurrent = 1)
+        self.scheduler.start()
+        self.farm.delays['get jobinfo'] = 0.5
+        busy = self.scheduler.submit(b'get jobinfo 1000\r\n')
+        time.sleep(0.1)
+        with self.assertRaises(TimeoutError):
+            with self.monitor.deadline(0.1):
+                self.monitor.get_server_list()
+        busy.result(5)
+        # The command was never sent, so the session is still usable
+        self.assertEqual(self.farm.count('get srvlist'), 0)
+        self.assertNotEqual(self.monitor.session.fileno(), -1)
+        self.assertEqual(len(self.monitor.get_server_list()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import dataclasses
+import io
+import json
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+import BackburnerDataClasses as BDC
+import Serialisers
+
+def sample_job():
+    return samples.job(1000, name = 'shot "010" café\n', servers = [samples.job_server('srv0'), samples.job_server('srv1', rt_failed = True)])
+
+def sample_server():
+    return samples.server('node01', perf_index = 1.25, plugins = ['3dsmax', 'Command Line'])
+
+class TestJson(unittest.TestCase):
+
+    def test_same_as_asdict(self):
+        for value in (sample_job(), sample_server()):
+            self.assertEqual(json.loads(Serialisers.dumps(value)), dataclasses.asdict(value))
+            self.assertEqual(Serialisers.to_dict(value), dataclasses.asdict(value))
+
+    def test_round_trip(self):
+        for value in (sample_job(), sample_server()):
+            self.assertEqual(Serialisers.loads(type(value), Serialisers.dumps(value)), value)
+            self.assertEqual(Serialisers.from_dict(type(value), Serialisers.to_dict(value)), value)
+        jobs = [sample_job(), samples.job(1001)]
+        self.assertEqual(Serialisers.loads(BDC.Job, Serialisers.dumps(jobs)), jobs)
+
+    def test_output_is_ascii(self):
+        text = Serialisers.dumps(sample_job())
+        self.assertTrue(text.isascii())
+        self.assertIn(r'"shot \"010\" caf\u00e9\n"', text)
+
+    def test_special_floats(self):
+        server = dataclasses.replace(sample_server(), perf_index = float('nan'))
+        decoded = Serialisers.loads(BDC.Server, Serialisers.dumps(server))
+        self.assertTrue(math.isnan(decoded.perf_index))
+        server = dataclasses.replace(sample_server(), perf_index = float('inf'))
+        self.assertEqual(Serialisers.loads(BDC.Server, Serialisers.dumps(server)).perf_index, float('inf'))
+
+    def test_value_not_matching_the_annotation(self):
+        server = dataclasses.replace(sample_server(), name = None, perf_index = 2)
+        self.assertEqual(json.loads(Serialisers.dumps(server)), dataclasses.asdict(server))
+
+    def test_json_lines(self):
+        jobs = [sample_job(), samples.job(1001)]
+        stream = io.StringIO()
+        Serialisers.write_json_lines(jobs, stream)
+        self.assertEqual(stream.getvalue().count('\n'), 2)
+        stream = io.StringIO(stream.getvalue() + '\n')
+        self.assertEqual(list(Serialisers.read_json_lines(BDC.Job, stream)), jobs)
+
+class TestMessagePack(unittest.TestCase):
+
+    def test_round_trip(self):
+        for value in (sample_job(), sample_server()):
+            self.assertEqual(Serialisers.unpackb(type(value), Serialisers.packb(value)), value)
+        jobs = [sample_job(), samples.job(1001)]
+        self.assertEqual(Serialisers.unpackb(BDC.Job, Serialisers.packb(jobs), many = True), jobs)
+
+    def test_objects_are_arrays(self):
+        data = Serialisers.packb(BDC.JobPlugin('3dsmax', 1))
+        self.assertEqual(data, b'\x92\xa63dsmax\x01')
+
+    def test_extra_data(self):
+        with self.assertRaises(ValueError):
+            Serialisers.unpackb(BDC.JobPlugin, Serialisers.packb(BDC.JobPlugin('3dsmax', 1)) + b'\x00')
+
+    def test_value_boundaries(self):
+        values = [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -128, -129,
+                  -32768, -32769, -2 ** 31, -2 ** 31 - 1, -2 ** 63, 1.5, None, True, False, 'x' * 31, 'x' * 32, 'é' * 200,
+                  'x' * 65536, b'\x00' * 300, list(range(15)), list(range(16)), list(range(70000)), {'a': 1, 'b': [None]}]
+        for value in values:
+            out = bytearray()
+            Serialisers._pack_value(value, out)
+            decoded, offset = Serialisers._unpack(memoryview(bytes(out)), 0)
+            self.assertEqual(offset, len(out))
+            self.assertEqual(decoded, value)
+
+    @unittest.skipIf(Serialisers._msgpack is None, 'msgpack is not installed')
+    def test_same_bytes_as_msgpack(self):
+        for value in (sample_job(), sample_server()):
+            out = bytearray()
+            Serialisers._codec(type(value)).pack(value, out)
+            self.assertEqual(bytes(out), Serialisers.packb(value))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+from samples import job_record, server_record
+
+import SharedSnapshot
+from SharedSnapshot import HEADER, SnapshotPublisher, SnapshotReader, SnapshotStale
+
+SIZE = 1 << 16
+
+def dead_pid():
+    """Returns the pid of a process that already exited"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+@unittest.skipIf(SharedSnapshot.shared_memory is None, 'Shared memory snapshots require Python 3.8 or newer')
+class TestSharedSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f'bbtest_{uuid.uuid4().hex[:12]}'
+        self.publisher = SnapshotPublisher(None, name = self.name, size = SIZE)
+        self.jobs = [job_record(handle, name = f'job é{handle}', priority = handle % 7) for handle in (30, 10, 20)]
+        self.servers = [server_record('b1', workdisk_space = -1), server_record('a0')]
+
+    def tearDown(self):
+        if self.publisher is not None:
+            self.publisher.close()
+
+    def die(self):
+        """Leave the segment behind as if the publisher had been killed"""
+        header = list(HEADER.unpack_from(self.publisher._buffer, 0))
+        header[5] = dead_pid()
+        HEADER.pack_into(self.publisher._buffer, 0, *header)
+        self.publisher._buffer.release()
+        self.publisher._memory.close()
+        self.publisher = None
+
+    def test_round_trip(self):
+        reader = SnapshotReader(self.name)
+        self.assertIsNone(reader.published())
+        self.assertEqual(reader.jobs(), [])
+        self.publisher.publish(self.jobs, self.servers)
+        self.assertEqual([job.handle for job in reader.jobs()], [10, 20, 30])
+        self.assertEqual(reader.job(20).name, 'job é20')
+        self.assertEqual(reader.job(20).priority, 6)
+        self.assertIsNone(reader.job(25))
+        self.assertEqual([server.handle for server in reader.servers()], ['a0', 'b1'])
+        self.assertEqual(reader.server('b1').workdisk_space, -1)
+        self.assertEqual(reader.published()[0], 1)
+        reader.close()
+
+    def test_second_publisher_is_refused(self):
+        with self.assertRaises(FileExistsError):
+            SnapshotPublisher(None, name = self.name, size = SIZE)
+
+    def test_take_over_dead_publisher(self):
+        self.publisher.publish(self.jobs, self.servers)
+        reader = SnapshotReader(self.name)
+        self.die()
+        with self.assertRaises(SnapshotStale):
+            reader.jobs()
+
+        # The segment is large enough, so it is taken over in place and the reader keeps its mapping
+        replacement = SnapshotPublisher(None, name = self.name, size = SIZE)
+        self.assertEqual(replacement.generation, 1)
+        replacement.publish(self.jobs[:1], [])
+        self.assertEqual([job.handle for job in reader.jobs()], [30])
+        self.assertEqual(reader.generation, 1)
+        self.publisher = replacement
+        reader.close()
+
+    def test_replace_small_segment_of_dead_publisher(self):
+        self.publisher.publish(self.jobs, self.servers)
+        reader = SnapshotReader(self.name)
+        self.die()
+
+        # Too small, so it is retired and replaced, the reader attaches to the new segment
+        replacement = SnapshotPublisher(None, name = self.name, size = 2 * SIZE)
+        self.assertEqual(replacement.size, 2 * SIZE)
+        replacement.publish(self.jobs[1:], [])
+        self.assertEqual([job.handle for job in reader.jobs()], [10, 20])
+        self.assertEqual(reader.size, 2 * SIZE)
+        self.publisher = replacement
+        reader.close()
+
+    def test_closed_publisher(self):
+        self.publisher.publish(self.jobs, self.servers)
+        reader = SnapshotReader(self.name)
+        self.publisher.close()
+        self.publisher = None
+        with self.assertRaises(SnapshotStale):
+            reader.jobs()
+        reader.close()
+
+    def test_max_age(self):
+        self.publisher.publish(self.jobs, self.servers)
+        reader = SnapshotReader(self.name, max_age = 0)
+        with self.assertRaises(SnapshotStale):
+            reader.jobs()
+        # The publication time stays readable, so callers can tell how old it is
+        self.assertEqual(reader.published()[0], 1)
+        reader.max_age = 60
+        self.assertEqual(len(reader.jobs()), 3)
+        reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
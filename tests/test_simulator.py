@@ -0,0 +1,144 @@
+import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import samples
+
+import BackburnerDataClasses as BDC
+from CapacityPlanner import HOURS_PER_WEEK
+from Inventory import ServerInventory
+from JobCatalogue import JobCatalogue
+from Simulator import FairSharePolicy, ShortestJobFirstPolicy, SimJob, SimServer, Simulator
+
+# Sunday 7 January 2024, 00:00, hour 0 of the week
+SUNDAY = datetime.datetime(2024, 1, 7)
+
+ALWAYS = (1 << HOURS_PER_WEEK) - 1
+
+def farm(count, perf_index = 1.0, mask = ALWAYS):
+    return [SimServer(f'srv{index}', perf_index, mask) for index in range(count)]
+
+def hours(result):
+    return {handle: result.hours_to_finish(handle) for handle in result.finished}
+
+class TestPriorities(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = Simulator([SimJob(1, 10, 6, 600.0), SimJob(2, 50, 6, 600.0)], farm(1))
+
+    def test_lowest_priority_value_first(self):
+        result = self.simulator.run(start = SUNDAY)
+        self.assertEqual(hours(result), {1: 1.0, 2: 2.0})
+        self.assertEqual(result.finished[2], SUNDAY + datetime.timedelta(hours = 2))
+        self.assertEqual(result.remaining, {})
+        self.assertAlmostEqual(result.busy_hours, 2.0)
+
+    def test_what_if_leaves_the_seeded_jobs_unchanged(self):
+        rush = self.simulator.run(start = SUNDAY, priorities = {2: 0})
+        self.assertEqual(hours(rush), {1: 2.0, 2: 1.0})
+        self.assertEqual([job.priority for job in self.simulator.jobs], [10, 50])
+        self.assertEqual(hours(self.simulator.run(start = SUNDAY)), {1: 1.0, 2: 2.0})
+
+    def test_suspended(self):
+        result = self.simulator.run(start = SUNDAY, suspended = {1: True})
+        self.assertEqual(hours(result), {2: 1.0})
+        self.assertEqual(result.remaining, {1: 6})
+
+    def test_horizon(self):
+        result = self.simulator.run(hours = 1.5, start = SUNDAY)
+        self.assertEqual(hours(result), {1: 1.0})
+        self.assertEqual(result.remaining, {2: 6})
+        self.assertIsNone(result.hours_to_finish(2))
+
+class TestServers(unittest.TestCase):
+
+    def test_perf_index(self):
+        result = Simulator([SimJob(1, 50, 12, 600.0)], farm(1, perf_index = 2.0)).run(start = SUNDAY)
+        self.assertEqual(hours(result), {1: 1.0})
+
+    def test_schedule(self):
+        # Off during the first two hours of the week
+        simulator = Simulator([SimJob(1, 50, 6, 600.0)], farm(1, mask = ALWAYS & ~0b11))
+        self.assertEqual(hours(simulator.run(start = SUNDAY)), {1: 3.0})
+        self.assertEqual(hours(simulator.run(start = SUNDAY, schedules = {'srv0': ALWAYS})), {1: 1.0})
+        result = simulator.run(start = SUNDAY, schedules = {'srv0': BDC.ServerSchedule(*[0] * 7)})
+        self.assertEqual((result.finished, result.remaining, result.busy_hours), ({}, {1: 6}, 0.0))
+
+    def test_started_task_is_finished_after_the_schedule_ends(self):
+        simulator = Simulator([SimJob(1, 50, 2, 5400.0)], farm(1, mask = 0b1))
+        result = simulator.run(start = SUNDAY)
+        self.assertEqual(result.remaining, {1: 1})
+        self.assertEqual(hours(simulator.run(hours = 2 * HOURS_PER_WEEK, start = SUNDAY)), {1: HOURS_PER_WEEK + 1.5})
+
+    def test_job_restrictions(self):
+        servers = [SimServer('srv0', 1.0, ALWAYS, frozenset({'3dsmax'})), SimServer('srv1', 1.0, ALWAYS)]
+        jobs = [SimJob(1, 50, 12, 600.0, servers = frozenset({'srv1'})), SimJob(2, 50, 6, 600.0, plugin = 'vray'),
+                SimJob(3, 50, 6, 600.0, plugin = 'vray', servers = frozenset({'srv0'}))]
+        result = Simulator(jobs, servers).run(start = SUNDAY)
+        # Job 1 only renders on srv1 and job 2 waits for it there, srv0 lacks the plug-in of both others
+        self.assertEqual(hours(result), {1: 2.0, 2: 3.0})
+        self.assertEqual(result.remaining, {3: 6})
+
+class TestConcurrency(unittest.TestCase):
+
+    def test_nonconcurrent_and_max_servers(self):
+        self.assertEqual(hours(Simulator([SimJob(1, 50, 12, 600.0)], farm(2)).run(start = SUNDAY)), {1: 1.0})
+        self.assertEqual(hours(Simulator([SimJob(1, 50, 12, 600.0, nonconcurrent = True)], farm(2)).run(start = SUNDAY)), {1: 2.0})
+        simulator = Simulator([SimJob(1, 50, 12, 600.0)], farm(3))
+        self.assertEqual(hours(simulator.run(start = SUNDAY, max_servers = {1: 1})), {1: 2.0})
+
+    def test_dependencies(self):
+        jobs = [SimJob(1, 50, 6, 600.0), SimJob(2, 0, 6, 600.0, depends_on = frozenset({1}))]
+        self.assertEqual(hours(Simulator(jobs, farm(2)).run(start = SUNDAY)), {1: 1.0, 2: 2.0})
+        # Dependencies on jobs that are not simulated are met
+        jobs = [SimJob(2, 0, 6, 600.0, depends_on = frozenset({1}))]
+        self.assertEqual(hours(Simulator(jobs, farm(1)).run(start = SUNDAY)), {2: 1.0})
+
+class TestPolicies(unittest.TestCase):
+
+    def test_fair_share(self):
+        simulator = Simulator([SimJob(1, 50, 24, 600.0), SimJob(2, 50, 24, 600.0)], farm(2))
+        self.assertEqual(hours(simulator.run(start = SUNDAY)), {1: 2.0, 2: 4.0})
+        self.assertEqual(hours(simulator.run(start = SUNDAY, policy = FairSharePolicy())), {1: 4.0, 2: 4.0})
+
+    def test_shortest_job_first(self):
+        simulator = Simulator([SimJob(1, 50, 12, 600.0), SimJob(2, 50, 6, 600.0)], farm(1))
+        self.assertEqual(hours(simulator.run(start = SUNDAY)), {1: 2.0, 2: 3.0})
+        self.assertEqual(hours(simulator.run(start = SUNDAY, policy = ShortestJobFirstPolicy())), {1: 3.0, 2: 1.0})
+        # Priorities still come first
+        result = simulator.run(start = SUNDAY, policy = ShortestJobFirstPolicy(), priorities = {1: 0})
+        self.assertEqual(hours(result), {1: 2.0, 2: 3.0})
+
+class TestFromCatalogue(unittest.TestCase):
+
+    def test_seeded_from_live_state(self):
+        catalogue = JobCatalogue(None)
+        records = [samples.job_record(1000, number_tasks = 13, tasks_completed = 1, priority = 10,
+                                      servers = [samples.job_server('srv0', task_time = 900.0, task_total = 3)]),
+                   samples.job_record(1001, number_tasks = 6, state = BDC.JOBSTATE_SUSPENDED),
+                   samples.job_record(1002, number_tasks = 10, tasks_completed = 10),
+                   samples.job_record(1003, state = BDC.JOBSTATE_COMPLETED)]
+        for record in records:
+            catalogue.jobs.upsert(record.handle, record)
+        inventory = ServerInventory(None)
+        inventory.servers.upsert('srv0', samples.server_record('srv0', perf_index = 2.0, plugins = ['3dsmax']))
+        inventory.servers.upsert('srv1', samples.server_record('srv1', perf_index = 0.0))
+
+        simulator = Simulator.from_catalogue(catalogue, inventory, default_task_seconds = 300.0, dependencies = {1001: [1000]})
+        jobs = {job.handle: job for job in simulator.jobs}
+        self.assertEqual(set(jobs), {1000, 1001})
+        self.assertEqual((jobs[1000].remaining_tasks, jobs[1000].task_seconds, jobs[1000].servers), (12, 1800.0, frozenset({'srv0'})))
+        self.assertEqual((jobs[1001].task_seconds, jobs[1001].suspended, jobs[1001].depends_on), (300.0, True, frozenset({1000})))
+        servers = {server.handle: server for server in simulator.servers}
+        self.assertEqual((servers['srv0'].perf_index, servers['srv0'].week_mask, servers['srv0'].plugins), (2.0, ALWAYS, frozenset({'3dsmax'})))
+        self.assertEqual((servers['srv1'].perf_index, servers['srv1'].plugins), (1.0, None))
+
+        # 12 tasks of 900 s on srv0, then job 1001 once resumed, on both servers
+        result = simulator.run(start = SUNDAY, suspended = {1001: False})
+        self.assertEqual(hours(result), {1000: 3.0, 1001: 3.25})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'BackburnerPy'))
+
+import fakemanager
+
+import BackburnerDataClasses as BDC
+from Inventory import ServerInventory
+from JobCatalogue import JobCatalogue
+from Monitor import Monitor
+from WarmStart import FarmState, WarmStart, load_state, save_state
+
+class WarmStartTestCase(unittest.TestCase):
+    """Serves a :obj:`fakemanager.Farm` and keeps a state file in a temporary directory"""
+
+    def setUp(self):
+        self.farm = fakemanager.Farm()
+        port, stop = fakemanager.serve(self.farm)
+        self.addCleanup(stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'farm.state')
+        self.monitor = self.connect(port)
+
+    def connect(self, port):
+        monitor = Monitor('127.0.0.1', port, logging.WARNING, 5.0)
+        monitor.open_connection()
+        self.addCleanup(monitor.close_connection)
+        return monitor
+
+    def warm_start(self, monitor = None):
+        monitor = monitor or self.monitor
+        return WarmStart(JobCatalogue(monitor), ServerInventory(monitor), self.path)
+
+class TestStateFile(WarmStartTestCase):
+
+    def test_round_trip(self):
+        first = self.warm_start()
+        first.refresh()
+        first.save(self.monitor.get_manager_info())
+
+        second = self.warm_start()
+        self.assertTrue(second.load())
+        self.assertTrue(second.stale)
+        self.assertEqual(second.catalogue.jobs.rows, first.catalogue.jobs.rows)
+        self.assertEqual(second.inventory.servers.rows, first.inventory.servers.rows)
+        self.assertEqual(second.manager_info, first.manager_info)
+
+    def test_other_manager_is_ignored(self):
+        save_state(self.path, FarmState(time.time(), '10.0.0.1:3234'))
+        self.assertFalse(self.warm_start().load())
+
+    def test_damaged_file_is_ignored(self):
+        self.warm_start().save()
+        with open(self.path, 'r+b') as file:
+            file.seek(10)
+            file.write(b'damaged')
+        self.assertIsNone(load_state(self.path))
+        self.assertIsNone(load_state(self.path + '.missing'))
+
+class TestRevalidate(WarmStartTestCase):
+
+    def test_only_changed_jobs_are_fetched(self):
+        first = self.warm_start()
+        first.refresh()
+        first.save()
+        self.farm.jobs[1001]['state'] = BDC.JOBSTATE_SUSPENDED
+        fetched = self.farm.count('get jobinfo')
+
+        second = self.warm_start()
+        second.load()
+        job_changes, server_changes = second.revalidate()
+        self.assertFalse(second.stale)
+        self.assertEqual(job_changes.updated, [1001])
+        self.assertFalse(server_changes)
+        self.assertEqual(self.farm.count('get jobinfo'), fetched + 1)
+        self.assertEqual(second.catalogue.get_job(1001).state, BDC.JOBSTATE_SUSPENDED)
+
+class TestSave(WarmStartTestCase):
+
+    def test_save_waits_for_a_refresh(self):
+        warm_start = self.warm_start()
+        warm_start.refresh()
+        for job in self.farm.jobs.values():
+            job['state'] = BDC.JOBSTATE_SUSPENDED
+        self.farm.delays['get jobinfo'] = 0.1
+
+        refreshing = threading.Thread(target = warm_start.refresh, daemon = True)
+        refreshing.start()
+        time.sleep(0.05)
+        warm_start.save()
+        refreshing.join(5)
+        # The snapshot is taken after the refresh, never from a half updated catalogue
+        self.assertEqual({record.state for record in load_state(self.path).jobs}, {BDC.JOBSTATE_SUSPENDED})
+
+    def test_periodic_save(self):
+        warm_start = self.warm_start()
+        warm_start.interval = 0.05
+        warm_start.refresh()
+        warm_start.start()
+        time.sleep(0.3)
+        warm_start.stop()
+        self.assertEqual(len(load_state(self.path).jobs), len(self.farm.jobs))
+        self.assertIsNotNone(warm_start.saved_at)
+
+if __name__ == '__main__':
+    unittest.main()